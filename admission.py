@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Admission control and load shedding for the search endpoints.
+
+Every search passes admit() before any work starts:
+
+1. Per-client token buckets (RATE_LIMIT_PER_MINUTE, bursts of RATE_LIMIT_BURST)
+   answer 429 with Retry-After when a client sends too much.
+2. When ADMISSION_MAX_IN_FLIGHT searches are already admitted or the LLM queue
+   holds ADMISSION_REJECT_QUEUE waiting calls, the request is refused at once
+   with 503 and Retry-After instead of joining a queue it would time out in.
+   Admitted searches hold their in-flight slot from admit() until running()
+   ends, or until release() for a search that will not run after all.
+3. When the LLM queue holds ADMISSION_DEGRADE_QUEUE calls or the p90 of the
+   pipeline runs finished in the last ADMISSION_LATENCY_WINDOW seconds exceeds
+   ADMISSION_DEGRADE_LATENCY, the request is served in degraded mode: search
+   results in their original language and no summary, so no generation is
+   queued. The latency signal only covers recent runs, so the service returns to
+   full mode on its own once the backlog has drained.
+"""
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+from llm_scheduler import async_llm_scheduler, llm_scheduler
+from observability import get_logger, log_event, metrics
+
+load_dotenv()
+
+logger = get_logger("admission")
+
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "True").lower() in ("true", "1", "t")
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "30"))  # sustained searches per client; 0 disables
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "10"))
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))  # buckets kept, least recent dropped
+TRUST_PROXY_HEADERS = os.getenv("TRUST_PROXY_HEADERS", "False").lower() in ("true", "1", "t")
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))  # proxies in front that append to X-Forwarded-For
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "64"))  # running searches per process
+ADMISSION_REJECT_QUEUE = int(os.getenv("ADMISSION_REJECT_QUEUE", "48"))  # waiting LLM calls before 503
+ADMISSION_DEGRADE_QUEUE = int(os.getenv("ADMISSION_DEGRADE_QUEUE", "16"))  # waiting LLM calls before degrading
+ADMISSION_DEGRADE_LATENCY = float(os.getenv("ADMISSION_DEGRADE_LATENCY", "30"))  # p90 pipeline seconds
+ADMISSION_LATENCY_WINDOW = float(os.getenv("ADMISSION_LATENCY_WINDOW", "60"))  # seconds of runs considered
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "5"))  # seconds suggested on 503
+
+MODE_FULL = "full"
+MODE_DEGRADED = "degraded"
+
+
+def client_id(remote_addr, forwarded_for=None) -> str:
+    """
+    The address rate limits are keyed on; X-Forwarded-For is only honoured behind a trusted proxy.
+    Only the entries appended by the TRUSTED_PROXY_HOPS proxies can be trusted (anything to their
+    left was written by the client), so the key is the hop the outermost trusted proxy appended.
+    """
+    if TRUST_PROXY_HEADERS and forwarded_for and TRUSTED_PROXY_HOPS > 0:
+        hops = [hop.strip() for hop in forwarded_for.split(",") if hop.strip()]
+        if len(hops) >= TRUSTED_PROXY_HOPS:
+            return hops[-TRUSTED_PROXY_HOPS]
+    return remote_addr or "unknown"
+
+
+class Decision:
+    """
+    Outcome of admit(): status is None when admitted (in mode), otherwise 429 or 503.
+    """
+
+    def __init__(self, mode=MODE_FULL, status=None, retry_after=None, reason=None):
+        self.mode = mode
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+        self.holds_slot = False  # True while the search counts towards max_in_flight
+
+    @property
+    def admitted(self) -> bool:
+        return self.status is None
+
+    @property
+    def degraded(self) -> bool:
+        return self.mode == MODE_DEGRADED
+
+    def headers(self) -> dict:
+        return {"Retry-After": str(self.retry_after)} if self.retry_after else {}
+
+    def error(self) -> dict:
+        if self.status == 429:
+            return {"error": "Rate limit exceeded, try again later"}
+        return {"error": "Server overloaded, try again later"}
+
+
+class AdmissionController:
+    """
+    Token-bucket rate limits plus overload detection from LLM queue depth and recent pipeline latency.
+    """
+
+    def __init__(self, queue_depth=lambda: 0, rate_per_minute=RATE_LIMIT_PER_MINUTE, burst=RATE_LIMIT_BURST,
+                 max_clients=RATE_LIMIT_MAX_CLIENTS, max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+                 reject_queue=ADMISSION_REJECT_QUEUE, degrade_queue=ADMISSION_DEGRADE_QUEUE,
+                 degrade_latency=ADMISSION_DEGRADE_LATENCY, latency_window=ADMISSION_LATENCY_WINDOW,
+                 enabled=ADMISSION_CONTROL):
+        self.queue_depth = queue_depth
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.max_clients = max_clients
+        self.max_in_flight = max_in_flight
+        self.reject_queue = reject_queue
+        self.degrade_queue = degrade_queue
+        self.degrade_latency = degrade_latency
+        self.latency_window = latency_window
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # client -> (tokens, updated_at), least recently seen first
+        self._latencies = deque()  # (finished_at, seconds) of recent full pipeline runs
+        self._in_flight = 0
+
+    def _take_token(self, client: str, now: float):
+        # Called with the lock held; returns None, or the seconds until the client has a token again
+        tokens, updated_at = self._buckets.pop(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+        wait = None
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[client] = (tokens, now)
+        while len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def _recent_p90(self, now: float):
+        # Called with the lock held
+        while self._latencies and self._latencies[0][0] < now - self.latency_window:
+            self._latencies.popleft()
+        if not self._latencies:
+            return None
+        ordered = sorted(seconds for _, seconds in self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))]
+
+    def admit(self, client: str, shed=True) -> Decision:
+        """
+        Decides whether a search from client runs in full, runs degraded or is refused.
+        shed=False only applies the rate limit (for work that is queued anyway, like search jobs).
+        """
+        decision = self._decide(client, shed)
+        metrics.count_admission(decision.reason or decision.mode)
+        if not decision.admitted or decision.degraded:
+            log_event(
+                logger, logging.WARNING, "search shed",
+                client=client, status=decision.status, mode=decision.mode, reason=decision.reason
+            )
+        return decision
+
+    def _decide(self, client: str, shed: bool) -> Decision:
+        if not self.enabled:
+            return Decision()
+        now = time.monotonic()
+        queue_depth = self.queue_depth()
+        with self._lock:
+            if self.rate > 0:
+                wait = self._take_token(client, now)
+                if wait is not None:
+                    return Decision(status=429, retry_after=max(1, math.ceil(wait)), reason="rate_limited")
+            if not shed:
+                return Decision()
+            p90 = self._recent_p90(now)
+            retry_after = max(ADMISSION_RETRY_AFTER, math.ceil(p90 or 0))
+            if self._in_flight >= self.max_in_flight:
+                return Decision(status=503, retry_after=retry_after, reason="in_flight")
+            if queue_depth >= self.reject_queue:
+                return Decision(status=503, retry_after=retry_after, reason="queue_full")
+            if queue_depth >= self.degrade_queue:
+                decision = Decision(MODE_DEGRADED, reason="queue_depth")
+            elif p90 is not None and p90 >= self.degrade_latency:
+                decision = Decision(MODE_DEGRADED, reason="latency")
+            else:
+                decision = Decision()
+            # Reserved under the same lock as the check, so a burst cannot all pass it before any runs
+            self._in_flight += 1
+            decision.holds_slot = True
+            return decision
+
+    def release(self, decision):
+        """
+        Frees the in-flight slot of an admitted search that will not run; a no-op for None or a freed slot.
+        """
+        if decision is None:
+            return
+        with self._lock:
+            if decision.holds_slot:
+                decision.holds_slot = False
+                self._in_flight -= 1
+
+    def refuse(self, decision: Decision) -> Decision:
+        """
+        Replaces an admitted decision the caller cannot serve (a degraded fan-out) with a 503.
+        """
+        self.release(decision)
+        return Decision(status=503, retry_after=ADMISSION_RETRY_AFTER, reason=decision.reason)
+
+    @contextmanager
+    def running(self, decision: Decision):
+        """
+        Counts the search as in flight, in the slot admit() reserved for it if it has one; the wall
+        time of full searches feeds the latency signal.
+        """
+        start = time.monotonic()
+        with self._lock:
+            if not decision.holds_slot:
+                self._in_flight += 1
+                decision.holds_slot = True
+        try:
+            yield
+        finally:
+            now = time.monotonic()
+            with self._lock:
+                if not decision.degraded:
+                    self._latencies.append((now, now - start))
+            self.release(decision)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            p90 = self._recent_p90(now)
+            return {
+                "enabled": self.enabled,
+                "in_flight": self._in_flight,
+                "llm_queue_depth": self.queue_depth(),
+                "recent_p90_seconds": p90,
+                "recent_runs": len(self._latencies),
+                "clients": len(self._buckets)
+            }
+
+
+# Only one of the schedulers is in use in a process (Flask or ASGI); the other stays empty
+admission_control = AdmissionController(
+    queue_depth=lambda: llm_scheduler.queue_depth + async_llm_scheduler.queue_depth
+)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Asyncio counterpart of http_client for the ASGI entry point.
+
+Each backend gets one shared httpx.AsyncClient with the connect/read timeouts,
+retry counts and retry statuses from http_client.BACKENDS, so a single event loop
+can keep hundreds of upstream calls in flight without a thread per call. Deadlines,
+circuit breakers and hedging apply as they do in http_client.
+"""
+import asyncio
+
+import httpx
+
+import deadline
+import http_client
+from circuit_breaker import circuit_breakers, is_failure_status
+from hedging import hedger
+from http_client import BACKENDS, HTTP_POOL_HOSTS, HTTP_POOL_SIZE, HTTP_RETRY_BACKOFF, timeout_for
+from observability import metrics
+
+_clients = {}
+
+
+class DeadlineExceeded(httpx.TimeoutException):
+    """Raised instead of sending a request once the current request's deadline has passed."""
+
+
+class CircuitOpen(httpx.ConnectError):
+    """Raised instead of sending a request while the upstream's circuit breaker is open."""
+
+
+def get_client(backend: str) -> httpx.AsyncClient:
+    """
+    Returns the shared client for a backend, creating it on first use.
+    """
+    client = _clients.get(backend)
+    if client is None or client.is_closed:
+        settings = BACKENDS[backend]
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings["read_timeout"], connect=settings["connect_timeout"]),
+            # The same total as the per-host pools of the sync sessions
+            limits=httpx.Limits(
+                max_connections=HTTP_POOL_HOSTS * HTTP_POOL_SIZE,
+                max_keepalive_connections=HTTP_POOL_HOSTS * HTTP_POOL_SIZE
+            )
+        )
+        _clients[backend] = client
+    return client
+
+
+def _timeout(backend: str, timeout=None) -> httpx.Timeout:
+    try:
+        connect, read = timeout_for(backend, timeout)
+    except http_client.DeadlineExceeded as e:
+        raise DeadlineExceeded(str(e)) from None
+    return httpx.Timeout(read, connect=connect)
+
+
+async def _send(backend: str, method: str, url: str, timeout=None, **kwargs) -> httpx.Response:
+    settings = BACKENDS[backend]
+    client = get_client(backend)
+    breaker = circuit_breakers.get(backend, url)
+    if breaker is not None and not breaker.allow():
+        circuit_breakers.reject(backend, breaker)
+        raise CircuitOpen(f"Circuit open for {breaker.name}")
+    ok = None
+    try:
+        for attempt in range(settings["retries"] + 1):
+            last_attempt = attempt == settings["retries"]
+            # Checked before every attempt, so retries stop at the deadline too
+            attempt_timeout = _timeout(backend, timeout)
+            try:
+                response = await client.request(method, url, timeout=attempt_timeout, **kwargs)
+            except httpx.TransportError:
+                if last_attempt or deadline.expired():
+                    raise
+            else:
+                if last_attempt or response.status_code not in settings["retry_statuses"]:
+                    ok = not is_failure_status(response.status_code)
+                    return response
+                await response.aclose()
+            await asyncio.sleep(HTTP_RETRY_BACKOFF * 2 ** attempt)
+    except httpx.TransportError:
+        # A timeout cut short by the deadline says nothing about the upstream
+        if deadline.expired():
+            metrics.count_upstream_event(backend, "deadline_exceeded")
+        else:
+            ok = False
+        raise
+    finally:
+        if breaker is not None:
+            breaker.record(ok)
+
+
+async def request(backend: str, method: str, url: str, hedge=None, **kwargs) -> httpx.Response:
+    """
+    Sends a request through the backend's client, retrying connection errors and retry statuses
+    with exponential backoff. hedge works as in http_client.request.
+    """
+    if hedge is None:
+        return await _send(backend, method, url, **kwargs)
+    return await hedger.call_async(
+        hedge, lambda: _send(backend, method, url, **kwargs),
+        ok=lambda response: not is_failure_status(response.status_code)
+    )
+
+
+async def get(backend: str, url: str, **kwargs) -> httpx.Response:
+    return await request(backend, "GET", url, **kwargs)
+
+
+async def post(backend: str, url: str, **kwargs) -> httpx.Response:
+    return await request(backend, "POST", url, **kwargs)
+
+
+async def aclose():
+    """
+    Closes every client; call on application shutdown.
+    """
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Compares the old BeautifulSoup extraction path with the streaming html_extract.TextExtractor.
+
+Usage:
+    python benchmarks/bench_extract.py https://www.nrk.no/ https://www.vg.no/ page.html ...
+
+Each argument is a URL or a local HTML file. Every page is downloaded once and then
+extracted --repeat times with each implementation. Timings and output lengths are
+printed as one JSON object per page.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import requests
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from html_extract import BS_TAGS_TO_REMOVE, MAX_TEXT_LENGTH, extract_text
+
+BS_PARSER = os.getenv("BS_PARSER", "html.parser")
+TEXT_SEPARATOR = os.getenv("TEXT_SEPARATOR", "\n")
+
+
+def extract_text_bs4(html: str) -> str:
+    """
+    The extraction get_webpage_text used before html_extract: full parse, decompose, get_text, slice.
+    """
+    soup = BeautifulSoup(html, BS_PARSER)
+    for tag in soup(BS_TAGS_TO_REMOVE):
+        tag.decompose()
+    return soup.get_text(separator=TEXT_SEPARATOR)[:MAX_TEXT_LENGTH]
+
+
+def load_page(source: str) -> str:
+    if os.path.exists(source):
+        with open(source, encoding="utf-8", errors="replace") as f:
+            return f.read()
+    resp = requests.get(source, timeout=30, headers={"User-Agent": "Mozilla/5.0"})
+    resp.raise_for_status()
+    return resp.text
+
+
+def measure(func, html: str, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        text = func(html)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    timings.sort()
+    return {
+        "median_ms": round(timings[len(timings) // 2] * 1000, 3),
+        "min_ms": round(timings[0] * 1000, 3),
+        "peak_alloc_kb": round(peak / 1024, 1),
+        "text_chars": len(text),
+        "text_words": len(text.split()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pages", nargs="+", help="URLs or local HTML files")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for source in args.pages:
+        html = load_page(source)
+        bs4_stats = measure(extract_text_bs4, html, args.repeat)
+        streaming_stats = measure(extract_text, html, args.repeat)
+        print(json.dumps({
+            "page": source,
+            "html_bytes": len(html.encode("utf-8")),
+            "bs4": bs4_stats,
+            "streaming": streaming_stats,
+            "speedup": round(bs4_stats["median_ms"] / max(streaming_stats["median_ms"], 1e-6), 1),
+        }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Load test for the search endpoints against local stub upstreams.
+
+Starts stub_ollama.py (one or more backends) and stub_search.py in-process, points
+the chosen Flask app at them through environment variables, serves it with a
+threaded WSGI server and drives it with --concurrency closed-loop clients.
+
+Usage:
+    python benchmarks/load_test.py --app new-ui --concurrency 16 --requests 400
+    python benchmarks/load_test.py --app main --duration 60 --llama-latency 0.5 --output run.json
+
+Prints one JSON report: end-to-end p50/p95/p99, requests per second, error counts
+and per-stage percentiles taken from the Server-Timing header, plus the git commit
+so runs can be compared commit to commit. --url skips the stubs and the in-process
+app and drives an already running server instead.
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from argparse import Namespace
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import make_server
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.abspath(os.path.join(BENCH_DIR, ".."))
+sys.path.insert(0, BENCH_DIR)
+import stub_ollama
+import stub_search
+
+APPS = {
+    "main": os.path.join(REPO_ROOT, "main.py"),
+    "new-ui": os.path.join(REPO_ROOT, "new-ui", "app.py"),
+    "vercel": os.path.join(REPO_ROOT, "vercel", "backend", "app.py"),
+}
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, -(-pct * len(sorted_values) // 100))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(values) -> dict:
+    values = sorted(values)
+    report = {f"p{pct}_ms": round(percentile(values, pct) * 1000, 1) if values else None for pct in PERCENTILES}
+    report["mean_ms"] = round(sum(values) / len(values) * 1000, 1) if values else None
+    report["max_ms"] = round(values[-1] * 1000, 1) if values else None
+    report["count"] = len(values)
+    return report
+
+
+def parse_server_timing(header: str) -> dict:
+    """
+    "search;dur=12.5, summarize;dur=830.0" -> {"search": 0.0125, "summarize": 0.83}
+    """
+    timings = {}
+    for metric in (header or "").split(","):
+        name, _, params = metric.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if name and key == "dur":
+                timings[name] = float(value) / 1000
+    return timings
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_stubs(args) -> dict:
+    """
+    Starts the stub upstreams and returns the environment that points an app at them.
+    """
+    llama_urls = []
+    for i in range(args.llama_backends):
+        port = args.llama_port + i
+        stub_ollama.start_in_background(Namespace(
+            port=port, latency=args.llama_latency, token_rate=args.llama_token_rate, tokens=args.llama_tokens,
+            error_rate=args.llama_error_rate, models=[args.model], embedding_dim=256, embed_latency=0.01,
+            verbose=False
+        ))
+        llama_urls.append(f"http://127.0.0.1:{port}/api/generate")
+    stub_search.start_in_background(Namespace(
+        port=args.search_port, latency=args.search_latency, error_rate=args.search_error_rate,
+        results=args.search_results, page_paragraphs=40, image_size=(1600, 900), verbose=False
+    ))
+    return {
+        "LLAMA_API_URLS": ",".join(llama_urls),
+        "LLAMA_MODEL": args.model,
+        "LLAMA_WARMUP_MODELS": args.model,
+        "GOOGLE_SEARCH_API_URL": f"http://127.0.0.1:{args.search_port}/customsearch/v1",
+        "API_KEY": "stub",
+        "SEARCH_ENGINE_ID": "stub",
+        "USE_STATIC_RESULTS": "False",
+        "FLASK_DEBUG": "False",
+        "LOG_LEVEL": args.log_level,
+        # Persistent caches would carry hits over between runs
+        "TRANSLATION_CACHE_DB": "",
+        "PAGE_CACHE_DIR": "",
+        "IMAGE_CACHE_DIR": tempfile.mkdtemp(prefix="load-test-images-"),
+        # The stub serves the result images from loopback
+        "IMAGE_ALLOWED_NETWORKS": "127.0.0.0/8",
+        "IMAGE_ALLOWED_PORTS": str(args.search_port),
+        # Every simulated client shares one address; overload shedding stays on
+        "RATE_LIMIT_PER_MINUTE": "0",
+    }
+
+
+def serve_app(path: str, port: int):
+    """
+    Imports the app module (after the environment is set) and serves it on a background thread.
+    """
+    app_dir = os.path.dirname(path)
+    os.chdir(app_dir)
+    sys.path.insert(0, app_dir)
+    sys.path.insert(0, REPO_ROOT)
+    spec = importlib.util.spec_from_file_location("benchmarked_app", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    # Werkzeug logs every request line otherwise
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", port, module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def wait_ready(base_url: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{base_url}/ready", timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+class LoadRunner:
+    def __init__(self, args, base_url: str):
+        self.args = args
+        self.base_url = base_url
+        self._lock = threading.Lock()
+        self._issued = 0
+        self.latencies = []
+        self.stage_timings = {}
+        self.statuses = {}
+        self.errors = 0
+        self.llm_errors = 0
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _next_query(self):
+        with self._lock:
+            if self.args.requests and self._issued >= self.args.requests:
+                return None
+            if self.args.duration and time.monotonic() >= self._deadline:
+                return None
+            n = self._issued
+            self._issued += 1
+        distinct = self.args.distinct_queries or n + 1
+        return f"{self.args.query} {n % distinct}"
+
+    def _send(self, query: str) -> requests.Response:
+        session = self._session()
+        if self.args.app == "main":
+            return session.post(self.base_url + "/", data={
+                "query": query, "country": self.args.country, "summary_lang": self.args.summary_lang
+            }, timeout=self.args.timeout)
+        return session.post(self.base_url + "/api/search", json={
+            "query": query, "country": self.args.country, "summary_lang": self.args.summary_lang
+        }, timeout=self.args.timeout)
+
+    def _worker(self):
+        while True:
+            query = self._next_query()
+            if query is None:
+                return
+            start = time.perf_counter()
+            try:
+                response = self._send(query)
+                status = response.status_code
+            except requests.RequestException:
+                response, status = None, "exception"
+            elapsed = time.perf_counter() - start
+            llm_error = False
+            if response is not None and status == 200 and self.args.app != "main":
+                try:
+                    llm_error = (response.json().get("summary") or "").startswith("Error")
+                except ValueError:
+                    pass
+            with self._lock:
+                self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+                if status != 200:
+                    self.errors += 1
+                    continue
+                self.latencies.append(elapsed)
+                self.llm_errors += llm_error
+                for stage, seconds in parse_server_timing(response.headers.get("Server-Timing")).items():
+                    self.stage_timings.setdefault(stage, []).append(seconds)
+
+    def run(self) -> float:
+        self._deadline = time.monotonic() + (self.args.duration or 0)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as pool:
+            for _ in range(self.args.concurrency):
+                pool.submit(self._worker)
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", choices=sorted(APPS), default="new-ui")
+    parser.add_argument("--url", help="drive an already running server instead of starting stubs and the app")
+    parser.add_argument("--port", type=int, default=5099, help="port for the in-process app")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="total requests; 0 to run for --duration")
+    parser.add_argument("--duration", type=float, default=0, help="seconds to run when --requests is 0")
+    parser.add_argument("--warmup-requests", type=int, default=0, help="requests sent and discarded first")
+    parser.add_argument("--distinct-queries", type=int, default=0,
+                        help="cycle through this many queries (exercises the caches); 0 makes every query unique")
+    parser.add_argument("--query", default="trikk ulykke oslo")
+    parser.add_argument("--country", default="no")
+    parser.add_argument("--summary-lang", default="en")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--model", default="llama3.3:70b")
+    parser.add_argument("--llama-backends", type=int, default=1)
+    parser.add_argument("--llama-port", type=int, default=11600)
+    parser.add_argument("--llama-latency", type=float, default=0.2)
+    parser.add_argument("--llama-token-rate", type=float, default=200.0)
+    parser.add_argument("--llama-tokens", type=int, default=40)
+    parser.add_argument("--llama-error-rate", type=float, default=0.0)
+    parser.add_argument("--search-port", type=int, default=11650)
+    parser.add_argument("--search-latency", type=float, default=0.15)
+    parser.add_argument("--search-error-rate", type=float, default=0.0)
+    parser.add_argument("--search-results", type=int, default=30)
+    parser.add_argument("--log-level", default="WARNING", help="LOG_LEVEL for the in-process app")
+    parser.add_argument("--label", help="free-form label stored in the report")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+    if not args.requests and not args.duration:
+        parser.error("set --requests or --duration")
+
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        os.environ.update(start_stubs(args))
+        serve_app(APPS[args.app], args.port)
+        base_url = f"http://127.0.0.1:{args.port}"
+        if not wait_ready(base_url, timeout=60):
+            sys.exit("app did not become ready")
+
+    if args.warmup_requests:
+        LoadRunner(Namespace(**{**vars(args), "requests": args.warmup_requests, "duration": 0}), base_url).run()
+
+    runner = LoadRunner(args, base_url)
+    wall = runner.run()
+    completed = len(runner.latencies)
+    report = {
+        "label": args.label,
+        "commit": git_commit(),
+        "app": args.url or args.app,
+        "config": {
+            key: value for key, value in vars(args).items() if key not in ("label", "output", "url", "app")
+        },
+        "wall_seconds": round(wall, 3),
+        "requests": completed + runner.errors,
+        "completed": completed,
+        "errors": runner.errors,
+        "llm_errors": runner.llm_errors,
+        "statuses": runner.statuses,
+        "rps": round(completed / wall, 2) if wall else None,
+        "latency": summarize(runner.latencies),
+        "stages": {stage: summarize(values) for stage, values in sorted(runner.stage_timings.items())},
+    }
+    try:
+        report["app_stats"] = requests.get(f"{base_url}/api/cache/stats", timeout=5).json()
+    except (requests.RequestException, ValueError):
+        report["app_stats"] = None
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for an Ollama server, for exercising the app without GPUs.
+
+Serves /api/generate (streaming and non-streaming), /api/embed and /api/tags.
+Translation prompts built from TRANSLATION_PROMPT_TEMPLATE are echoed back; every
+other prompt gets --tokens filler tokens. Embeddings are hashed character
+trigram counts, so texts sharing most of their words get similar vectors.
+
+Usage:
+    python benchmarks/stub_ollama.py --port 11434 --latency 0.2 --token-rate 50 --error-rate 0.01
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FILLER = "local news coverage reports that the incident is under investigation".split()
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None  # argparse.Namespace, set by make_server
+
+    def log_message(self, format, *args):
+        if self.config.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, data: dict):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _tokens_for(self, prompt: str):
+        # "Translate ... :\n\n{text}\n\nTranslation:" -> echo {text}
+        parts = prompt.split("\n\n")
+        if prompt.startswith("Translate") and len(parts) >= 3:
+            return [token + " " for token in "\n\n".join(parts[1:-1]).split(" ")]
+        return [random.choice(FILLER) + " " for _ in range(self.config.tokens)]
+
+    def _embedding(self, text: str):
+        vector = [0.0] * self.config.embedding_dim
+        padded = f"  {text.lower()}  "
+        for i in range(len(padded) - 2):
+            digest = hashlib.md5(padded[i:i + 3].encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % len(vector)] += 1.0
+        return vector
+
+    def _embed(self, payload: dict):
+        time.sleep(self.config.embed_latency)
+        inputs = payload.get("input", "")
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        self._send_json(200, {
+            "model": payload.get("model", "stub"),
+            "embeddings": [self._embedding(text) for text in inputs]
+        })
+
+    def do_GET(self):
+        if self.path.startswith("/api/tags"):
+            self._send_json(200, {"models": [{"name": name} for name in self.config.models]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", "0"))
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "invalid JSON"})
+            return
+        if self.path.startswith("/api/embed"):
+            self._embed(payload)
+            return
+        if not self.path.startswith("/api/generate"):
+            self._send_json(404, {"error": "not found"})
+            return
+
+        start = time.perf_counter()
+        time.sleep(self.config.latency)
+        if random.random() < self.config.error_rate:
+            self._send_json(500, {"error": "stub failure"})
+            return
+
+        prompt = payload.get("prompt", "")
+        tokens = self._tokens_for(prompt)
+        delay = 1.0 / self.config.token_rate if self.config.token_rate > 0 else 0.0
+        model = payload.get("model", "stub")
+        prompt_eval_duration = int(self.config.latency * 1e9)
+
+        def final_counts():
+            # Same fields Ollama reports on its final object, durations in nanoseconds
+            total = int((time.perf_counter() - start) * 1e9)
+            return {
+                "prompt_eval_count": max(1, len(prompt) // 4),
+                "prompt_eval_duration": prompt_eval_duration,
+                "eval_count": len(tokens),
+                "eval_duration": max(0, total - prompt_eval_duration),
+                "total_duration": total
+            }
+        if payload.get("stream", True):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for token in tokens:
+                time.sleep(delay)
+                self._write_chunk((json.dumps({"model": model, "response": token, "done": False}) + "\n").encode())
+            final = {"model": model, "response": "", "done": True, **final_counts()}
+            self._write_chunk((json.dumps(final) + "\n").encode())
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            time.sleep(delay * len(tokens))
+            self._send_json(200, {"model": model, "response": "".join(tokens).strip(), "done": True,
+                                  **final_counts()})
+
+
+def make_server(config, host="127.0.0.1") -> ThreadingHTTPServer:
+    handler = type("ConfiguredStubOllamaHandler", (StubOllamaHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, config.port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_background(config, host="127.0.0.1") -> ThreadingHTTPServer:
+    server = make_server(config, host)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds before the first token")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="tokens per second; 0 for instant")
+    parser.add_argument("--tokens", type=int, default=40, help="tokens generated for non-translation prompts")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 500")
+    parser.add_argument("--embedding-dim", type=int, default=256)
+    parser.add_argument("--embed-latency", type=float, default=0.01, help="seconds per /api/embed call")
+    parser.add_argument("--models", nargs="*", default=["llama3.3:70b"])
+    parser.add_argument("--verbose", action="store_true")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    print(f"Stub Ollama listening on http://127.0.0.1:{args.port}/api/generate")
+    make_server(args).serve_forever()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Google Custom Search JSON API, for load tests without quota.
+
+Serves /customsearch/v1 with --results items per page (honouring start/num), each
+linking to a generated article at /page/<query-hash>/<n> and a generated JPEG at
+/image/<query-hash>/<n>.jpg on the same server, so the page-fetch stage and the
+image proxy can be exercised too.
+
+Usage:
+    python benchmarks/stub_search.py --port 11500 --latency 0.15 --error-rate 0.01
+"""
+import argparse
+import hashlib
+import io
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from PIL import Image
+
+SENTENCES = [
+    "Politiet rykket ut etter meldinger om en ulykke i sentrum.",
+    "Flere personer ble sjekket av helsepersonell på stedet.",
+    "Trafikken ble dirigert rundt området i flere timer.",
+    "Myndighetene undersøker hva som forårsaket hendelsen.",
+    "Vitner forteller om kaotiske scener like etter klokken åtte.",
+]
+
+
+class StubSearchHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None  # argparse.Namespace, set by make_server
+    image = b""  # encoded JPEG served for every /image/ path, set by make_server
+
+    def log_message(self, format, *args):
+        if self.config.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, data: dict):
+        self._send(status, json.dumps(data, ensure_ascii=False).encode("utf-8"), "application/json; charset=UTF-8")
+
+    def _base_url(self) -> str:
+        return f"http://{self.headers.get('Host', f'127.0.0.1:{self.config.port}')}"
+
+    def _search(self, params: dict):
+        query = params.get("q", [""])[0]
+        start = int(params.get("start", ["1"])[0])
+        num = min(int(params.get("num", ["10"])[0]), 10)
+        digest = hashlib.sha1(query.encode("utf-8")).hexdigest()[:12]
+        items = []
+        for n in range(start, min(start + num, self.config.results + 1)):
+            link = f"{self._base_url()}/page/{digest}/{n}"
+            items.append({
+                "kind": "customsearch#result",
+                "title": f"{query} – sak {n}",
+                "link": link,
+                "snippet": " ".join(SENTENCES[(n + i) % len(SENTENCES)] for i in range(2)),
+                "pagemap": {"cse_image": [{"src": f"{self._base_url()}/image/{digest}/{n}.jpg"}]}
+            })
+        self._send_json(200, {
+            "kind": "customsearch#search",
+            "searchInformation": {"totalResults": str(self.config.results)},
+            "items": items
+        })
+
+    def _page(self):
+        paragraphs = "".join(f"<p>{SENTENCES[i % len(SENTENCES)]}</p>" for i in range(self.config.page_paragraphs))
+        body = (
+            "<html><head><title>Stub article</title><script>var tracking = 1;</script></head>"
+            f"<body><nav>Meny</nav><article>{paragraphs}</article></body></html>"
+        ).encode("utf-8")
+        self._send(200, body, "text/html; charset=utf-8")
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        time.sleep(self.config.latency)
+        if random.random() < self.config.error_rate:
+            self._send_json(500, {"error": {"code": 500, "message": "stub failure"}})
+        elif parts.path.startswith("/customsearch/v1"):
+            self._search(parse_qs(parts.query))
+        elif parts.path.startswith("/page/"):
+            self._page()
+        elif parts.path.startswith("/image/"):
+            self._send(200, self.image, "image/jpeg")
+        else:
+            self._send_json(404, {"error": {"code": 404, "message": "not found"}})
+
+
+def render_image(width: int, height: int) -> bytes:
+    """
+    A full-size news photo stand-in: a gradient, so the JPEG is not trivially small.
+    """
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    output = io.BytesIO()
+    image.save(output, "JPEG", quality=90)
+    return output.getvalue()
+
+
+def make_server(config, host="127.0.0.1") -> ThreadingHTTPServer:
+    width, height = config.image_size
+    handler = type("ConfiguredStubSearchHandler", (StubSearchHandler,), {
+        "config": config,
+        "image": render_image(width, height)
+    })
+    server = ThreadingHTTPServer((host, config.port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_background(config, host="127.0.0.1") -> ThreadingHTTPServer:
+    server = make_server(config, host)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--latency", type=float, default=0.15, help="seconds added to every response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 500")
+    parser.add_argument("--results", type=int, default=30, help="total results available per query")
+    parser.add_argument("--page-paragraphs", type=int, default=40, help="paragraphs in each generated article")
+    parser.add_argument("--image-size", type=int, nargs=2, default=(1600, 900), metavar=("WIDTH", "HEIGHT"),
+                        help="dimensions of the generated result image")
+    parser.add_argument("--verbose", action="store_true")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    print(f"Stub Custom Search listening on http://127.0.0.1:{args.port}/customsearch/v1")
+    make_server(args).serve_forever()
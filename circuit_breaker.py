@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Per-upstream circuit breakers.
+
+Every call made through http_client or async_http is checked against the breaker
+for its backend and host (one per Ollama server, the Custom Search API, each news
+site and image host). After CIRCUIT_FAILURE_THRESHOLD consecutive failures
+(connection errors, timeouts, 5xx or 429 answers) the circuit opens and calls to
+that upstream fail at once instead of waiting out their timeouts. After
+CIRCUIT_RESET_TIMEOUT seconds a single trial call is let through: success closes
+the circuit, failure opens it for another CIRCUIT_RESET_TIMEOUT.
+
+Calls that only failed because the request's own deadline ran out say nothing
+about the upstream and are not counted either way.
+"""
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+from dotenv import load_dotenv
+
+from observability import get_logger, log_event, metrics
+
+load_dotenv()
+
+logger = get_logger("circuit_breaker")
+
+CIRCUIT_BREAKER = os.getenv("CIRCUIT_BREAKER", "True").lower() in ("true", "1", "t")
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))  # consecutive failures before opening
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))  # seconds open before a trial call
+CIRCUIT_MAX_TRACKED = int(os.getenv("CIRCUIT_MAX_TRACKED", "1000"))  # breakers kept; closed ones are dropped first
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+def is_failure_status(status_code: int) -> bool:
+    """
+    Answers that mean the upstream is unwell rather than that the request was wrong.
+    """
+    return status_code >= 500 or status_code == 429
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker for one upstream. Every allow() that returns True must be
+    followed by exactly one record() (or success(), failure() or ignore()).
+    """
+
+    def __init__(self, name: str, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.state = STATE_CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.rejected = 0
+        self.opened = 0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == STATE_CLOSED:
+                return True
+            if self.state == STATE_OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = STATE_HALF_OPEN
+            if self.state == STATE_HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def success(self):
+        with self._lock:
+            if self.state != STATE_CLOSED:
+                log_event(logger, logging.INFO, "circuit closed", upstream=self.name)
+            self.state = STATE_CLOSED
+            self._consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            self._trial_in_flight = False
+            if self.state == STATE_HALF_OPEN or (
+                    self.state == STATE_CLOSED and self._consecutive_failures >= self.failure_threshold):
+                self.state = STATE_OPEN
+                self._opened_at = time.monotonic()
+                self.opened += 1
+                log_event(
+                    logger, logging.WARNING, "circuit opened",
+                    upstream=self.name, consecutive_failures=self._consecutive_failures
+                )
+
+    def ignore(self):
+        """
+        Ends a call whose outcome says nothing about the upstream.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record(self, ok):
+        """
+        Records a call outcome: True for success, False for failure, None when it says nothing.
+        """
+        if ok is None:
+            self.ignore()
+        elif ok:
+            self.success()
+        else:
+            self.failure()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self._consecutive_failures,
+                "opened": self.opened,
+                "rejected": self.rejected
+            }
+
+
+class CircuitBreakers:
+    """
+    Breakers keyed on (backend, host), created on first use.
+    """
+
+    def __init__(self, max_tracked=CIRCUIT_MAX_TRACKED, enabled=CIRCUIT_BREAKER):
+        self.max_tracked = max_tracked
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def get(self, backend: str, url: str):
+        """
+        Returns the breaker for the upstream serving url, or None when breakers are disabled.
+        """
+        if not self.enabled:
+            return None
+        key = (backend, urlsplit(url).netloc.lower())
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                if len(self._breakers) >= self.max_tracked:
+                    self._prune()
+                breaker = CircuitBreaker(f"{backend}:{key[1]}")
+                self._breakers[key] = breaker
+            return breaker
+
+    def _prune(self):
+        # Called with the lock held; page fetches touch many hosts, so forget healthy ones first
+        closed = [key for key, breaker in self._breakers.items() if breaker.state == STATE_CLOSED]
+        for key in closed[:max(1, len(closed) // 2)] or list(self._breakers)[:1]:
+            del self._breakers[key]
+
+    def reject(self, backend: str, breaker: CircuitBreaker):
+        metrics.count_upstream_event(backend, "circuit_open")
+        log_event(logger, logging.DEBUG, "call rejected, circuit open", upstream=breaker.name)
+
+    def stats(self) -> dict:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {
+            "enabled": self.enabled,
+            "tracked": len(breakers),
+            # Healthy upstreams are not listed; there can be hundreds of news sites
+            "unhealthy": {
+                breaker.name: breaker.stats() for breaker in breakers if breaker.state != STATE_CLOSED
+            }
+        }
+
+
+circuit_breakers = CircuitBreakers()
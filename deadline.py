@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Per-request time budgets that follow a search through every stage.
+
+Request handlers run the search inside scope(REQUEST_DEADLINE), which stores the
+absolute expiry in a context variable. Nothing has to pass it along explicitly:
+http_client and async_http cap each upstream timeout at the time left and refuse
+to start calls once it is spent, and the LLM schedulers stop queueing at it. A
+slow upstream therefore ends the request with the usual in-band errors instead of
+holding a worker indefinitely.
+
+Context variables follow asyncio tasks (and asyncio.to_thread) on their own; work
+handed to a thread pool must be submitted with submit() to keep the deadline.
+"""
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "60"))  # seconds per search request; 0 disables
+
+_expires_at = contextvars.ContextVar("deadline_expires_at", default=None)  # time.monotonic() value
+
+
+@contextmanager
+def scope(seconds=REQUEST_DEADLINE):
+    """
+    Runs the block under a deadline seconds from now. A nested scope can only shorten the
+    deadline it runs under; seconds of 0 or None leave the current one in place.
+    """
+    if not seconds or seconds <= 0:
+        yield
+        return
+    expires_at = time.monotonic() + seconds
+    current = _expires_at.get()
+    if current is not None:
+        expires_at = min(expires_at, current)
+    token = _expires_at.set(expires_at)
+    try:
+        yield
+    finally:
+        _expires_at.reset(token)
+
+
+def remaining():
+    """
+    Seconds left before the current deadline (negative once it has passed), or None without one.
+    """
+    expires_at = _expires_at.get()
+    return None if expires_at is None else expires_at - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def submit(executor, fn, *args, **kwargs):
+    """
+    executor.submit() running fn under the caller's deadline.
+    """
+    # One copy per call: a Context cannot be entered by two threads at once
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Hedged requests for idempotent upstream calls.
+
+With HEDGED_REQUESTS on, Custom Search and translation calls record their latency
+per call class ("google", "llama.query_translation", ...). Once a class has
+HEDGE_MIN_SAMPLES recent samples, a call still running after that class's
+HEDGE_PERCENTILE latency gets a second, identical attempt and the first good
+answer wins. This trims the tail caused by one stuck connection or a stalled
+upstream for roughly (100 - HEDGE_PERCENTILE)% extra calls. Only calls that are
+safe to repeat are hedged; summaries and streamed generations never are.
+Translations are hedged on a different Ollama backend in a scheduler slot of
+their own, and only when one is idle, so hedging never exceeds the concurrency
+cap or piles onto the backend that is already slow.
+"""
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from dotenv import load_dotenv
+
+import deadline
+from observability import get_logger, log_event, metrics
+
+load_dotenv()
+
+logger = get_logger("hedging")
+
+HEDGED_REQUESTS = os.getenv("HEDGED_REQUESTS", "False").lower() in ("true", "1", "t")
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))  # latency percentile that triggers the hedge
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))  # samples per call class before hedging
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))  # recent latencies kept per call class
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.05"))  # never hedge sooner than this, in seconds
+HEDGE_WORKERS = int(os.getenv("HEDGE_WORKERS", "64"))
+
+
+class LatencyTracker:
+    """
+    Sliding window of successful call latencies per call class.
+    """
+
+    def __init__(self, window=HEDGE_WINDOW, min_samples=HEDGE_MIN_SAMPLES, percentile=HEDGE_PERCENTILE):
+        self.window = window
+        self.min_samples = min_samples
+        self.percentile = percentile
+        self._lock = threading.Lock()
+        self._samples = {}  # call class -> deque of seconds
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(name, deque(maxlen=self.window)).append(seconds)
+
+    def threshold(self, name: str):
+        """
+        The percentile latency of name, or None until min_samples calls have been recorded.
+        """
+        with self._lock:
+            samples = sorted(self._samples.get(name, ()))
+        if not samples or len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * self.percentile / 100))]
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {name: len(samples) for name, samples in self._samples.items()}
+        return {name: {"samples": count, "threshold_seconds": self.threshold(name)} for name, count in counts.items()}
+
+
+class Hedger:
+    """
+    Runs attempt() and, if it is still going after the class's percentile latency, a second attempt()
+    (or hedge_attempt(started) when given); returns the first result for which ok(result) holds.
+    hedge_attempt must call started() once it has what it needs to send the call (a slot, a backend),
+    so a hedge that gives up before that is not counted as launched.
+    """
+
+    def __init__(self, tracker=None, enabled=HEDGED_REQUESTS, workers=HEDGE_WORKERS, min_delay=HEDGE_MIN_DELAY):
+        self.tracker = tracker or LatencyTracker()
+        self.enabled = enabled
+        self.min_delay = min_delay
+        self._workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self.hedged = {}  # call class -> second attempts started
+        self.won = {}  # call class -> second attempts that answered first
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="hedge")
+            return self._executor
+
+    def delay(self, name: str):
+        """
+        Seconds to wait before hedging a call of this class, or None if it should not be hedged.
+        """
+        threshold = self.tracker.threshold(name)
+        if threshold is None:
+            return None
+        delay = max(self.min_delay, threshold)
+        left = deadline.remaining()
+        # A hedge started after the deadline could never answer in time
+        if left is not None and left <= delay:
+            return None
+        return delay
+
+    def _count(self, counter: dict, name: str, event: str):
+        with self._lock:
+            counter[name] = counter.get(name, 0) + 1
+        metrics.count_upstream_event(name.split(".", 1)[0], event)
+
+    def _second_attempt(self, name, attempt, hedge_attempt):
+        # A plain repeat always starts; a hedge_attempt reports when it actually does
+        if hedge_attempt is None:
+            self._count(self.hedged, name, "hedged")
+            return attempt
+        return functools.partial(hedge_attempt, functools.partial(self._count, self.hedged, name, "hedged"))
+
+    def _timed(self, name, attempt, ok):
+        start = time.perf_counter()
+        result = attempt()
+        if ok(result):
+            self.tracker.record(name, time.perf_counter() - start)
+        return result
+
+    def call(self, name: str, attempt, ok=lambda result: True, hedge_attempt=None):
+        if not self.enabled:
+            return attempt()
+        delay = self.delay(name)
+        if delay is None:
+            return self._timed(name, attempt, ok)
+        executor = self._get_executor()
+        first = deadline.submit(executor, self._timed, name, attempt, ok)
+        try:
+            return first.result(timeout=delay)
+        except FutureTimeoutError:
+            pass
+        log_event(logger, logging.DEBUG, "hedging slow call", call=name, after=round(delay, 3))
+        second = deadline.submit(executor, self._timed, name, self._second_attempt(name, attempt, hedge_attempt), ok)
+        pending = {first, second}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            # Prefer the original attempt when both finished together
+            for future in sorted(done, key=lambda f: f is not first):
+                if future.exception() is None and ok(future.result()):
+                    if future is second:
+                        self._count(self.won, name, "hedge_won")
+                    return future.result()
+        # Neither attempt gave a good answer; report the original's outcome
+        return first.result()
+
+    async def _timed_async(self, name, attempt, ok):
+        start = time.perf_counter()
+        result = await attempt()
+        if ok(result):
+            self.tracker.record(name, time.perf_counter() - start)
+        return result
+
+    async def call_async(self, name: str, attempt, ok=lambda result: True, hedge_attempt=None):
+        """
+        call() for a coroutine function attempt; the losing attempt is cancelled.
+        """
+        if not self.enabled:
+            return await attempt()
+        delay = self.delay(name)
+        if delay is None:
+            return await self._timed_async(name, attempt, ok)
+        first = asyncio.ensure_future(self._timed_async(name, attempt, ok))
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return first.result()
+            log_event(logger, logging.DEBUG, "hedging slow call", call=name, after=round(delay, 3))
+            second = asyncio.ensure_future(
+                self._timed_async(name, self._second_attempt(name, attempt, hedge_attempt), ok)
+            )
+            tasks.add(second)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=lambda t: t is not first):
+                    if task.exception() is None and ok(task.result()):
+                        if task is second:
+                            self._count(self.won, name, "hedge_won")
+                        return task.result()
+            return first.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> dict:
+        latencies = self.tracker.stats()
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "percentile": self.tracker.percentile,
+                "calls": {
+                    name: {**latency, "hedged": self.hedged.get(name, 0), "won": self.won.get(name, 0)}
+                    for name, latency in latencies.items()
+                }
+            }
+
+
+hedger = Hedger()
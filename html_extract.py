@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Early-terminating HTML-to-text extraction.
+
+TextExtractor is fed HTML incrementally (e.g. straight from a streaming HTTP
+response), skips the contents of BS_TAGS_TO_REMOVE, collapses whitespace and
+stops parsing as soon as MAX_TEXT_LENGTH characters of text have been collected,
+instead of building a full BeautifulSoup tree and slicing the result.
+"""
+import os
+from html.parser import HTMLParser
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BS_TAGS_TO_REMOVE = os.getenv("BS_TAGS_TO_REMOVE", "script,style,noscript").split(',')
+MAX_TEXT_LENGTH = int(os.getenv("MAX_TEXT_LENGTH", "1000"))
+
+
+class _Enough(Exception):
+    """Raised from a handler to abort parsing once the text budget is spent."""
+
+
+class TextExtractor(HTMLParser):
+    """
+    Collects visible text until max_chars characters are available.
+    """
+
+    def __init__(self, max_chars=MAX_TEXT_LENGTH, skip_tags=BS_TAGS_TO_REMOVE):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.skip_tags = frozenset(tag.strip().lower() for tag in skip_tags if tag.strip())
+        self.done = False
+        self._skip_depth = 0
+        self._parts = []
+        self._length = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.skip_tags:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.skip_tags and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        text = " ".join(data.split())
+        if not text:
+            return
+        if self._parts:
+            text = " " + text
+        self._parts.append(text)
+        self._length += len(text)
+        if self._length >= self.max_chars:
+            raise _Enough()
+
+    def feed(self, data: str):
+        if self.done:
+            return
+        try:
+            super().feed(data)
+        except _Enough:
+            self.done = True
+
+    def get_text(self) -> str:
+        """
+        Flushes buffered input and returns at most max_chars characters of text.
+        """
+        if not self.done:
+            try:
+                self.close()
+            except _Enough:
+                pass
+            self.done = True
+        return "".join(self._parts)[:self.max_chars]
+
+
+def extract_text(html: str, max_chars=MAX_TEXT_LENGTH) -> str:
+    extractor = TextExtractor(max_chars=max_chars)
+    extractor.feed(html)
+    return extractor.get_text()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Shared pooled HTTP client for the Ollama, Google Custom Search, page-fetch and image backends.
+
+Each backend gets its own requests.Session with keep-alive connection pools per
+host, separate connect/read timeouts and bounded retries with exponential backoff.
+Every call is capped at the current request's deadline (deadline.py), fails fast
+while its upstream's circuit breaker is open (circuit_breaker.py) and, when the
+caller names a latency class, may be hedged (hedging.py).
+"""
+import os
+import threading
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import deadline
+from circuit_breaker import circuit_breakers, is_failure_status
+from hedging import hedger
+from observability import metrics
+
+load_dotenv()
+
+HTTP_POOL_HOSTS = int(os.getenv("HTTP_POOL_HOSTS", "32"))  # host pools kept per backend
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))  # keep-alive connections per host
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.3"))
+
+# backend -> settings; timeouts are (connect, read) in seconds
+BACKENDS = {
+    "llama": {
+        "connect_timeout": float(os.getenv("LLAMA_CONNECT_TIMEOUT", "3")),
+        "read_timeout": float(os.getenv("LLAMA_READ_TIMEOUT", "300")),
+        "retries": int(os.getenv("LLAMA_RETRIES", "2")),
+        "retry_statuses": (502, 503, 504),
+    },
+    "google": {
+        "connect_timeout": float(os.getenv("GOOGLE_CONNECT_TIMEOUT", "3")),
+        "read_timeout": float(os.getenv("GOOGLE_READ_TIMEOUT", "10")),
+        "retries": int(os.getenv("GOOGLE_RETRIES", "2")),
+        "retry_statuses": (429, 500, 502, 503, 504),
+    },
+    "pages": {
+        "connect_timeout": float(os.getenv("PAGE_CONNECT_TIMEOUT", "3")),
+        "read_timeout": float(os.getenv("PAGE_READ_TIMEOUT", os.getenv("REQUEST_TIMEOUT", "5"))),
+        "retries": int(os.getenv("PAGE_RETRIES", "1")),
+        "retry_statuses": (502, 503, 504),
+    },
+    "images": {
+        "connect_timeout": float(os.getenv("IMAGE_CONNECT_TIMEOUT", "3")),
+        "read_timeout": float(os.getenv("IMAGE_READ_TIMEOUT", "10")),
+        "retries": int(os.getenv("IMAGE_RETRIES", "1")),
+        "retry_statuses": (502, 503, 504),
+    },
+}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class DeadlineExceeded(requests.Timeout):
+    """Raised instead of sending a request once the current request's deadline has passed."""
+
+
+class CircuitOpen(requests.ConnectionError):
+    """Raised instead of sending a request while the upstream's circuit breaker is open."""
+
+
+class DeadlineRetry(Retry):
+    """
+    Retry that stops once the current request's deadline has passed. urllib3 retries in the
+    calling thread, so the deadline is visible here.
+    """
+
+    def is_exhausted(self) -> bool:
+        return deadline.expired() or super().is_exhausted()
+
+
+def _build_session(backend: str) -> requests.Session:
+    settings = BACKENDS[backend]
+    retry = DeadlineRetry(
+        total=settings["retries"],
+        backoff_factor=HTTP_RETRY_BACKOFF,
+        status_forcelist=settings["retry_statuses"],
+        # Generation and search calls are safe to repeat, so POST is retried too
+        allowed_methods=frozenset(["GET", "HEAD", "POST"]),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session(backend: str) -> requests.Session:
+    """
+    Returns the shared session for a backend, creating it on first use.
+    """
+    with _sessions_lock:
+        session = _sessions.get(backend)
+        if session is None:
+            session = _build_session(backend)
+            _sessions[backend] = session
+        return session
+
+
+def timeout_for(backend: str, timeout=None) -> tuple:
+    """
+    (connect, read) timeouts for a call: the backend's defaults unless timeout is given,
+    capped at the time left before the current request's deadline. Raises DeadlineExceeded
+    once that has run out.
+    """
+    settings = BACKENDS[backend]
+    if timeout is None:
+        timeout = (settings["connect_timeout"], settings["read_timeout"])
+    elif not isinstance(timeout, tuple):
+        timeout = (timeout, timeout)
+    left = deadline.remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded(f"Request deadline exceeded before calling {backend}")
+    return tuple(left if value is None else min(value, left) for value in timeout)
+
+
+def _send(backend: str, method: str, url: str, **kwargs) -> requests.Response:
+    # Before the breaker is consulted, so a spent deadline never leaves a half-open trial unrecorded
+    try:
+        kwargs["timeout"] = timeout_for(backend, kwargs.get("timeout"))
+    except DeadlineExceeded:
+        metrics.count_upstream_event(backend, "deadline_exceeded")
+        raise
+    breaker = circuit_breakers.get(backend, url)
+    if breaker is not None and not breaker.allow():
+        circuit_breakers.reject(backend, breaker)
+        raise CircuitOpen(f"Circuit open for {breaker.name}")
+    ok = None
+    try:
+        response = get_session(backend).request(method, url, **kwargs)
+        ok = not is_failure_status(response.status_code)
+        return response
+    except (requests.ConnectionError, requests.Timeout):
+        # A timeout cut short by the deadline says nothing about the upstream
+        if deadline.expired():
+            metrics.count_upstream_event(backend, "deadline_exceeded")
+        else:
+            ok = False
+        raise
+    finally:
+        if breaker is not None:
+            breaker.record(ok)
+
+
+def request(backend: str, method: str, url: str, hedge=None, **kwargs) -> requests.Response:
+    """
+    Sends a request through the backend's pooled session, applying its default timeouts.
+    hedge names the latency class of an idempotent, non-streaming call that may get a second
+    attempt when it runs past that class's percentile latency.
+    """
+    if hedge is None or kwargs.get("stream"):
+        return _send(backend, method, url, **kwargs)
+    return hedger.call(
+        hedge, lambda: _send(backend, method, url, **kwargs),
+        ok=lambda response: not is_failure_status(response.status_code)
+    )
+
+
+def get(backend: str, url: str, **kwargs) -> requests.Response:
+    return request(backend, "GET", url, **kwargs)
+
+
+def post(backend: str, url: str, **kwargs) -> requests.Response:
+    return request(backend, "POST", url, **kwargs)
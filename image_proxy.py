@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Caching image proxy that serves result images as small thumbnails.
+
+Result cards link to IMAGE_PROXY_ROUTE instead of the publisher's full-size image.
+The first request for an image downloads it once (coalescing concurrent requests),
+scales it to at most IMAGE_THUMBNAIL_SIZE pixels on the longest side, re-encodes it
+as JPEG and stores it in an on-disk LRU bounded by IMAGE_CACHE_MAX_BYTES. Later
+requests are answered from disk with long-lived Cache-Control headers.
+
+Proxied links carry an HMAC of the image URL so the endpoint only fetches images
+that appeared in our own results. Without IMAGE_PROXY_SECRET the key is generated
+once and kept next to the thumbnail cache, so every worker on the host and every
+restart sign alike; set it explicitly when several hosts serve the same links.
+
+A signature only shows that a publisher put the URL in its page, so every download
+is checked as well: the host must resolve to public addresses only, the port must
+be in IMAGE_ALLOWED_PORTS, and redirects are followed by hand, checking each hop.
+"""
+import hashlib
+import hmac
+import io
+import ipaddress
+import logging
+import os
+import secrets
+import socket
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode, urljoin, urlsplit
+
+import requests
+from dotenv import load_dotenv
+from PIL import Image, ImageOps
+
+import http_client
+from observability import get_logger, log_event, metrics
+from single_flight import SingleFlight
+
+load_dotenv()
+
+logger = get_logger("image_proxy")
+
+IMAGE_PROXY = os.getenv("IMAGE_PROXY", "True").lower() in ("true", "1", "t")
+IMAGE_PROXY_ROUTE = os.getenv("IMAGE_PROXY_ROUTE", "/api/image")
+IMAGE_PROXY_BASE_URL = os.getenv("IMAGE_PROXY_BASE_URL", "")  # public origin of the proxy; default: relative links
+IMAGE_PROXY_SECRET = os.getenv("IMAGE_PROXY_SECRET", "")  # signing key; required with several hosts
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "local-llama-images"))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+IMAGE_CACHE_MAX_AGE = int(os.getenv("IMAGE_CACHE_MAX_AGE", "604800"))  # seconds clients may keep a thumbnail
+IMAGE_THUMBNAIL_SIZE = int(os.getenv("IMAGE_THUMBNAIL_SIZE", "320"))  # longest side in pixels
+IMAGE_THUMBNAIL_QUALITY = int(os.getenv("IMAGE_THUMBNAIL_QUALITY", "80"))
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))  # largest source image downloaded
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", "50000000"))  # refuse decompression bombs
+IMAGE_ALLOWED_PORTS = {int(port) for port in os.getenv("IMAGE_ALLOWED_PORTS", "80,443").split(",") if port.strip()}
+IMAGE_MAX_REDIRECTS = int(os.getenv("IMAGE_MAX_REDIRECTS", "3"))
+# Non-public networks images may still come from, e.g. 127.0.0.0/8 for the load-test stubs; empty in production
+IMAGE_ALLOWED_NETWORKS = [
+    ipaddress.ip_network(network.strip()) for network in os.getenv("IMAGE_ALLOWED_NETWORKS", "").split(",")
+    if network.strip()
+]
+
+THUMBNAIL_MIMETYPE = "image/jpeg"
+
+Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+
+
+def load_secret(directory=IMAGE_CACHE_DIR) -> str:
+    """
+    The key stored in directory, created by whichever process gets there first.
+    """
+    path = os.path.join(directory, ".signing-key")
+    try:
+        os.makedirs(directory, exist_ok=True)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, "w") as f:
+                f.write(secrets.token_hex(32))
+        for _ in range(50):
+            with open(path) as f:
+                key = f.read().strip()
+            # Another process may have created the file and not written the key yet
+            if key:
+                return key
+            time.sleep(0.01)
+        raise OSError(f"{path} is empty")
+    except OSError as e:
+        # Links still work, but only in this process and until it restarts
+        log_event(logger, logging.WARNING, "image proxy key not persisted, set IMAGE_PROXY_SECRET", error=str(e))
+        return secrets.token_hex(32)
+
+
+if not IMAGE_PROXY_SECRET:
+    IMAGE_PROXY_SECRET = load_secret()
+
+
+class ImageUnavailable(Exception):
+    """
+    The source image could not be downloaded or decoded.
+    """
+
+
+def sign(url: str) -> str:
+    return hmac.new(IMAGE_PROXY_SECRET.encode("utf-8"), url.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+
+def verify(url: str, signature: str) -> bool:
+    """
+    True when signature was issued by proxy_url for this http(s) URL.
+    """
+    if not url or not signature or urlsplit(url).scheme not in ("http", "https"):
+        return False
+    return hmac.compare_digest(sign(url), signature)
+
+
+def proxy_url(image_url):
+    """
+    Returns the proxied thumbnail link for image_url, or image_url itself when it cannot be proxied.
+    The link is relative, so it resolves against the origin that served the page (the Next.js
+    frontends pass IMAGE_PROXY_ROUTE through to the API); IMAGE_PROXY_BASE_URL makes it absolute.
+    """
+    if not IMAGE_PROXY or not image_url or urlsplit(image_url).scheme not in ("http", "https"):
+        return image_url
+    base_url = IMAGE_PROXY_BASE_URL.rstrip("/")
+    return f"{base_url}{IMAGE_PROXY_ROUTE}?{urlencode({'url': image_url, 'sig': sign(image_url)})}"
+
+
+def proxy_results(results):
+    """
+    Copies of the result cards with image_url pointing at the proxy; cached results are left untouched.
+    """
+    return [dict(result, image_url=proxy_url(result.get("image_url"))) for result in results]
+
+
+class ThumbnailCache:
+    """
+    Size-bounded LRU of encoded thumbnails, one file per image. Recency is the file's mtime,
+    so the order survives restarts; the in-memory index is rebuilt from the directory on first use.
+    """
+
+    def __init__(self, directory=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index = None  # file name -> size in bytes, least recently used first
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load_index(self):
+        # Called with the lock held
+        if self._index is not None:
+            return
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(".jpg") and entry.is_file():
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, entry.name, stat.st_size))
+        except OSError:
+            pass
+        entries.sort()
+        self._index = OrderedDict((name, size) for _, name, size in entries)
+        self._total_bytes = sum(self._index.values())
+
+    def get(self, key: str):
+        name = key + ".jpg"
+        with self._lock:
+            self._load_index()
+            if name not in self._index:
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(name), "rb") as f:
+                    data = f.read()
+                os.utime(self._path(name))
+            except OSError:
+                # Removed behind our back (another worker evicted it)
+                self._total_bytes -= self._index.pop(name)
+                self.misses += 1
+                return None
+            self._index.move_to_end(name)
+            self.hits += 1
+            return data
+
+    def put(self, key: str, data: bytes):
+        name = key + ".jpg"
+        path = self._path(name)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            # Atomic so concurrent readers never see a half-written thumbnail
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log_event(logger, logging.WARNING, "thumbnail cache write failed", error=str(e))
+            return
+        with self._lock:
+            self._load_index()
+            self._total_bytes += len(data) - self._index.pop(name, 0)
+            self._index[name] = len(data)
+            while self._total_bytes > self.max_bytes and len(self._index) > 1:
+                evicted, size = self._index.popitem(last=False)
+                self._total_bytes -= size
+                self.evictions += 1
+                try:
+                    os.remove(self._path(evicted))
+                except OSError:
+                    pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._index or ()),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions
+            }
+
+
+def check_public(url: str):
+    """
+    Raises ImageUnavailable unless url is http(s) on an allowed port and its host resolves only to
+    public addresses (or IMAGE_ALLOWED_NETWORKS), so a signed link cannot reach the server's own network.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ImageUnavailable(f"not an http(s) URL: {url}")
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+    except ValueError as e:
+        raise ImageUnavailable(f"invalid port in {url}") from e
+    if port not in IMAGE_ALLOWED_PORTS:
+        raise ImageUnavailable(f"port {port} is not in IMAGE_ALLOWED_PORTS")
+    try:
+        addresses = socket.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+    except (OSError, UnicodeError) as e:
+        raise ImageUnavailable(f"cannot resolve {parts.hostname}: {e}") from e
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if any(address in network for network in IMAGE_ALLOWED_NETWORKS):
+            continue
+        # Loopback, private, link-local (cloud metadata), shared and reserved ranges are all non-global
+        if not address.is_global or address.is_multicast:
+            raise ImageUnavailable(f"{parts.hostname} resolves to non-public address {address}")
+
+
+def download(url: str) -> bytes:
+    """
+    Downloads the source image, refusing bodies larger than IMAGE_MAX_BYTES. Every hop, redirects
+    included, must pass check_public.
+    """
+    try:
+        for _ in range(IMAGE_MAX_REDIRECTS + 1):
+            check_public(url)
+            with http_client.get(
+                "images", url, headers={"Accept": "image/*"}, stream=True, allow_redirects=False
+            ) as resp:
+                if resp.is_redirect:
+                    url = urljoin(url, resp.headers["Location"])
+                    continue
+                resp.raise_for_status()
+                if int(resp.headers.get("Content-Length") or 0) > IMAGE_MAX_BYTES:
+                    raise ImageUnavailable(f"image larger than {IMAGE_MAX_BYTES} bytes")
+                body = bytearray()
+                for chunk in resp.iter_content(chunk_size=65536):
+                    body += chunk
+                    if len(body) > IMAGE_MAX_BYTES:
+                        raise ImageUnavailable(f"image larger than {IMAGE_MAX_BYTES} bytes")
+                return bytes(body)
+    except requests.RequestException as e:
+        raise ImageUnavailable(str(e)) from e
+    raise ImageUnavailable(f"more than {IMAGE_MAX_REDIRECTS} redirects")
+
+
+def make_thumbnail(data: bytes, size: int = IMAGE_THUMBNAIL_SIZE, quality: int = IMAGE_THUMBNAIL_QUALITY) -> bytes:
+    """
+    Scales an encoded image to fit size x size and re-encodes it as JPEG.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # JPEG sources decode straight at a reduced scale, which is much cheaper than a full decode
+            image.draft("RGB", (size, size))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((size, size), Image.Resampling.LANCZOS)
+            if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+            output = io.BytesIO()
+            image.save(output, "JPEG", quality=quality, optimize=True, progressive=True)
+            return output.getvalue()
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise ImageUnavailable(f"cannot decode image: {e}") from e
+
+
+thumbnail_cache = ThumbnailCache()
+image_flight = SingleFlight()
+
+
+def _fetch_thumbnail(url: str, key: str) -> bytes:
+    data = download(url)
+    thumbnail = make_thumbnail(data)
+    log_event(logger, logging.DEBUG, "thumbnail generated", url=url, source_bytes=len(data),
+              thumbnail_bytes=len(thumbnail))
+    thumbnail_cache.put(key, thumbnail)
+    return thumbnail
+
+
+def get_thumbnail(url: str):
+    """
+    Returns the JPEG thumbnail for url from the cache or by fetching it once, or None if unavailable.
+    """
+    key = hashlib.sha256(f"{url}|{IMAGE_THUMBNAIL_SIZE}|{IMAGE_THUMBNAIL_QUALITY}".encode("utf-8")).hexdigest()
+    cached = thumbnail_cache.get(key)
+    if cached is not None:
+        return cached
+    try:
+        return image_flight.do(key, lambda: _fetch_thumbnail(url, key))
+    except ImageUnavailable as e:
+        metrics.count_error("images")
+        log_event(logger, logging.WARNING, "image proxy fetch failed", url=url, error=str(e))
+        return None
+
+
+def cache_headers() -> dict:
+    # A thumbnail never changes for a given URL and size
+    return {"Cache-Control": f"public, max-age={IMAGE_CACHE_MAX_AGE}, immutable"}
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Queued search jobs for clients that should not hold a connection for a whole search.
+
+POST /api/jobs stores a job and returns its id at once. Worker threads claim queued
+jobs oldest first, run the streaming pipeline and write its progress into the job
+(translated query, untranslated then translated results, the summary as it is
+generated), so GET /api/jobs/<id> returns partial results while it runs and the
+final ones when it is done. Finished jobs are kept for JOB_RESULT_TTL seconds.
+
+Jobs live in SQLite, by default in one file in the temp directory named after this
+checkout, shared by every process started from it, so a job submitted to one server
+worker can be polled through any other, and web processes (JOB_WORKERS=0) and
+dedicated worker processes (`python app.py worker`) use one queue that scales
+separately from the web tier, while other deployments on the host keep their own.
+A JOB_DB containing {pid} gives each process its own queue instead. The file is
+created on first use, not on import.
+"""
+import hashlib
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import tempfile
+import threading
+import time
+
+from dotenv import load_dotenv
+
+import deadline
+from observability import get_logger, log_event
+
+load_dotenv()
+
+logger = get_logger("jobs")
+
+# One default queue per checkout: deployments from different directories must not share jobs
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_JOB_DB = os.path.join(
+    tempfile.gettempdir(), f"local-llama-jobs-{hashlib.sha1(APP_DIR.encode()).hexdigest()[:12]}.db"
+)
+JOB_DB = (os.getenv("JOB_DB", "") or DEFAULT_JOB_DB).replace("{pid}", str(os.getpid()))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))  # worker threads in this process; 0 only enqueues
+JOB_QUEUE_LIMIT = int(os.getenv("JOB_QUEUE_LIMIT", "200"))  # queued jobs before submissions are refused
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "600"))  # seconds a finished job stays readable
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "600"))  # running jobs without progress this long have failed
+JOB_DEADLINE = float(os.getenv("JOB_DEADLINE", "300"))  # seconds a job's search may run; 0 disables
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))  # idle workers check for new jobs this often
+JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", "0.25"))  # min seconds between summary writes
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class JobQueueFull(Exception):
+    """Raised when JOB_QUEUE_LIMIT jobs are already waiting."""
+
+
+def apply_event(state: dict, event: str, payload: dict):
+    """
+    Folds one stream_search_pipeline event into the job's progress.
+    """
+    if event == "translated_query":
+        state["translated_query"] = payload["translated_query"]
+    elif event == "results":
+        state["results"] = payload["results"]
+    elif event == "translated_results":
+        state["results"] = payload["results"]
+        state["results_translated"] = True
+    elif event == "summary_token":
+        state["summary"] = state.get("summary", "") + payload["token"]
+    elif event == "summary":
+        state["summary"] = payload["summary"]
+        state["summary_complete"] = True
+    elif event == "error":
+        state.setdefault("errors", []).append(payload)
+    elif event == "done":
+        state["timings"] = payload.get("timings", {})
+
+
+class JobStore:
+    """
+    SQLite table of jobs; safe to share between threads and between processes on one host.
+    """
+
+    def __init__(self, db_path=JOB_DB, queue_limit=JOB_QUEUE_LIMIT, result_ttl=JOB_RESULT_TTL, timeout=JOB_TIMEOUT):
+        self.db_path = db_path
+        self.queue_limit = queue_limit
+        self.result_ttl = result_ttl
+        self.timeout = timeout
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _db(self):
+        # sqlite3 connections cannot be shared between threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            # The database is only created here, on first use, so importing this module touches no file
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS jobs ("
+                        "id TEXT PRIMARY KEY, status TEXT NOT NULL, params TEXT NOT NULL, state TEXT NOT NULL, "
+                        "error TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL, "
+                        "updated_at REAL NOT NULL)"
+                    )
+                    conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+                    self._schema_ready = True
+        return conn
+
+    def submit(self, params: dict) -> str:
+        """
+        Stores a queued job and returns its id; raises JobQueueFull when the queue is at its limit.
+        """
+        job_id = secrets.token_urlsafe(16)
+        now = time.time()
+        conn = self._db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (STATUS_QUEUED,)).fetchone()[0]
+            if queued >= self.queue_limit:
+                raise JobQueueFull(f"{queued} jobs already queued")
+            conn.execute(
+                "INSERT INTO jobs (id, status, params, state, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, STATUS_QUEUED, json.dumps(params, ensure_ascii=False), "{}", now, now)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return job_id
+
+    def claim(self):
+        """
+        Marks the oldest queued job as running and returns (job id, params), or None if there is none.
+        """
+        now = time.time()
+        conn = self._db()
+        # IMMEDIATE takes the write lock first, so two workers never claim the same job
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, params FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (STATUS_QUEUED,)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, started_at = ?, updated_at = ? WHERE id = ?",
+                    (STATUS_RUNNING, now, now, row[0])
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return None if row is None else (row[0], json.loads(row[1]))
+
+    def update(self, job_id: str, state: dict):
+        now = time.time()
+        self._db().execute(
+            "UPDATE jobs SET state = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(state, ensure_ascii=False), now, job_id)
+        )
+
+    def finish(self, job_id: str, state: dict, error=None):
+        now = time.time()
+        self._db().execute(
+            "UPDATE jobs SET status = ?, state = ?, error = ?, finished_at = ?, updated_at = ? WHERE id = ?",
+            (STATUS_FAILED if error else STATUS_DONE, json.dumps(state, ensure_ascii=False), error, now, now, job_id)
+        )
+
+    def get(self, job_id: str):
+        """
+        Returns the job as a dict, or None if it is unknown or has expired.
+        """
+        conn = self._db()
+        row = conn.execute(
+            "SELECT status, params, state, error, created_at, started_at, finished_at FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        status, params, state, error, created_at, started_at, finished_at = row
+        job = {
+            "job_id": job_id,
+            "status": status,
+            **json.loads(params),
+            **json.loads(state),
+            "error": error,
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at
+        }
+        if status == STATUS_QUEUED:
+            job["position"] = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?", (STATUS_QUEUED, created_at)
+            ).fetchone()[0]
+        return job
+
+    def expire(self):
+        """
+        Deletes finished jobs past JOB_RESULT_TTL and fails running jobs that stopped making progress.
+        """
+        now = time.time()
+        conn = self._db()
+        conn.execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at <= ?", (now - self.result_ttl,))
+        lost = conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE status = ? AND updated_at <= ?",
+            (STATUS_FAILED, "Job timed out", now, STATUS_RUNNING, now - self.timeout)
+        ).rowcount
+        if lost:
+            log_event(logger, logging.WARNING, "stalled jobs failed", jobs=lost)
+
+    def stats(self) -> dict:
+        rows = self._db().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {STATUS_QUEUED: 0, STATUS_RUNNING: 0, STATUS_DONE: 0, STATUS_FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+
+class JobWorkers:
+    """
+    Threads that claim jobs from a JobStore and run handler(params), a generator of (event, payload).
+    """
+
+    def __init__(self, store: JobStore, workers=JOB_WORKERS):
+        self.store = store
+        self.workers = workers
+        self._handler = None
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+
+    def notify(self):
+        """
+        Wakes idle workers in this process after a submit instead of waiting for the next poll.
+        """
+        self._wakeup.set()
+
+    def _run_job(self, job_id: str, params: dict):
+        state = {}
+        last_write = 0.0
+        try:
+            # Jobs have no client waiting on a connection, so they get a longer budget than requests
+            with deadline.scope(JOB_DEADLINE):
+                for event, payload in self._handler(params):
+                    apply_event(state, event, payload)
+                    # Summary tokens arrive many times a second; write them out at most every JOB_PROGRESS_INTERVAL
+                    now = time.monotonic()
+                    if event != "summary_token" or now - last_write >= JOB_PROGRESS_INTERVAL:
+                        self.store.update(job_id, state)
+                        last_write = now
+        except Exception as e:
+            # A failing search fails its job, never the worker thread
+            log_event(logger, logging.ERROR, "job failed", job_id=job_id, error=str(e))
+            self.store.finish(job_id, state, error=str(e))
+            with self._lock:
+                self.failed += 1
+            return
+        self.store.finish(job_id, state)
+        with self._lock:
+            self.completed += 1
+
+    def _loop(self):
+        while True:
+            try:
+                claimed = self.store.claim()
+            except sqlite3.Error as e:
+                log_event(logger, logging.WARNING, "job claim failed", error=str(e))
+                claimed = None
+            if claimed is None:
+                self._wakeup.wait(JOB_POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+            job_id, params = claimed
+            log_event(logger, logging.INFO, "job started", job_id=job_id)
+            self._run_job(job_id, params)
+
+    def _janitor(self):
+        while True:
+            time.sleep(max(JOB_POLL_INTERVAL, 5))
+            try:
+                self.store.expire()
+            except sqlite3.Error as e:
+                log_event(logger, logging.WARNING, "job expiry failed", error=str(e))
+
+    def start(self, handler):
+        """
+        Starts the worker threads; calling it again is a no-op.
+        """
+        with self._lock:
+            if self._threads:
+                return
+            self._handler = handler
+            for i in range(self.workers):
+                self._threads.append(threading.Thread(target=self._loop, name=f"job-worker-{i}", daemon=True))
+            self._threads.append(threading.Thread(target=self._janitor, name="job-janitor", daemon=True))
+            for thread in self._threads:
+                thread.start()
+        log_event(logger, logging.INFO, "job workers started", workers=self.workers, db=self.store.db_path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"workers": self.workers, "completed": self.completed, "failed": self.failed, **self.store.stats()}
+
+
+job_store = JobStore()
+job_workers = JobWorkers(job_store)
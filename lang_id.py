@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Fast on-box language identification for the languages in country_to_language.
+
+Japanese is recognised by script (kana/kanji). Latin-script languages are scored
+by cosine similarity between character trigram profiles, built from the small
+seed texts below, plus a bonus for common function words. Identification only
+returns a language when it is clearly ahead of the runner-up, so callers can use
+it to skip translations that would be no-ops and fall back to the LLM otherwise.
+"""
+import math
+import os
+import re
+from collections import Counter
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LANG_ID_MIN_LETTERS = int(os.getenv("LANG_ID_MIN_LETTERS", "8"))
+LANG_ID_MARGIN = float(os.getenv("LANG_ID_MARGIN", "0.08"))  # required lead over the second-best language
+
+# Codes seen in forms, country mappings and Accept-Language headers -> the code used here
+LANGUAGE_ALIASES = {
+    "jp": "ja",
+    "jpn": "ja",
+    "nb": "no",
+    "nn": "no",
+    "nob": "no",
+    "nor": "no",
+    "eng": "en",
+    "fra": "fr",
+    "fre": "fr",
+    "deu": "de",
+    "ger": "de",
+}
+
+SEED_TEXTS = {
+    "en": (
+        "The police said the tram driver has been charged after the accident in the city centre. "
+        "Four people were injured when the tram left the tracks and crashed into a shop. "
+        "Officials are investigating what happened and the road will remain closed for the rest of the day. "
+        "This is the latest news about the weather, the election and the economy from our reporters."
+    ),
+    "no": (
+        "Politiet sier at trikkeføreren er siktet etter ulykken i sentrum av byen. "
+        "Fire personer ble skadet da trikken sporet av og krasjet inn i en butikk. "
+        "Myndighetene undersøker hva som skjedde, og veien vil være stengt resten av dagen. "
+        "Dette er de siste nyhetene om været, valget og økonomien fra våre journalister i Norge."
+    ),
+    "fr": (
+        "La police a déclaré que le conducteur du tramway a été mis en examen après l'accident dans le centre-ville. "
+        "Quatre personnes ont été blessées lorsque le tramway a déraillé et s'est écrasé dans un magasin. "
+        "Les autorités enquêtent sur ce qui s'est passé et la route restera fermée pour le reste de la journée. "
+        "Voici les dernières nouvelles sur la météo, les élections et l'économie de nos journalistes."
+    ),
+    "de": (
+        "Die Polizei sagte, dass der Straßenbahnfahrer nach dem Unfall in der Innenstadt angeklagt wurde. "
+        "Vier Personen wurden verletzt, als die Straßenbahn entgleiste und in ein Geschäft krachte. "
+        "Die Behörden untersuchen, was passiert ist, und die Straße bleibt für den Rest des Tages gesperrt. "
+        "Das sind die neuesten Nachrichten über das Wetter, die Wahl und die Wirtschaft von unseren Reportern."
+    ),
+}
+
+FUNCTION_WORDS = {
+    "en": {"the", "and", "of", "in", "is", "to", "for", "with", "on", "what", "how", "news", "after"},
+    "no": {"og", "i", "er", "på", "det", "som", "en", "til", "av", "med", "etter", "hva", "ikke", "har"},
+    "fr": {"le", "la", "les", "et", "des", "du", "un", "une", "est", "dans", "pour", "sur", "après"},
+    "de": {"der", "die", "das", "und", "ist", "in", "mit", "von", "nach", "den", "ein", "eine", "im"},
+}
+
+_JAPANESE = re.compile(r"[぀-ヿ一-鿿ｦ-ﾟ]")
+_LETTERS = re.compile(r"[^\W\d_]+")
+
+
+def normalize_lang(code: str) -> str:
+    """
+    Maps language codes and locales ("jp", "nb", "en-US") onto the codes lang_id reports.
+    """
+    code = (code or "").strip().lower().replace("_", "-").split("-")[0]
+    return LANGUAGE_ALIASES.get(code, code)
+
+
+def _trigrams(text: str) -> Counter:
+    grams = Counter()
+    for word in _LETTERS.findall(text.lower()):
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            grams[padded[i:i + 3]] += 1
+    return grams
+
+
+def _cosine(a: Counter, b: Counter, b_norm: float) -> float:
+    dot = sum(count * b.get(gram, 0) for gram, count in a.items())
+    a_norm = math.sqrt(sum(count * count for count in a.values()))
+    return dot / (a_norm * b_norm) if a_norm and b_norm else 0.0
+
+
+_PROFILES = {lang: _trigrams(text) for lang, text in SEED_TEXTS.items()}
+_PROFILE_NORMS = {
+    lang: math.sqrt(sum(count * count for count in profile.values())) for lang, profile in _PROFILES.items()
+}
+
+SUPPORTED_LANGUAGES = frozenset(_PROFILES) | {"ja"}
+
+
+def language_scores(text: str) -> dict:
+    """
+    Returns {lang: score} for the Latin-script languages; higher is more likely.
+    """
+    grams = _trigrams(text)
+    words = [word for word in _LETTERS.findall(text.lower())]
+    scores = {}
+    for lang, profile in _PROFILES.items():
+        score = _cosine(grams, profile, _PROFILE_NORMS[lang])
+        if words:
+            score += 0.5 * sum(word in FUNCTION_WORDS[lang] for word in words) / len(words)
+        scores[lang] = score
+    return scores
+
+
+def detect_language(text: str):
+    """
+    Returns the detected language code, or None when the text is too short or ambiguous.
+    """
+    letters = "".join(_LETTERS.findall(text))
+    if not letters:
+        return None
+    if len(_JAPANESE.findall(letters)) / len(letters) > 0.3:
+        return "ja"
+    if len(letters) < LANG_ID_MIN_LETTERS:
+        return None
+    ranked = sorted(language_scores(text).items(), key=lambda item: item[1], reverse=True)
+    (best, best_score), (_, second_score) = ranked[0], ranked[1]
+    if best_score - second_score < LANG_ID_MARGIN:
+        return None
+    return best
+
+
+def is_language(text: str, target_lang: str) -> bool:
+    """
+    True only when text is confidently identified as target_lang; unsupported targets are never matched.
+    """
+    target = normalize_lang(target_lang)
+    if target not in SUPPORTED_LANGUAGES:
+        return False
+    return detect_language(text) == target
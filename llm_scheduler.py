@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Priority-aware admission in front of the Llama API.
+
+At most LLM_MAX_CONCURRENCY generations are in flight at once. Waiting calls are
+served by priority (query translation before snippet translation before summary)
+and FIFO within a priority. Each priority has a bounded queue; callers beyond it
+are rejected immediately instead of piling up behind Ollama, and queued callers
+give up when their request's deadline (deadline.py) passes.
+
+AsyncLLMScheduler applies the same policy to coroutines on one event loop.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from dotenv import load_dotenv
+
+import deadline
+
+load_dotenv()
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_QUEUE_LIMIT = int(os.getenv("LLM_QUEUE_LIMIT", "64"))  # waiting calls allowed per priority
+
+# Lower value is served first
+PRIORITY_QUERY_TRANSLATION = 0
+PRIORITY_SNIPPET_TRANSLATION = 1
+PRIORITY_SUMMARY = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_QUERY_TRANSLATION: "query_translation",
+    PRIORITY_SNIPPET_TRANSLATION: "snippet_translation",
+    PRIORITY_SUMMARY: "summary",
+}
+
+
+class SchedulerQueueFull(Exception):
+    """Raised when the queue for a priority already holds LLM_QUEUE_LIMIT waiting calls."""
+
+
+class SchedulerTimeout(SchedulerQueueFull):
+    """Raised when the request's deadline passes while the call is still waiting for a slot."""
+
+
+class LLMScheduler:
+    """
+    A priority semaphore with bounded per-priority queues and queue-wait accounting.
+    """
+
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, queue_limit=LLM_QUEUE_LIMIT):
+        self.max_concurrency = max_concurrency
+        self.queue_limit = queue_limit
+        self._cond = threading.Condition()
+        self._active = 0
+        self._heap = []  # (priority, seq)
+        self._queued = {priority: 0 for priority in PRIORITY_NAMES}
+        self._seq = itertools.count()
+        self._calls = {priority: 0 for priority in PRIORITY_NAMES}
+        self._wait_total = {priority: 0.0 for priority in PRIORITY_NAMES}
+        self._wait_max = {priority: 0.0 for priority in PRIORITY_NAMES}
+        self.rejected = 0
+        self.timed_out = 0
+
+    def _check_deadline(self, priority: int):
+        # Called with the lock held
+        if deadline.expired():
+            self.timed_out += 1
+            raise SchedulerTimeout(f"Request deadline exceeded before a {PRIORITY_NAMES[priority]} slot was free")
+
+    def acquire(self, priority: int) -> float:
+        """
+        Blocks until a generation slot is free for this priority and returns the seconds spent queued.
+        Raises SchedulerTimeout if the current request's deadline passes first.
+        """
+        start = time.perf_counter()
+        with self._cond:
+            self._check_deadline(priority)
+            if self._active < self.max_concurrency and not self._heap:
+                self._active += 1
+            else:
+                if self._queued[priority] >= self.queue_limit:
+                    self.rejected += 1
+                    raise SchedulerQueueFull(f"{PRIORITY_NAMES[priority]} queue is full")
+                ticket = (priority, next(self._seq))
+                heapq.heappush(self._heap, ticket)
+                self._queued[priority] += 1
+                while self._heap[0] != ticket or self._active >= self.max_concurrency:
+                    try:
+                        self._check_deadline(priority)
+                    except SchedulerTimeout:
+                        self._heap.remove(ticket)
+                        heapq.heapify(self._heap)
+                        self._queued[priority] -= 1
+                        # The ticket behind ours may be at the head now
+                        self._cond.notify_all()
+                        raise
+                    self._cond.wait(deadline.remaining())
+                heapq.heappop(self._heap)
+                self._queued[priority] -= 1
+                self._active += 1
+                # The next ticket may also fit if several slots were released at once
+                self._cond.notify_all()
+            waited = time.perf_counter() - start
+            self._record_wait(priority, waited)
+        return waited
+
+    def try_acquire(self) -> bool:
+        """
+        Takes a slot only if one is free and nobody is queued for it; never waits.
+        """
+        with self._cond:
+            if self._active < self.max_concurrency and not self._heap:
+                self._active += 1
+                return True
+            return False
+
+    def _record_wait(self, priority: int, waited: float):
+        self._calls[priority] += 1
+        self._wait_total[priority] += waited
+        self._wait_max[priority] = max(self._wait_max[priority], waited)
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    @property
+    def busy(self) -> bool:
+        """
+        True while every slot is taken or calls are queued; background work should hold off.
+        """
+        with self._cond:
+            return self._active >= self.max_concurrency or bool(self._heap)
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Calls currently waiting for a slot, across all priorities.
+        """
+        with self._cond:
+            return len(self._heap)
+
+    @contextmanager
+    def slot(self, priority: int):
+        waited = self.acquire(priority)
+        try:
+            yield waited
+        finally:
+            self.release()
+
+    @contextmanager
+    def spare_slot(self, priority: int):
+        """
+        slot() for optional extra work such as hedged calls: raises SchedulerQueueFull at once
+        instead of queueing when no slot is idle. Usable from coroutines too.
+        """
+        if not self.try_acquire():
+            raise SchedulerQueueFull(f"no idle slot for an extra {PRIORITY_NAMES[priority]} call")
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "active": self._active,
+                "max_concurrency": self.max_concurrency,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "priorities": {
+                    name: {
+                        "queued": self._queued[priority],
+                        "calls": self._calls[priority],
+                        "avg_wait_seconds": self._wait_total[priority] / self._calls[priority]
+                        if self._calls[priority] else 0.0,
+                        "max_wait_seconds": self._wait_max[priority]
+                    }
+                    for priority, name in PRIORITY_NAMES.items()
+                }
+            }
+
+
+class AsyncLLMScheduler(LLMScheduler):
+    """
+    LLMScheduler for coroutines: queued calls wait on futures instead of blocking threads.
+    Must only be used from a single event loop.
+    """
+
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, queue_limit=LLM_QUEUE_LIMIT):
+        super().__init__(max_concurrency, queue_limit)
+        self._waiters = {}  # (priority, seq) -> Future
+
+    def _grant(self):
+        # Hands free slots to the waiting tickets in priority order; called with the lock held
+        while self._heap and self._active < self.max_concurrency:
+            ticket = heapq.heappop(self._heap)
+            self._queued[ticket[0]] -= 1
+            waiter = self._waiters.pop(ticket)
+            if waiter.cancelled():
+                # Its caller gave up before acquire() could withdraw the ticket
+                continue
+            self._active += 1
+            waiter.set_result(None)
+
+    async def acquire(self, priority: int) -> float:
+        """
+        Waits until a generation slot is free for this priority and returns the seconds spent queued.
+        Raises SchedulerTimeout if the current request's deadline passes first.
+        """
+        start = time.perf_counter()
+        with self._cond:
+            self._check_deadline(priority)
+            if self._active < self.max_concurrency and not self._heap:
+                self._active += 1
+                waiter = None
+            else:
+                if self._queued[priority] >= self.queue_limit:
+                    self.rejected += 1
+                    raise SchedulerQueueFull(f"{PRIORITY_NAMES[priority]} queue is full")
+                ticket = (priority, next(self._seq))
+                heapq.heappush(self._heap, ticket)
+                self._queued[priority] += 1
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters[ticket] = waiter
+        if waiter is not None:
+            try:
+                # wait_for cancels the waiter when the deadline passes
+                await asyncio.wait_for(waiter, deadline.remaining())
+            except (asyncio.CancelledError, asyncio.TimeoutError) as e:
+                with self._cond:
+                    if waiter.done() and not waiter.cancelled():
+                        # The slot was granted just as the caller went away; pass it on
+                        self._active -= 1
+                        self._grant()
+                    elif ticket in self._waiters:
+                        del self._waiters[ticket]
+                        self._heap.remove(ticket)
+                        heapq.heapify(self._heap)
+                        self._queued[priority] -= 1
+                    if isinstance(e, asyncio.TimeoutError):
+                        self.timed_out += 1
+                        raise SchedulerTimeout(
+                            f"Request deadline exceeded before a {PRIORITY_NAMES[priority]} slot was free"
+                        ) from None
+                raise
+        waited = time.perf_counter() - start
+        with self._cond:
+            self._record_wait(priority, waited)
+        return waited
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._grant()
+
+    @asynccontextmanager
+    async def slot(self, priority: int):
+        waited = await self.acquire(priority)
+        try:
+            yield waited
+        finally:
+            self.release()
+
+
+llm_scheduler = LLMScheduler()
+async_llm_scheduler = AsyncLLMScheduler()
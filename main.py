@@ -1,235 +1,65 @@
 #!/usr/bin/env python3
+import functools
+import logging
 import os
-import re
 #Why do we fall sir?
 #So that we can learn to pick ourselves up :)
-import requests
-from bs4 import BeautifulSoup
 from dotenv import load_dotenv
-from flask import Flask, request, render_template
+from flask import Flask, Response, request, render_template, jsonify, make_response
+
+import deadline
+import image_proxy
+from admission import admission_control, client_id
+from circuit_breaker import circuit_breakers
+from hedging import hedger
+from llm_scheduler import llm_scheduler
+from observability import get_logger, log_event, log_payload, metrics, server_timing_header
+from ollama_pool import ollama_pool
+from search_cache import search_cache
+from search_service import (
+    DEFAULT_COUNTRY, DEFAULT_SUMMARY_LANG, STATIC_RESULTS, SearchService, language_for, supported_countries
+)
+from semantic_cache import semantic_cache
+from single_flight import llama_flight, search_flight
+from token_budget import token_stats
+from translation_cache import translation_cache
+from trending import trending_queries
+from warmup import model_warmup
 
 # Load environment variables from .env file
 load_dotenv()
 
+logger = get_logger("main")
+
 USE_STATIC_RESULTS = os.getenv("USE_STATIC_RESULTS", "False").lower() in ("true", "1", "t")
 
-# Core configuration (overridable via environment variables)
-API_KEY = os.getenv("API_KEY")
-SEARCH_ENGINE_ID = os.getenv("SEARCH_ENGINE_ID")
-LLAMA_API_URL = os.getenv("LLAMA_API_URL", "http://localhost:11434/api/generate")
-LLAMA_MODEL = os.getenv("LLAMA_MODEL", "llama3.3:70b")
-DEFAULT_LANG = os.getenv("DEFAULT_LANG", "en")  # fallback language if country not found
-DEFAULT_COUNTRY = os.getenv("DEFAULT_COUNTRY", "no")
-GOOGLE_SEARCH_API_URL = os.getenv("GOOGLE_SEARCH_API_URL", "https://www.googleapis.com/customsearch/v1")
-BS_PARSER = os.getenv("BS_PARSER", "html.parser")
-BS_TAGS_TO_REMOVE = os.getenv("BS_TAGS_TO_REMOVE", "script,style,noscript").split(',')
-TEXT_SEPARATOR = os.getenv("TEXT_SEPARATOR", "\n")
-MAX_TEXT_LENGTH = int(os.getenv("MAX_TEXT_LENGTH", "1000"))
 TEMPLATE_INDEX = os.getenv("TEMPLATE_INDEX", "index.html")
-REQUEST_TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", "5"))
 FLASK_DEBUG = os.getenv("FLASK_DEBUG", "True").lower() in ("true", "1", "t")
 
-# New form field and default for summary language
+# New form field for summary language
 FORM_SUMMARY_LANG_KEY = os.getenv("FORM_SUMMARY_LANG_KEY", "summary_lang")
-DEFAULT_SUMMARY_LANG = os.getenv("DEFAULT_SUMMARY_LANG", DEFAULT_LANG)
-
-# Prompt templates (customizable)
-TRANSLATION_PROMPT_TEMPLATE = os.getenv(
-    "TRANSLATION_PROMPT_TEMPLATE",
-    "Translate the following text into {target_lang}. ONLY output the translated text:\n\n{text}\n\nTranslation:"
-)
-SUMMARY_PROMPT_TEMPLATE = os.getenv(
-    "SUMMARY_PROMPT_TEMPLATE",
-    "Summarize the following in {summary_lang}:\n\n{text}\n\nSummary:"
-)
 
 # Form field key for the query and country (language selection removed)
 FORM_QUERY_KEY = os.getenv("FORM_QUERY_KEY", "query")
 FORM_COUNTRY_KEY = os.getenv("FORM_COUNTRY_KEY", "country")
+FORM_COMPARE_KEY = os.getenv("FORM_COMPARE_KEY", "compare")  # extra countries for multi-country mode
 ROUTE_INDEX = os.getenv("ROUTE_INDEX", "/")
 
 app = Flask(__name__)
 
-# Supported countries for the dropdown menu
-supported_countries = [
-    {"code": "us", "name": "United States"},
-    {"code": "no", "name": "Norway"},
-    {"code": "jp", "name": "Japan"},
-    {"code": "fr", "name": "France"},
-    {"code": "de", "name": "Germany"}
-]
-
-# Mapping from country code to language code
-country_to_language = {
-    "us": "en",
-    "no": "no",  # Norwegian
-    "jp": "jp",  # Japanese (adjust if you need "ja")
-    "fr": "fr",
-    "de": "de"
-}
-
-
-def call_llama(prompt: str) -> str:
-    """
-    Calls the Llama model via a local API.
-    """
-    print("DEBUG: Calling Llama with prompt:")
-    print(prompt)
-    payload = {
-        "model": LLAMA_MODEL,
-        "prompt": prompt,
-        "stream": False
-    }
-    try:
-        response = requests.post(LLAMA_API_URL, json=payload)
-        response.raise_for_status()
-        result_json = response.json()
-        llama_response = result_json.get("response", "Error: No response from Llama")
-        print("DEBUG: Received response from Llama:")
-        print(llama_response)
-        return llama_response
-    except requests.RequestException as e:
-        error_msg = f"Error calling Llama: {e}"
-        print("DEBUG:", error_msg)
-        return error_msg
-
-
-def llama_translate(text: str, target_lang: str) -> str:
-    """
-    Uses Llama to translate text into the target language.
-    """
-    print("DEBUG: Translating text:")
-    print(text)
-    print(f"DEBUG: Target language: {target_lang}")
-    prompt = TRANSLATION_PROMPT_TEMPLATE.format(target_lang=target_lang, text=text)
-    print("DEBUG: Translation prompt being sent to Llama:")
-    print(prompt)
-    translation = call_llama(prompt)
-    print("DEBUG: Translation result:")
-    print(translation)
-    return translation
-
-
-def google_search(query, gl=DEFAULT_COUNTRY, hl=DEFAULT_LANG):
-    """
-    Calls Google Custom Search API with location and language-based filtering.
-    If USE_STATIC_RESULTS is True, return the static (pre-defined) results.
-    """
-    if USE_STATIC_RESULTS:
-        print("DEBUG: Returning static search results.")
-        static_results = [
-            {
-                "title": "Trikk krasjet i Oslo: Føreren er siktet",
-                "snippet": "Resultat fra VG: Trikk krasjet i Oslo med siktet fører. Fire skadde.",
-                "link": "https://www.vg.no/nyheter/i/vgxjaX/trikk-krasjet-i-butikk-i-oslo-trikkefoereren-er-siktet",
-                "image_url": "https://www.vg.no/images/2024/10/29/Trikk-krasjet-i-butikk-i-Oslo.jpg"
-            },
-            {
-                "title": "Trikk, Ulykke | Trikk krasjet inn i Eplehuset i Storgata",
-                "snippet": "Resultat fra ao.no: Trikk krasjet inn i Eplehuset i Storgata.",
-                "link": "https://www.ao.no/trikki-butikk-i-storgata/s/5-128-914143",
-                "image_url": "https://www.vg.no/images/2024/10/29/Trikk-krasjet-i-butikk-i-Oslo.jpg"
-            },
-            {
-                "title": "Trikkeulykken i Oslo henlegges – Stor-Oslo",
-                "snippet": "Resultat fra NRK: Trikkeulykken i Oslo henlegges.",
-                "link": "https://www.nrk.no/stor-oslo/trikkeulykken-i-oslo-henlegges-1.17178415",
-                "image_url": "https://www.vg.no/images/2024/10/29/Trikk-krasjet-i-butikk-i-Oslo.jpg"
-            },
-            {
-                "title": "Oslo trikkulykke. Mannen ble hardt skadet",
-                "snippet": "Resultat fra Wataha: Oslo trikkulykke med hardt skadet mann.",
-                "link": "https://wataha.no/no/2021/10/05/oslo-wypadek-tramwajowy-mezczyzna-ciezko-ranny/",
-                "image_url": "https://www.vg.no/images/2024/10/29/Trikk-krasjet-i-butikk-i-Oslo.jpg"
-            },
-            {
-                "title": "Trikkeulykken i Storgata – Stor-Oslo",
-                "snippet": "Resultat fra NRK: Trikkeulykken i Storgata.",
-                "link": "https://www.nrk.no/stor-oslo/trikkeulykken-i-storgata-1.17104779",
-                "image_url": "https://www.vg.no/images/2024/10/29/Trikk-krasjet-i-butikk-i-Oslo.jpg"
-            },
-            {
-                "title": "Trikk, Ulykke | Person påkjørt av trikk i Oslo",
-                "snippet": "Resultat fra Nettavisen: Person påkjørt av trikk i Oslo.",
-                "link": "https://www.nettavisen.no/nyheter/person-pakjort-av-trikk-i-oslo/s/12-95-3423942827",
-                "image_url": "https://www.vg.no/images/2024/10/29/Trikk-krasjet-i-butikk-i-Oslo.jpg"
-            },
-            {
-                "title": "Trikk sporet av og krasjet inn i butikk i Oslo sentrum: Fire personer ...",
-                "snippet": "Resultat fra Inyheter: Trikk sporet av og krasjet inn i butikk i Oslo sentrum.",
-                "link": "https://inyheter.no/29/10/2024/trikk-sporet-av-og-krasjet-inn-i-butikk-i-oslo-sentrum-fire-personer-skadet/",
-                "image_url": "https://www.vg.no/images/2024/10/29/Trikk-krasjet-i-butikk-i-Oslo.jpg"
-            },
-            {
-                "title": "Trikkeulykken i Storgata – Wikipedia",
-                "snippet": "Resultat fra Wikipedia: Informasjon om trikkeulykken i Storgata.",
-                "link": "https://no.wikipedia.org/wiki/Trikkeulykken_i_Storgata",
-                "image_url": "https://www.vg.no/images/2024/10/29/Trikk-krasjet-i-butikk-i-Oslo.jpg"
-            },
-            {
-                "title": "Avisa Oslo | Den lille taco-trucken i Schweigaards gate blir omfavnet ...",
-                "snippet": "Resultat fra Instagram: Den lille taco-trucken i Schweigaards gate.",
-                "link": "https://www.instagram.com/avisaoslo/reel/C-MtkbRo80h/",
-                "image_url": "https://www.vg.no/images/2024/10/29/Trikk-krasjet-i-butikk-i-Oslo.jpg"
-            },
-            {
-                "title": "Trikkeulykken i Oslo: Politiet henlegger saken: - Glad det ikke gikk ...",
-                "snippet": "Resultat fra TV2: Politiet henlegger saken etter trikkulykke.",
-                "link": "https://www.tv2.no/nyheter/politiet-henlegger-saken-glad-det-ikke-gikk-verre/17300477/",
-                "image_url": "https://www.vg.no/images/2024/10/29/Trikk-krasjet-i-butikk-i-Oslo.jpg"
-            },
-        ]
-        return static_results
+# Search and Llama calls, see search_service.py
+search_service = SearchService(static_results=STATIC_RESULTS if USE_STATIC_RESULTS else None)
 
-    print("DEBUG: Performing Google search.")
-    print(f"DEBUG: Query: {query}")
-    print(f"DEBUG: Country (gl): {gl}")
-    print(f"DEBUG: Language (hl): {hl}")
-    url = GOOGLE_SEARCH_API_URL
-    params = {
-        "key": API_KEY,
-        "cx": SEARCH_ENGINE_ID,
-        "q": query,
-        "gl": gl,
-        "hl": hl
-    }
-    try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        results = response.json()
-        if "error" in results:
-            print("DEBUG: Google API Error:", results["error"])
-            return []
-        # Return only the top 10 results
-        items = results.get("items", [])[:10]
-        print("DEBUG: Google search results fetched:")
-        for i, item in enumerate(items, start=1):
-            print(f"DEBUG: Result {i}: Title: {item.get('title')}, Link: {item.get('link')}")
-        return items
-    except requests.RequestException as e:
-        print("DEBUG: Google API Exception:", e)
-        return []
 
-
-def get_webpage_text(url: str) -> str:
+def start_background_services():
     """
-    Fetches webpage content and extracts text.
+    Starts this process's background threads: model warm-up and the trending refresher. Called from
+    __main__; under a WSGI server call it from a worker start-up hook (gunicorn's post_worker_init).
     """
-    print(f"DEBUG: Fetching webpage text from URL: {url}")
-    try:
-        resp = requests.get(url, timeout=REQUEST_TIMEOUT)
-        resp.raise_for_status()
-        soup = BeautifulSoup(resp.text, BS_PARSER)
-        for tag in soup(BS_TAGS_TO_REMOVE):
-            tag.decompose()
-        webpage_text = soup.get_text(separator=TEXT_SEPARATOR)[:MAX_TEXT_LENGTH]
-        print("DEBUG: Extracted webpage text:")
-        print(webpage_text)
-        return webpage_text
-    except requests.RequestException as e:
-        error_msg = f"Error fetching {url}: {e}"
-        print("DEBUG:", error_msg)
-        return ""
+    model_warmup.start()
+    trending_queries.start(
+        functools.partial(search_service.search_pipeline, fresh=True), busy=lambda: llm_scheduler.busy
+    )
 
 
 @app.route(ROUTE_INDEX, methods=["GET", "POST"])
@@ -239,105 +69,141 @@ def index():
     summary = ""
     query = ""
     selected_country = DEFAULT_COUNTRY
+    compare_countries = []
     summary_lang = DEFAULT_SUMMARY_LANG  # default summary language
+    timings = {}
+    notice = ""
+    decision = None
 
     if request.method == "POST":
         query = request.form.get(FORM_QUERY_KEY, "")
         selected_country = request.form.get(FORM_COUNTRY_KEY, DEFAULT_COUNTRY)
+        compare_countries = request.form.getlist(FORM_COMPARE_KEY)
         summary_lang = request.form.get(FORM_SUMMARY_LANG_KEY, DEFAULT_SUMMARY_LANG)
-
-        print("DEBUG: Received form submission.")
-        print(f"DEBUG: User entered query: {query}")
-        print(f"DEBUG: User selected country: {selected_country}")
-        print(f"DEBUG: User selected summary language: {summary_lang}")
+        countries = list(dict.fromkeys([selected_country] + compare_countries))
 
         # Determine the language for searching based on the selected country
-        comm_lang = country_to_language.get(selected_country, DEFAULT_LANG)
-        print(f"DEBUG: Determined search translation language: {comm_lang}")
-
-        if query:
-            # Translate the query into the country's language for search purposes
-            print("DEBUG: Translating the query...")
-            translated_query = llama_translate(query, comm_lang)
-            print("DEBUG: Translated query:")
-            print(translated_query)
-
-            # Call Google Search API with the translated query
-            print("DEBUG: Calling Google Search API with the translated query...")
-            search_results = google_search(translated_query, gl=selected_country, hl=comm_lang)
-            results = []
-            articles = {}
-            for result in search_results:
-                title = result.get("title")
-                snippet = result.get("snippet")
-                link = result.get("link")
-                # Try to get an image from the result (if available)
-                image_url = None
-                pagemap = result.get("pagemap", {})
-                if "cse_image" in pagemap:
-                    images = pagemap.get("cse_image")
-                    if images and isinstance(images, list):
-                        image_url = images[0].get("src")
-                results.append({
-                    "title": title,
-                    "snippet": snippet,
-                    "link": link,
-                    "image_url": image_url
-                })
-                if title and snippet:
-                    articles[title] = snippet
-
-            print("DEBUG: Fetched search results. Aggregating text for summarization...")
-            aggregated_text = TEXT_SEPARATOR.join(
-                [f"{i}. {title}: {snippet}" for i, (title, snippet) in enumerate(articles.items(), start=1)]
-            )
-
-
-            print("DEBUG: Aggregated text:")
-            print(aggregated_text)
-
-
-
-            # Translate the aggregated text into the **summary language** (instead of comm_lang)
-            print("DEBUG: Translating aggregated text for summarization...")
-            translated_text = llama_translate(aggregated_text, summary_lang)
-
-            print("DEBUG: Translated aggregated text:")
-            print(translated_text)
-
-            import re #ugly i knowwww
-
-            pattern = re.compile(r'\d+\.\s(.*?):\s(.*)')
-            parsed_data = []
-            for match in pattern.finditer(translated_text):
-                parsed_data.append((match.group(1).strip(), match.group(2).strip()))
-
-            for i, (title, snippet) in enumerate(parsed_data):
-                results[i]["title"] = title
-                results[i]["snippet"] = snippet
-
-            print('results: ', results)
-            # print(5/0)
-
-            # Build the summary prompt using the summary language
-            summary_prompt = SUMMARY_PROMPT_TEMPLATE.format(summary_lang=summary_lang, text=translated_text)
-            print("DEBUG: Summary prompt being sent to Llama:")
-            print(summary_prompt)
-            summary = call_llama(summary_prompt)
-            print("DEBUG: Final summary:")
-            print(summary)
-
-    return render_template(
+        comm_lang = language_for(selected_country)
+        log_event(
+            logger, logging.INFO, "search request",
+            query=query, country=selected_country, comm_lang=comm_lang, summary_lang=summary_lang
+        )
+
+        # Overloaded or rate-limited requests are refused before any work starts
+        decision = admission_control.admit(
+            client_id(request.remote_addr, request.headers.get("X-Forwarded-For"))
+        ) if query else None
+
+        if decision is not None and decision.degraded and len(countries) > 1:
+            # A fan-out multiplies the generations; as in the API, there is no cheaper form of it to fall back to
+            decision = admission_control.refuse(decision)
+        if decision is not None and not decision.admitted:
+            notice = decision.error()["error"]
+        elif decision is not None and decision.degraded:
+            notice = "The service is busy: showing untranslated results without a summary."
+            with deadline.scope(), admission_control.running(decision):
+                results, timings = search_service.degraded_search(query, selected_country)
+            metrics.observe_stages(timings)
+        elif query and len(countries) > 1:
+            # One translation per language, all countries searched in parallel, one sectioned summary
+            with deadline.scope(), admission_control.running(decision):
+                results_by_country, summary, timings = search_service.multi_country_pipeline(
+                    query, countries, summary_lang
+                )
+            results = [
+                dict(result, country=country)
+                for country, country_results in results_by_country.items()
+                for result in country_results
+            ]
+            metrics.observe_stages(timings)
+        elif query:
+            # Hot queries are answered from the trending refresher's precomputed results and
+            # near-duplicates of an already answered query from the semantic cache
+            with deadline.scope(), admission_control.running(decision):
+                results, summary, timings = trending_queries.search(
+                    query, selected_country, summary_lang,
+                    lambda: semantic_cache.search(
+                        query, (selected_country, summary_lang),
+                        lambda: search_service.search_pipeline(query, selected_country, summary_lang)
+                    )
+                )
+            metrics.observe_stages(timings)
+            log_payload(logger, "final summary", summary, query=query)
+
+    response = make_response(render_template(
         TEMPLATE_INDEX,
-        results=results,
+        results=image_proxy.proxy_results(results),
         summary=summary,
         query=query,
         selected_country=selected_country,
+        compare_countries=compare_countries,
         summary_lang=summary_lang,  # pass it to the template so the drop-down can persist the choice
-        supported_countries=supported_countries
-    )
+        supported_countries=supported_countries,
+        notice=notice
+    ))
+    if decision is not None and not decision.admitted:
+        response.status_code = decision.status
+        response.headers.update(decision.headers())
+    if timings:
+        response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    """
+    Readiness probe: 503 until every configured model has been loaded on a backend.
+    """
+    # A no-op once started; WSGI workers run without start_background_services warm up on the first probe
+    model_warmup.start()
+    status = model_warmup.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+
+@app.route(image_proxy.IMAGE_PROXY_ROUTE, methods=["GET"])
+def image_proxy_endpoint():
+    """
+    Serves the cached thumbnail for a signed result image link (see image_proxy.proxy_url).
+    """
+    url = request.args.get("url", "")
+    if not image_proxy.verify(url, request.args.get("sig", "")):
+        return jsonify({"error": "Invalid image link"}), 403
+    thumbnail = image_proxy.get_thumbnail(url)
+    if thumbnail is None:
+        return jsonify({"error": "Image unavailable"}), 502
+    return Response(thumbnail, mimetype=image_proxy.THUMBNAIL_MIMETYPE, headers=image_proxy.cache_headers())
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """
+    Stage latency histograms and upstream error counters in the Prometheus text format.
+    """
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/api/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify({
+        "translation": translation_cache.stats(),
+        "search": search_cache.stats(),
+        "semantic": semantic_cache.stats(),
+        "coalescing": {
+            "llama": llama_flight.stats(),
+            "search": search_flight.stats()
+        },
+        "llm_scheduler": llm_scheduler.stats(),
+        "llama_backends": ollama_pool.stats(),
+        "tokens": token_stats.stats(),
+        "images": image_proxy.thumbnail_cache.stats(),
+        "trending": trending_queries.stats(),
+        "admission": admission_control.stats(),
+        "circuit_breakers": circuit_breakers.stats(),
+        "hedging": hedger.stats()
+    })
 
 
 if __name__ == "__main__":
-    print("DEBUG: Starting Flask app.")
+    start_background_services()
+    log_event(logger, logging.INFO, "starting Flask app")
     app.run(debug=FLASK_DEBUG)
@@ -1,236 +1,111 @@
 #!/usr/bin/env python3
+import functools
+import logging
 import os
-import re
-import requests
-from bs4 import BeautifulSoup
+import sys
+import threading
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context, url_for
 from flask_cors import CORS
 
+# Shared modules live at the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import deadline
+import image_proxy
+from admission import admission_control, client_id
+from circuit_breaker import circuit_breakers
+from hedging import hedger
+from jobs import STATUS_QUEUED, JobQueueFull, job_store, job_workers
+from llm_scheduler import llm_scheduler
+from observability import get_logger, log_event, log_payload, metrics, server_timing_header
+from ollama_pool import ollama_pool
+from pipeline import format_sse
+from search_cache import search_cache
+from search_service import DEFAULT_COUNTRY, DEFAULT_SUMMARY_LANG, STATIC_RESULTS, SearchService, language_for
+from semantic_cache import semantic_cache
+from single_flight import llama_flight, search_flight
+from token_budget import token_stats
+from translation_cache import translation_cache
+from trending import trending_queries
+from warmup import model_warmup
+
 app = Flask(__name__)
 CORS(app)  # Allow frontend requests
 
 # Load environment variables from .env file
 load_dotenv()
 
+logger = get_logger("api")
+
 USE_STATIC_RESULTS = os.getenv("USE_STATIC_RESULTS", "True").lower() in ("true", "1", "t")
 
-# Core configuration (overridable via environment variables)
-API_KEY = os.getenv("API_KEY")
-SEARCH_ENGINE_ID = os.getenv("SEARCH_ENGINE_ID")
-LLAMA_API_URL = os.getenv("LLAMA_API_URL", "http://localhost:11434/api/generate")
-LLAMA_MODEL = os.getenv("LLAMA_MODEL", "llama3.3:70b")
-DEFAULT_LANG = os.getenv("DEFAULT_LANG", "en")  # fallback language if country not found
-DEFAULT_COUNTRY = os.getenv("DEFAULT_COUNTRY", "no")
-GOOGLE_SEARCH_API_URL = os.getenv("GOOGLE_SEARCH_API_URL", "https://www.googleapis.com/customsearch/v1")
-BS_PARSER = os.getenv("BS_PARSER", "html.parser")
-BS_TAGS_TO_REMOVE = os.getenv("BS_TAGS_TO_REMOVE", "script,style,noscript").split(',')
-TEXT_SEPARATOR = os.getenv("TEXT_SEPARATOR", "\n")
-MAX_TEXT_LENGTH = int(os.getenv("MAX_TEXT_LENGTH", "1000"))
-REQUEST_TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", "5"))
 FLASK_DEBUG = os.getenv("FLASK_DEBUG", "True").lower() in ("true", "1", "t")
 
-# New form field and default for summary language
+# New form field for summary language
 FORM_SUMMARY_LANG_KEY = os.getenv("FORM_SUMMARY_LANG_KEY", "summary_lang")
-DEFAULT_SUMMARY_LANG = os.getenv("DEFAULT_SUMMARY_LANG", DEFAULT_LANG)
-
-# Prompt templates (customizable)
-TRANSLATION_PROMPT_TEMPLATE = os.getenv(
-    "TRANSLATION_PROMPT_TEMPLATE",
-    "Translate the following text into {target_lang}. ONLY output the translated text:\n\n{text}\n\nTranslation:"
-)
-SUMMARY_PROMPT_TEMPLATE = os.getenv(
-    "SUMMARY_PROMPT_TEMPLATE",
-    "Summarize the following in {summary_lang}:\n\n{text}\n\nSummary:"
-)
 
 # Form field keys for the query and country
 FORM_QUERY_KEY = os.getenv("FORM_QUERY_KEY", "query")
 FORM_COUNTRY_KEY = os.getenv("FORM_COUNTRY_KEY", "country")
+FORM_COUNTRIES_KEY = os.getenv("FORM_COUNTRIES_KEY", "countries")  # list for multi-country mode
+MAX_FANOUT_COUNTRIES = int(os.getenv("MAX_FANOUT_COUNTRIES", "5"))
+JOB_RETRY_AFTER = int(os.getenv("JOB_RETRY_AFTER", "5"))  # seconds clients wait after a full job queue
 ROUTE_INDEX = os.getenv("ROUTE_INDEX", "/")
 
 app = Flask(__name__)
 
-# Supported countries for the dropdown menu (still useful for the API)
-supported_countries = [
-    {"code": "us", "name": "United States"},
-    {"code": "no", "name": "Norway"},
-    {"code": "jp", "name": "Japan"},
-    {"code": "fr", "name": "France"},
-    {"code": "de", "name": "Germany"}
-]
-
-# Mapping from country code to language code
-country_to_language = {
-    "us": "en",
-    "no": "no",  # Norwegian
-    "jp": "jp",  # Japanese (adjust if you need "ja")
-    "fr": "fr",
-    "de": "de"
-}
-
-
-def call_llama(prompt: str) -> str:
-    """
-    Calls the Llama model via a local API.
-    """
-    print("DEBUG: Calling Llama with prompt:")
-    print(prompt)
-    payload = {
-        "model": LLAMA_MODEL,
-        "prompt": prompt,
-        "stream": False
-    }
-    try:
-        response = requests.post(LLAMA_API_URL, json=payload)
-        response.raise_for_status()
-        result_json = response.json()
-        llama_response = result_json.get("response", "Error: No response from Llama")
-        print("DEBUG: Received response from Llama:")
-        print(llama_response)
-        return llama_response
-    except requests.RequestException as e:
-        error_msg = f"Error calling Llama: {e}"
-        print("DEBUG:", error_msg)
-        return error_msg
-
-
-def llama_translate(text: str, target_lang: str) -> str:
+# Search and Llama calls, see search_service.py
+search_service = SearchService(static_results=STATIC_RESULTS if USE_STATIC_RESULTS else None)
+
+
+def search_job(params):
     """
-    Uses Llama to translate text into the target language.
+    Runs one queued search for the job workers, yielding the same events as /api/search/stream.
+    Trending searches that are already precomputed finish at once.
     """
-    print("DEBUG: Translating text:")
-    print(text)
-    print(f"DEBUG: Target language: {target_lang}")
-    prompt = TRANSLATION_PROMPT_TEMPLATE.format(target_lang=target_lang, text=text)
-    print("DEBUG: Translation prompt being sent to Llama:")
-    print(prompt)
-    translation = call_llama(prompt)
-    print("DEBUG: Translation result:")
-    print(translation)
-    return translation
-
-
-def google_search(query, gl=DEFAULT_COUNTRY, hl=DEFAULT_LANG):
+    query = params["query"]
+    selected_country = params["selected_country"]
+    summary_lang = params["summary_lang"]
+    trending_queries.record(query, selected_country, summary_lang)
+    precomputed = trending_queries.lookup(query, selected_country, summary_lang)
+    if precomputed is not None:
+        results, summary = precomputed
+        yield "translated_results", {"results": results}
+        yield "summary", {"summary": summary}
+        return
+    events = search_service.stream_search_pipeline(query, selected_country, summary_lang)
+    for event, payload in events:
+        if event == "done":
+            metrics.observe_stages(payload["timings"])
+        yield event, payload
+
+
+def start_background_services(web=True):
     """
-    Calls Google Custom Search API with location and language-based filtering.
-    If USE_STATIC_RESULTS is True, return the static (pre-defined) results.
+    Starts this process's background threads: model warm-up and the trending refresher when it
+    serves requests, and the search job workers. Called from __main__; under a WSGI server call it
+    from a worker start-up hook (gunicorn's post_worker_init), never at import.
     """
-    if USE_STATIC_RESULTS:
-        print("DEBUG: Returning static search results.")
-        static_results = [
-            {
-                "title": "Trikk krasjet i Oslo: Føreren er siktet",
-                "snippet": "Resultat fra VG: Trikk krasjet i Oslo med siktet fører. Fire skadde.",
-                "link": "https://www.vg.no/nyheter/i/vgxjaX/trikk-krasjet-i-butikk-i-oslo-trikkefoereren-er-siktet",
-                "image_url": None
-            },
-            {
-                "title": "Trikk, Ulykke | Trikk krasjet inn i Eplehuset i Storgata",
-                "snippet": "Resultat fra ao.no: Trikk krasjet inn i Eplehuset i Storgata.",
-                "link": "https://www.ao.no/trikki-butikk-i-storgata/s/5-128-914143",
-                "image_url": None
-            },
-            {
-                "title": "Trikkeulykken i Oslo henlegges – Stor-Oslo",
-                "snippet": "Resultat fra NRK: Trikkeulykken i Oslo henlegges.",
-                "link": "https://www.nrk.no/stor-oslo/trikkeulykken-i-oslo-henlegges-1.17178415",
-                "image_url": None
-            },
-            {
-                "title": "Oslo trikkulykke. Mannen ble hardt skadet",
-                "snippet": "Resultat fra Wataha: Oslo trikkulykke med hardt skadet mann.",
-                "link": "https://wataha.no/no/2021/10/05/oslo-wypadek-tramwajowy-mezczyzna-ciezko-ranny/",
-                "image_url": None
-            },
-            {
-                "title": "Trikkeulykken i Storgata – Stor-Oslo",
-                "snippet": "Resultat fra NRK: Trikkeulykken i Storgata.",
-                "link": "https://www.nrk.no/stor-oslo/trikkeulykken-i-storgata-1.17104779",
-                "image_url": None
-            },
-            {
-                "title": "Trikk, Ulykke | Person påkjørt av trikk i Oslo",
-                "snippet": "Resultat fra Nettavisen: Person påkjørt av trikk i Oslo.",
-                "link": "https://www.nettavisen.no/nyheter/person-pakjort-av-trikk-i-oslo/s/12-95-3423942827",
-                "image_url": None
-            },
-            {
-                "title": "Trikk sporet av og krasjet inn i butikk i Oslo sentrum: Fire personer ...",
-                "snippet": "Resultat fra Inyheter: Trikk sporet av og krasjet inn i butikk i Oslo sentrum.",
-                "link": "https://inyheter.no/29/10/2024/trikk-sporet-av-og-krasjet-inn-i-butikk-i-oslo-sentrum-fire-personer-skadet/",
-                "image_url": None
-            },
-            {
-                "title": "Trikkeulykken i Storgata – Wikipedia",
-                "snippet": "Resultat fra Wikipedia: Informasjon om trikkeulykken i Storgata.",
-                "link": "https://no.wikipedia.org/wiki/Trikkeulykken_i_Storgata",
-                "image_url": None
-            },
-            {
-                "title": "Avisa Oslo | Den lille taco-trucken i Schweigaards gate blir omfavnet ...",
-                "snippet": "Resultat fra Instagram: Den lille taco-trucken i Schweigaards gate.",
-                "link": "https://www.instagram.com/avisaoslo/reel/C-MtkbRo80h/",
-                "image_url": None
-            },
-            {
-                "title": "Trikkeulykken i Oslo: Politiet henlegger saken: - Glad det ikke gikk ...",
-                "snippet": "Resultat fra TV2: Politiet henlegger saken etter trikkulykke.",
-                "link": "https://www.tv2.no/nyheter/politiet-henlegger-saken-glad-det-ikke-gikk-verre/17300477/",
-                "image_url": None
-            },
-        ]
-        return static_results
-
-    print("DEBUG: Performing Google search.")
-    print(f"DEBUG: Query: {query}")
-    print(f"DEBUG: Country (gl): {gl}")
-    print(f"DEBUG: Language (hl): {hl}")
-    url = GOOGLE_SEARCH_API_URL
-    params = {
-        "key": API_KEY,
-        "cx": SEARCH_ENGINE_ID,
-        "q": query,
-        "gl": gl,
-        "hl": hl
-    }
-    try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        results = response.json()
-        if "error" in results:
-            print("DEBUG: Google API Error:", results["error"])
-            return []
-        # Return only the top 10 results
-        items = results.get("items", [])[:10]
-        print("DEBUG: Google search results fetched:")
-        for i, item in enumerate(items, start=1):
-            print(f"DEBUG: Result {i}: Title: {item.get('title')}, Link: {item.get('link')}")
-        return items
-    except requests.RequestException as e:
-        print("DEBUG: Google API Exception:", e)
-        return []
-
-
-def get_webpage_text(url: str) -> str:
+    if web:
+        model_warmup.start()
+        trending_queries.start(
+            functools.partial(search_service.search_pipeline, fresh=True), busy=lambda: llm_scheduler.busy
+        )
+    job_workers.start(search_job)
+
+
+def admit_search(shed=True):
     """
-    Fetches webpage content and extracts text.
+    Admission control for the current request; see admission.py.
     """
-    print(f"DEBUG: Fetching webpage text from URL: {url}")
-    try:
-        resp = requests.get(url, timeout=REQUEST_TIMEOUT)
-        resp.raise_for_status()
-        soup = BeautifulSoup(resp.text, BS_PARSER)
-        for tag in soup(BS_TAGS_TO_REMOVE):
-            tag.decompose()
-        webpage_text = soup.get_text(separator=TEXT_SEPARATOR)[:MAX_TEXT_LENGTH]
-        print("DEBUG: Extracted webpage text:")
-        print(webpage_text)
-        return webpage_text
-    except requests.RequestException as e:
-        error_msg = f"Error fetching {url}: {e}"
-        print("DEBUG:", error_msg)
-        return ""
+    return admission_control.admit(client_id(request.remote_addr, request.headers.get("X-Forwarded-For")), shed)
+
+
+def shed_response(decision):
+    response = jsonify(decision.error())
+    response.status_code = decision.status
+    response.headers.update(decision.headers())
+    return response
 
 
 @app.route("/api/search", methods=["POST"])
@@ -243,83 +118,275 @@ def api_search():
     query = data.get(FORM_QUERY_KEY, "")
     selected_country = data.get(FORM_COUNTRY_KEY, DEFAULT_COUNTRY)
     summary_lang = data.get(FORM_SUMMARY_LANG_KEY, DEFAULT_SUMMARY_LANG)
+    # Overloaded or rate-limited requests are refused before any work starts
+    decision = admit_search() if query else None
+    if decision is not None and not decision.admitted:
+        return shed_response(decision)
+    if data.get(FORM_COUNTRIES_KEY) is not None:
+        return api_search_countries(query, data[FORM_COUNTRIES_KEY], summary_lang, decision)
     results = []
     summary = ""
 
-    print("DEBUG: Received API JSON request.")
-    print(f"DEBUG: Query: {query}")
-    print(f"DEBUG: Selected country: {selected_country}")
-    print(f"DEBUG: Summary language: {summary_lang}")
+    timings = {}
 
     if query:
-        comm_lang = country_to_language.get(selected_country, DEFAULT_LANG)
-        print(f"DEBUG: Determined search translation language: {comm_lang}")
-
-        # Translate the query
-        translated_query = llama_translate(query, comm_lang)
-        print("DEBUG: Translated query:")
-        print(translated_query)
-
-        # Get search results from Google Search API
-        search_results = google_search(translated_query, gl=selected_country, hl=comm_lang)
-        articles = {}
-        for result in search_results:
-            title = result.get("title")
-            snippet = result.get("snippet")
-            link = result.get("link")
-            image_url = None
-            pagemap = result.get("pagemap", {})
-            if "cse_image" in pagemap:
-                images = pagemap.get("cse_image")
-                if images and isinstance(images, list):
-                    image_url = images[0].get("src")
-            results.append({
-                "title": title,
-                "snippet": snippet,
-                "link": link,
-                "image_url": image_url
-            })
-            if title and snippet:
-                articles[title] = snippet
-
-        aggregated_text = TEXT_SEPARATOR.join(
-            [f"{i}. {title}: {snippet}" for i, (title, snippet) in enumerate(articles.items(), start=1)]
+        comm_lang = language_for(selected_country)
+        log_event(
+            logger, logging.INFO, "search request",
+            query=query, country=selected_country, comm_lang=comm_lang, summary_lang=summary_lang,
+            mode=decision.mode
         )
-        print("DEBUG: Aggregated text:")
-        print(aggregated_text)
-
-        # Translate aggregated text into the summary language
-        translated_text = llama_translate(aggregated_text, summary_lang)
-        print("DEBUG: Translated aggregated text:")
-        print(translated_text)
-
-        # Parse translated text for title/snippet pairs using regex
-        pattern = re.compile(r'\d+\.\s(.*?):\s(.*)')
-        parsed_data = []
-        for match in pattern.finditer(translated_text):
-            parsed_data.append((match.group(1).strip(), match.group(2).strip()))
-
-        for i, (title, snippet) in enumerate(parsed_data):
-            if i < len(results):
-                results[i]["title"] = title
-                results[i]["snippet"] = snippet
-
-        summary_prompt = SUMMARY_PROMPT_TEMPLATE.format(summary_lang=summary_lang, text=translated_text)
-        print("DEBUG: Summary prompt being sent to Llama:")
-        print(summary_prompt)
-        summary = call_llama(summary_prompt)
-        print("DEBUG: Final summary:")
-        print(summary)
 
-    return jsonify({
+        with deadline.scope(), admission_control.running(decision):
+            if decision.degraded:
+                results, timings = search_service.degraded_search(query, selected_country)
+            else:
+                # Hot queries are answered from the trending refresher's precomputed results and
+                # near-duplicates of an already answered query from the semantic cache
+                results, summary, timings = trending_queries.search(
+                    query, selected_country, summary_lang,
+                    lambda: semantic_cache.search(
+                        query, (selected_country, summary_lang),
+                        lambda: search_service.search_pipeline(query, selected_country, summary_lang)
+                    )
+                )
+        metrics.observe_stages(timings)
+        log_payload(logger, "final summary", summary, query=query)
+
+    response = jsonify({
         "query": query,
         "selected_country": selected_country,
         "summary_lang": summary_lang,
-        "results": results,
+        "results": image_proxy.proxy_results(results),
+        "summary": summary,
+        # Degraded answers carry untranslated results and no summary
+        "degraded": decision is not None and decision.degraded
+    })
+    if timings:
+        response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
+
+def api_search_countries(query, countries, summary_lang, decision=None):
+    """
+    Multi-country mode of /api/search: the query is searched in every listed country in parallel
+    and summarized once, with a section per country. Results carry the country they came from.
+    """
+    if not isinstance(countries, list) or not 1 <= len(countries) <= MAX_FANOUT_COUNTRIES:
+        admission_control.release(decision)
+        return jsonify({"error": f"{FORM_COUNTRIES_KEY} must list 1 to {MAX_FANOUT_COUNTRIES} countries"}), 400
+    if decision is not None and decision.degraded:
+        # A fan-out multiplies the generations; there is no cheaper form of it to fall back to
+        return shed_response(admission_control.refuse(decision))
+    countries = list(dict.fromkeys(countries))
+    results_by_country = {country: [] for country in countries}
+    summary = ""
+    timings = {}
+
+    if query:
+        log_event(logger, logging.INFO, "multi-country search request",
+                  query=query, countries=countries, summary_lang=summary_lang)
+        # One translation per language, all countries searched in parallel, one sectioned summary
+        with deadline.scope(), admission_control.running(decision):
+            results_by_country, summary, timings = search_service.multi_country_pipeline(
+                query, countries, summary_lang
+            )
+        metrics.observe_stages(timings)
+        log_payload(logger, "final summary", summary, query=query)
+
+    response = jsonify({
+        "query": query,
+        "countries": countries,
+        "summary_lang": summary_lang,
+        "results": [
+            dict(result, country=country)
+            for country, country_results in results_by_country.items()
+            for result in image_proxy.proxy_results(country_results)
+        ],
+        "results_by_country": {
+            country: image_proxy.proxy_results(country_results)
+            for country, country_results in results_by_country.items()
+        },
         "summary": summary
     })
+    if timings:
+        response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
+
+@app.route("/api/search/stream", methods=["POST"])
+def api_search_stream():
+    """
+    Same request payload as /api/search, answered as Server-Sent Events while the pipeline runs.
+    """
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "Invalid JSON payload"}), 400
+
+    query = data.get(FORM_QUERY_KEY, "")
+    selected_country = data.get(FORM_COUNTRY_KEY, DEFAULT_COUNTRY)
+    summary_lang = data.get(FORM_SUMMARY_LANG_KEY, DEFAULT_SUMMARY_LANG)
+    comm_lang = language_for(selected_country)
+    decision = admit_search() if query else None
+    if decision is not None and not decision.admitted:
+        return shed_response(decision)
+    log_event(
+        logger, logging.INFO, "streaming search request",
+        query=query, country=selected_country, comm_lang=comm_lang, summary_lang=summary_lang
+    )
+
+    def generate():
+        yield format_sse("request", {
+            "query": query,
+            "selected_country": selected_country,
+            "summary_lang": summary_lang
+        })
+        if not query:
+            yield format_sse("done", {})
+            return
+        if decision.degraded:
+            with deadline.scope(), admission_control.running(decision):
+                results, timings = search_service.degraded_search(query, selected_country)
+            yield format_sse("results", {
+                "results": image_proxy.proxy_results(results),
+                "degraded": True
+            })
+            yield format_sse("done", {"timings": {name: round(seconds, 3) for name, seconds in timings.items()}})
+            return
+        events = search_service.stream_search_pipeline(query, selected_country, summary_lang)
+        with deadline.scope(), admission_control.running(decision):
+            for event, payload in events:
+                if event == "done":
+                    metrics.observe_stages(payload["timings"])
+                elif "results" in payload:
+                    payload = dict(payload, results=image_proxy.proxy_results(payload["results"]))
+                yield format_sse(event, payload)
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        # Stop reverse proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    # A client that disconnects before the stream starts never runs generate(); free the slot admit() reserved
+    response.call_on_close(lambda: admission_control.release(decision))
+    return response
+
+
+@app.route("/api/jobs", methods=["POST"])
+def submit_job():
+    """
+    Queues a search (same payload as /api/search) and answers 202 with the job id right away;
+    poll the returned status_url for partial and final results.
+    """
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "Invalid JSON payload"}), 400
+    query = data.get(FORM_QUERY_KEY, "")
+    if not query:
+        return jsonify({"error": f"{FORM_QUERY_KEY} is required"}), 400
+    # Jobs wait in their own bounded queue, so only the per-client rate limit applies here
+    decision = admit_search(shed=False)
+    if not decision.admitted:
+        return shed_response(decision)
+    params = {
+        "query": query,
+        "selected_country": data.get(FORM_COUNTRY_KEY, DEFAULT_COUNTRY),
+        "summary_lang": data.get(FORM_SUMMARY_LANG_KEY, DEFAULT_SUMMARY_LANG)
+    }
+    try:
+        job_id = job_store.submit(params)
+    except JobQueueFull as e:
+        log_event(logger, logging.WARNING, "search job rejected", error=str(e))
+        response = jsonify({"error": "Too many queued searches, try again later"})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(JOB_RETRY_AFTER)
+        return response
+    job_workers.notify()
+    log_event(logger, logging.INFO, "search job queued", job_id=job_id, **params)
+
+    status_url = url_for("job_status", job_id=job_id)
+    response = jsonify({"job_id": job_id, "status": STATUS_QUEUED, "status_url": status_url})
+    response.status_code = 202
+    response.headers["Location"] = status_url
+    return response
+
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """
+    Returns a job's status with whatever it has produced so far: translated_query, results
+    (results_translated once translated) and summary (summary_complete once finished).
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    if "results" in job:
+        job["results"] = image_proxy.proxy_results(job["results"])
+    return jsonify(job)
+
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    """
+    Readiness probe: 503 until every configured model has been loaded on a backend.
+    """
+    # A no-op once started; WSGI workers run without start_background_services warm up on the first probe
+    model_warmup.start()
+    status = model_warmup.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+
+@app.route(image_proxy.IMAGE_PROXY_ROUTE, methods=["GET"])
+def image_proxy_endpoint():
+    """
+    Serves the cached thumbnail for a signed result image link (see image_proxy.proxy_url).
+    """
+    url = request.args.get("url", "")
+    if not image_proxy.verify(url, request.args.get("sig", "")):
+        return jsonify({"error": "Invalid image link"}), 403
+    thumbnail = image_proxy.get_thumbnail(url)
+    if thumbnail is None:
+        return jsonify({"error": "Image unavailable"}), 502
+    return Response(thumbnail, mimetype=image_proxy.THUMBNAIL_MIMETYPE, headers=image_proxy.cache_headers())
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """
+    Stage latency histograms and upstream error counters in the Prometheus text format.
+    """
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/api/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify({
+        "translation": translation_cache.stats(),
+        "search": search_cache.stats(),
+        "semantic": semantic_cache.stats(),
+        "coalescing": {
+            "llama": llama_flight.stats(),
+            "search": search_flight.stats()
+        },
+        "llm_scheduler": llm_scheduler.stats(),
+        "llama_backends": ollama_pool.stats(),
+        "tokens": token_stats.stats(),
+        "images": image_proxy.thumbnail_cache.stats(),
+        "trending": trending_queries.stats(),
+        "jobs": job_workers.stats(),
+        "admission": admission_control.stats(),
+        "circuit_breakers": circuit_breakers.stats(),
+        "hedging": hedger.stats()
+    })
 
 
 if __name__ == "__main__":
-    print("DEBUG: Starting Flask API (JSON only).")
+    if sys.argv[1:] == ["worker"]:
+        # Job workers only, sharing JOB_DB with web processes that run with JOB_WORKERS=0
+        start_background_services(web=False)
+        log_event(logger, logging.INFO, "running search job workers", workers=job_workers.workers)
+        threading.Event().wait()
+    start_background_services()
+    log_event(logger, logging.INFO, "starting Flask API (JSON only)")
     app.run(debug=FLASK_DEBUG)
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+ASGI entry point for the JSON search API.
+
+Serves /api/search, multi-country mode included, with the same request and
+response JSON as app.py, but the pipeline runs as asyncio tasks with non-blocking
+calls to Ollama and Google, so one process can hold hundreds of in-flight
+searches instead of a thread each:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+Configuration, prompt templates and the country mapping are imported from
+search_service.py, the request field names from app.py.
+"""
+import asyncio
+import functools
+import logging
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+# Shared modules live at the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import async_http
+import deadline
+import image_proxy
+import page_fetcher
+import search_pages
+from app import (
+    FORM_COUNTRIES_KEY, FORM_COUNTRY_KEY, FORM_QUERY_KEY, FORM_SUMMARY_LANG_KEY, MAX_FANOUT_COUNTRIES,
+    USE_STATIC_RESULTS
+)
+from admission import admission_control, client_id
+from circuit_breaker import circuit_breakers
+from hedging import hedger
+from lang_id import is_language
+from llm_scheduler import (
+    PRIORITY_NAMES, PRIORITY_SNIPPET_TRANSLATION, PRIORITY_SUMMARY, SchedulerQueueFull, async_llm_scheduler
+)
+from observability import get_logger, log_event, log_payload, metrics, server_timing_header
+from ollama_pool import ollama_pool
+from pipeline import extract_results, run_multi_country_pipeline_async, run_search_pipeline_async
+from search_cache import search_cache
+from search_service import (
+    API_KEY, DEFAULT_COUNTRY, DEFAULT_LANG, DEFAULT_SUMMARY_LANG, FETCH_PAGE_TEXT, GOOGLE_SEARCH_API_URL,
+    LLAMA_MODEL, MULTI_COUNTRY_SUMMARY_PROMPT_TEMPLATE, SEARCH_ENGINE_ID, STATIC_RESULTS, STRUCTURED_OUTPUT,
+    SUMMARY_PROMPT_TEMPLATE, TEXT_SEPARATOR, TRANSLATION_PROMPT_TEMPLATE, language_for, supported_countries
+)
+from semantic_cache import semantic_cache
+from single_flight import async_llama_flight, async_search_flight
+from token_budget import (
+    STAGE_BUDGETS, estimate_tokens, input_budget, options_for, token_stats, truncate_to_tokens
+)
+from translation_cache import translation_cache
+from trending import trending_queries
+from warmup import LLAMA_KEEP_ALIVE, model_warmup
+
+logger = get_logger("asgi")
+
+
+async def call_llama(prompt: str, priority: int = PRIORITY_SUMMARY, response_format=None) -> str:
+    """
+    Calls the Llama model; identical prompts already in flight share a single generation.
+    """
+    return await async_llama_flight.do(
+        (LLAMA_MODEL, prompt, response_format),
+        lambda: generate_llama(prompt, priority, response_format)
+    )
+
+
+async def call_llama_json(prompt: str) -> str:
+    return await call_llama(prompt, PRIORITY_SNIPPET_TRANSLATION, response_format="json")
+
+
+async def generate_llama(prompt: str, priority: int = PRIORITY_SUMMARY, response_format=None) -> str:
+    """
+    Sends one non-streaming generation request once the scheduler grants a slot.
+    """
+    stage = "structured" if response_format else PRIORITY_NAMES[priority]
+    log_payload(logger, "llama prompt", prompt, stage=stage)
+    prompt_tokens = estimate_tokens(prompt)
+    if prompt_tokens > STAGE_BUDGETS[stage]["max_input_tokens"]:
+        log_event(logger, logging.WARNING, "prompt exceeds input budget", stage=stage, estimated_tokens=prompt_tokens)
+    payload = {
+        "model": LLAMA_MODEL,
+        "prompt": prompt,
+        "stream": False,
+        "options": options_for(stage),
+        "keep_alive": LLAMA_KEEP_ALIVE
+    }
+    if response_format:
+        payload["format"] = response_format
+    # Translations are safe to repeat, so a slow one may be hedged, but only on another backend
+    hedge = None
+    if not response_format and priority != PRIORITY_SUMMARY and ollama_pool.routable(LLAMA_MODEL) > 1:
+        hedge = f"llama.{stage}"
+    leased = []
+
+    async def attempt():
+        async with async_llm_scheduler.slot(priority) as queue_wait:
+            log_event(logger, logging.DEBUG, "llama slot granted", stage=stage, queue_wait=round(queue_wait, 3))
+            with ollama_pool.lease(LLAMA_MODEL, errors=(httpx.HTTPError,)) as llama_url:
+                leased.append(llama_url)
+                response = await async_http.post("llama", llama_url, json=payload)
+                response.raise_for_status()
+            return response.json()
+
+    async def hedge_attempt(started):
+        # A slot and a backend of its own, so the hedge never exceeds LLM_MAX_CONCURRENCY and is
+        # only sent when there is idle capacity; the losing attempt is cancelled
+        with async_llm_scheduler.spare_slot(priority):
+            with ollama_pool.lease(LLAMA_MODEL, errors=(httpx.HTTPError,), exclude=leased) as llama_url:
+                started()
+                response = await async_http.post("llama", llama_url, json=payload)
+                response.raise_for_status()
+            return response.json()
+
+    try:
+        if hedge is None:
+            result_json = await attempt()
+        else:
+            result_json = await hedger.call_async(hedge, attempt, hedge_attempt=hedge_attempt)
+        token_stats.record(stage, prompt, result_json)
+        llama_response = result_json.get("response", "Error: No response from Llama")
+        log_payload(logger, "llama response", llama_response, stage=stage)
+        return llama_response
+    except (httpx.HTTPError, ValueError, SchedulerQueueFull) as e:
+        metrics.count_error("llama")
+        error_msg = f"Error calling Llama: {e}"
+        log_event(logger, logging.ERROR, "llama call failed", stage=stage, error=str(e))
+        return error_msg
+
+
+async def llama_translate(text: str, target_lang: str, priority: int = PRIORITY_SNIPPET_TRANSLATION) -> str:
+    """
+    Uses Llama to translate text into the target language.
+    """
+    if is_language(text, target_lang):
+        log_event(logger, logging.DEBUG, "translation skipped, already in target language", target_lang=target_lang)
+        return text
+    cache_key = translation_cache.make_key(text, target_lang, LLAMA_MODEL, TRANSLATION_PROMPT_TEMPLATE)
+    cached = translation_cache.get(cache_key)
+    if cached is not None:
+        log_event(logger, logging.DEBUG, "translation cache hit", target_lang=target_lang)
+        return cached
+    text = truncate_to_tokens(text, input_budget(PRIORITY_NAMES[priority], TRANSLATION_PROMPT_TEMPLATE))
+    prompt = TRANSLATION_PROMPT_TEMPLATE.format(target_lang=target_lang, text=text)
+    translation = await call_llama(prompt, priority)
+    # call_llama reports failures in-band; never cache those
+    if not translation.startswith("Error"):
+        translation_cache.set(cache_key, translation)
+    return translation
+
+
+async def google_search(query, gl=DEFAULT_COUNTRY, hl=DEFAULT_LANG, fresh=False):
+    """
+    Calls Google Custom Search API with location and language-based filtering.
+    fresh skips the cached results and replaces them with the new ones.
+    """
+    if USE_STATIC_RESULTS:
+        return STATIC_RESULTS
+    cached = search_cache.refresh_async if fresh else search_cache.get_or_fetch_async
+    return await cached(
+        (query, gl, hl),
+        lambda: async_search_flight.do((query, gl, hl), lambda: fetch_google_results(query, gl, hl)),
+        fallback=[]
+    )
+
+
+async def fetch_google_results(query, gl, hl):
+    """
+    Performs the actual Custom Search requests, one per page of SEARCH_RESULT_DEPTH, concurrently.
+    Raises on network or API errors.
+    """
+    log_event(logger, logging.INFO, "google search", query=query, gl=gl, hl=hl)
+    items = await search_pages.fetch_all_async(lambda start: fetch_google_page(query, gl, hl, start))
+    log_event(logger, logging.DEBUG, "google search results", links=[item.get("link") for item in items])
+    return items
+
+
+async def fetch_google_page(query, gl, hl, start):
+    params = {
+        "key": API_KEY,
+        "cx": SEARCH_ENGINE_ID,
+        "q": query,
+        "gl": gl,
+        "hl": hl,
+        "start": start,
+        "num": search_pages.PAGE_SIZE
+    }
+    try:
+        response = await async_http.get("google", GOOGLE_SEARCH_API_URL, params=params, hedge="google")
+        response.raise_for_status()
+        results = response.json()
+        if "error" in results:
+            raise RuntimeError(f"Google API Error: {results['error']}")
+    except (httpx.HTTPError, ValueError, RuntimeError):
+        metrics.count_error("google")
+        raise
+    return results.get("items", [])
+
+
+async def fetch_pages(urls):
+    # The page fetcher keeps its per-host limits and disk cache; run it off the event loop
+    return await asyncio.to_thread(page_fetcher.fetch_pages, urls)
+
+
+async def degraded_search(query, selected_country):
+    """
+    Search results without any LLM call, for overload; see degraded_search in search_service.py.
+    """
+    comm_lang = language_for(selected_country)
+    cached = translation_cache.get(
+        translation_cache.make_key(query, comm_lang, LLAMA_MODEL, TRANSLATION_PROMPT_TEMPLATE)
+    )
+    start = time.perf_counter()
+    results, _ = extract_results(await google_search(cached or query, gl=selected_country, hl=comm_lang))
+    return results, {"search": time.perf_counter() - start}
+
+
+async def search_pipeline(query, selected_country, summary_lang, fresh=False):
+    comm_lang = language_for(selected_country)
+    return await run_search_pipeline_async(
+        query, selected_country, comm_lang, summary_lang,
+        translate=llama_translate,
+        search=functools.partial(google_search, fresh=fresh),
+        generate=call_llama,
+        summary_template=SUMMARY_PROMPT_TEMPLATE,
+        separator=TEXT_SEPARATOR,
+        fetch_pages=fetch_pages if FETCH_PAGE_TEXT else None,
+        structured_generate=call_llama_json if STRUCTURED_OUTPUT else None
+    )
+
+
+async def refresh_search(query, selected_country, summary_lang, seconds_left):
+    """
+    A trending refresh, submitted from the refresher thread. Its deadline is passed in rather than
+    left to the context variable, which does not reliably cross from that thread onto the loop.
+    """
+    # An already spent deadline still has to end the search, so never hand scope() 0 or less
+    with deadline.scope(None if seconds_left is None else max(seconds_left, 0.001)):
+        return await search_pipeline(query, selected_country, summary_lang, fresh=True)
+
+
+async def api_search(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not data:
+        return JSONResponse({"error": "Invalid JSON payload"}, status_code=400)
+
+    query = data.get(FORM_QUERY_KEY, "")
+    selected_country = data.get(FORM_COUNTRY_KEY, DEFAULT_COUNTRY)
+    summary_lang = data.get(FORM_SUMMARY_LANG_KEY, DEFAULT_SUMMARY_LANG)
+    # Overloaded or rate-limited requests are refused before any work starts
+    decision = admission_control.admit(
+        client_id(request.client.host if request.client else None, request.headers.get("X-Forwarded-For"))
+    ) if query else None
+    if decision is not None and not decision.admitted:
+        return JSONResponse(decision.error(), status_code=decision.status, headers=decision.headers())
+    if data.get(FORM_COUNTRIES_KEY) is not None:
+        return await api_search_countries(query, data[FORM_COUNTRIES_KEY], summary_lang, decision)
+    results = []
+    summary = ""
+    timings = {}
+
+    if query:
+        comm_lang = language_for(selected_country)
+        log_event(
+            logger, logging.INFO, "search request",
+            query=query, country=selected_country, comm_lang=comm_lang, summary_lang=summary_lang,
+            mode=decision.mode
+        )
+        with deadline.scope(), admission_control.running(decision):
+            if decision.degraded:
+                results, timings = await degraded_search(query, selected_country)
+            else:
+                # Hot queries are answered from the trending refresher's precomputed results and
+                # near-duplicates of an already answered query from the semantic cache
+                results, summary, timings = await trending_queries.search_async(
+                    query, selected_country, summary_lang,
+                    lambda: semantic_cache.search_async(
+                        query, (selected_country, summary_lang),
+                        lambda: search_pipeline(query, selected_country, summary_lang)
+                    )
+                )
+        metrics.observe_stages(timings)
+        log_payload(logger, "final summary", summary, query=query)
+
+    response = JSONResponse({
+        "query": query,
+        "selected_country": selected_country,
+        "summary_lang": summary_lang,
+        "results": image_proxy.proxy_results(results),
+        "summary": summary,
+        # Degraded answers carry untranslated results and no summary
+        "degraded": decision is not None and decision.degraded
+    })
+    if timings:
+        response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
+
+async def api_search_countries(query, countries, summary_lang, decision=None):
+    """
+    Multi-country mode of /api/search, answered like api_search_countries in app.py.
+    """
+    if not isinstance(countries, list) or not 1 <= len(countries) <= MAX_FANOUT_COUNTRIES:
+        admission_control.release(decision)
+        return JSONResponse(
+            {"error": f"{FORM_COUNTRIES_KEY} must list 1 to {MAX_FANOUT_COUNTRIES} countries"}, status_code=400
+        )
+    if decision is not None and decision.degraded:
+        # A fan-out multiplies the generations; there is no cheaper form of it to fall back to
+        decision = admission_control.refuse(decision)
+        return JSONResponse(decision.error(), status_code=decision.status, headers=decision.headers())
+    countries = list(dict.fromkeys(countries))
+    results_by_country = {country: [] for country in countries}
+    summary = ""
+    timings = {}
+
+    if query:
+        log_event(logger, logging.INFO, "multi-country search request",
+                  query=query, countries=countries, summary_lang=summary_lang)
+        with deadline.scope(), admission_control.running(decision):
+            results_by_country, summary, timings = await run_multi_country_pipeline_async(
+                query, countries, summary_lang,
+                language_for=language_for,
+                translate=llama_translate,
+                search=google_search,
+                generate=call_llama,
+                summary_template=MULTI_COUNTRY_SUMMARY_PROMPT_TEMPLATE,
+                separator=TEXT_SEPARATOR,
+                country_names={country["code"]: country["name"] for country in supported_countries}
+            )
+        metrics.observe_stages(timings)
+        log_payload(logger, "final summary", summary, query=query)
+
+    response = JSONResponse({
+        "query": query,
+        "countries": countries,
+        "summary_lang": summary_lang,
+        "results": [
+            dict(result, country=country)
+            for country, country_results in results_by_country.items()
+            for result in image_proxy.proxy_results(country_results)
+        ],
+        "results_by_country": {
+            country: image_proxy.proxy_results(country_results)
+            for country, country_results in results_by_country.items()
+        },
+        "summary": summary
+    })
+    if timings:
+        response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
+
+async def image_proxy_endpoint(request):
+    url = request.query_params.get("url", "")
+    if not image_proxy.verify(url, request.query_params.get("sig", "")):
+        return JSONResponse({"error": "Invalid image link"}, status_code=403)
+    # Downloads, decoding and disk reads block; keep them off the event loop
+    thumbnail = await asyncio.to_thread(image_proxy.get_thumbnail, url)
+    if thumbnail is None:
+        return JSONResponse({"error": "Image unavailable"}, status_code=502)
+    return Response(thumbnail, media_type=image_proxy.THUMBNAIL_MIMETYPE, headers=image_proxy.cache_headers())
+
+
+async def ready(request):
+    status = model_warmup.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+async def metrics_endpoint(request):
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+async def cache_stats(request):
+    return JSONResponse({
+        "translation": translation_cache.stats(),
+        "search": search_cache.stats(),
+        "semantic": semantic_cache.stats(),
+        "coalescing": {
+            "llama": async_llama_flight.stats(),
+            "search": async_search_flight.stats()
+        },
+        "llm_scheduler": async_llm_scheduler.stats(),
+        "llama_backends": ollama_pool.stats(),
+        "tokens": token_stats.stats(),
+        "images": image_proxy.thumbnail_cache.stats(),
+        "trending": trending_queries.stats(),
+        "admission": admission_control.stats(),
+        "circuit_breakers": circuit_breakers.stats(),
+        "hedging": hedger.stats()
+    })
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Only the services this app uses; the job API and its workers live in app.py
+    model_warmup.start()
+    loop = asyncio.get_running_loop()
+    # The refresher thread runs its searches on this loop, where the async clients and scheduler live
+    trending_queries.start(
+        lambda query, country, summary_lang: asyncio.run_coroutine_threadsafe(
+            refresh_search(query, country, summary_lang, deadline.remaining()), loop
+        ).result(),
+        busy=lambda: async_llm_scheduler.busy
+    )
+    yield
+    await async_http.aclose()
+
+
+app = Starlette(
+    routes=[
+        Route("/api/search", api_search, methods=["POST"]),
+        Route(image_proxy.IMAGE_PROXY_ROUTE, image_proxy_endpoint, methods=["GET"]),
+        Route("/ready", ready, methods=["GET"]),
+        Route("/metrics", metrics_endpoint, methods=["GET"]),
+        Route("/api/cache/stats", cache_stats, methods=["GET"]),
+    ],
+    # Allow frontend requests, as CORS(app) does for the Flask app
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+    lifespan=lifespan
+)
@@ -1,19 +1,64 @@
+// Route handlers cannot see the socket, so the peer address comes from X-Real-IP, which the reverse proxy
+// in front of Next.js must set (overwriting any value sent by the client). It is appended to the chain so
+// the backend keys its rate limits on this hop rather than on the client-written leftmost entry. Without it
+// no X-Forwarded-For is sent and the backend falls back to the connection address.
+function forwardedFor(req: Request): Record<string, string> {
+    const peer = req.headers.get("x-real-ip");
+    if (!peer) {
+        return {};
+    }
+    const chain = req.headers.get("x-forwarded-for");
+    return { "X-Forwarded-For": chain ? `${chain}, ${peer}` : peer };
+}
+
+// Keep what clients need to tell load shedding apart from answers: the content type and Retry-After
+function passThroughHeaders(response: Response, fallbackType: string): Headers {
+    const headers = new Headers({ "Content-Type": response.headers.get("content-type") ?? fallbackType });
+    const retryAfter = response.headers.get("retry-after");
+    if (retryAfter) {
+        headers.set("Retry-After", retryAfter);
+    }
+    return headers;
+}
+
 export async function POST(req: Request) {
     try {
-        const { query, country, summary_lang } = await req.json();
+        const { query, country, countries, summary_lang, stream: streamed, async: queued } = await req.json();
 
-        const response = await fetch("http://127.0.0.1:5000/api/search", {
+        // Multi-country searches (countries lists the codes) only have the buffered form. Otherwise streaming
+        // requests go to the SSE endpoint and async requests queue a job to poll via /api/jobs/<id>;
+        // everything else keeps the buffered JSON contract
+        const stream = streamed && !countries;
+        const endpoint = stream
+            ? "http://127.0.0.1:5000/api/search/stream"
+            : queued && !countries ? "http://127.0.0.1:5000/api/jobs" : "http://127.0.0.1:5000/api/search";
+        const response = await fetch(endpoint, {
             method: "POST",
-            headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({ 
-                query, 
+            // The backend rate-limits per client (with TRUST_PROXY_HEADERS), not per proxy
+            headers: { "Content-Type": "application/json", ...forwardedFor(req) },
+            body: JSON.stringify({
+                query,
                 country: country || "no",  // Default to Norway if not provided
+                countries,  // Left out of the JSON when not provided
                 summary_lang: summary_lang || "en"  // Default to English if not provided
             }),
         });
 
-        const data = await response.json();
-        return new Response(JSON.stringify(data), { status: 200 });
+        if (stream) {
+            // Pass the event stream through as it arrives instead of buffering it; a refused request
+            // arrives as a JSON error with 429 or 503 and keeps that content type
+            const headers = passThroughHeaders(response, "text/event-stream");
+            headers.set("Cache-Control", "no-cache");
+            headers.set("Connection", "keep-alive");
+            return new Response(response.body, { status: response.status, headers });
+        }
+
+        // Pass the status through: 202 (job queued), 429 (rate limited) and 503 (overloaded, queue full)
+        // must reach the client along with Retry-After
+        return new Response(await response.text(), {
+            status: response.status,
+            headers: passThroughHeaders(response, "application/json"),
+        });
     } catch (error) {
         return new Response(JSON.stringify({ error: "Failed to fetch from backend" }), { status: 500 });
     }
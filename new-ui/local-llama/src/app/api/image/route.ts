@@ -0,0 +1,16 @@
+// Search results link their images to /api/image on this origin (the backend's IMAGE_PROXY_ROUTE);
+// pass them through to the backend's thumbnail proxy with the headers that let browsers cache them
+export async function GET(req: Request) {
+    try {
+        const { search } = new URL(req.url);
+        const response = await fetch(`http://127.0.0.1:5000/api/image${search}`);
+        const headers = new Headers({ "Content-Type": response.headers.get("content-type") ?? "application/json" });
+        const cacheControl = response.headers.get("cache-control");
+        if (cacheControl) {
+            headers.set("Cache-Control", cacheControl);
+        }
+        return new Response(response.body, { status: response.status, headers });
+    } catch (error) {
+        return new Response(JSON.stringify({ error: "Failed to fetch from backend" }), { status: 500 });
+    }
+}
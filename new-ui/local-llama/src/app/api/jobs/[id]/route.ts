@@ -0,0 +1,11 @@
+export async function GET(req: Request, { params }: { params: Promise<{ id: string }> }) {
+    try {
+        const { id } = await params;
+        // Each poll is a short request; the search itself runs on the backend's job workers
+        const response = await fetch(`http://127.0.0.1:5000/api/jobs/${encodeURIComponent(id)}`);
+        const data = await response.json();
+        return new Response(JSON.stringify(data), { status: response.status });
+    } catch (error) {
+        return new Response(JSON.stringify({ error: "Failed to fetch from backend" }), { status: 500 });
+    }
+}
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Structured logging and latency metrics.
+
+Logging: get_logger() returns a standard logger whose records are emitted as one
+JSON object per line (LOG_FORMAT=json) or plain text, filtered by LOG_LEVEL.
+Large payloads (prompts, LLM responses, page text) go through log_payload(),
+which only does any work at DEBUG level, samples LOG_PAYLOAD_SAMPLE_RATE of them
+and truncates to LOG_PAYLOAD_MAX_CHARS.
+
+Metrics: per-stage latency histograms, upstream error and resilience counters rendered
+in the Prometheus text format for /metrics, plus a Server-Timing header helper.
+"""
+import json
+import logging
+import os
+import random
+import sys
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json or text
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.01"))
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "500"))
+
+# Upper bounds in seconds; LLM stages can take tens of seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+# Pipeline stage name -> metric label
+STAGE_LABELS = {
+    "translate_query": "translate-query",
+    "search": "search",
+    "translate_results": "translate-results",
+    "summarize": "summarize",
+    "fetch_pages": "page-fetch",
+    "structured": "structured",
+    "semantic_cache": "semantic-cache",
+    "precomputed": "precomputed",
+}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        fields = getattr(record, "fields", {})
+        line = f"{record.levelname} {record.name}: {record.getMessage()}"
+        if fields:
+            line += " " + " ".join(f"{key}={value!r}" for key, value in fields.items())
+        return line
+
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def _configure():
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+        root = logging.getLogger("local_llama")
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL)
+        root.propagate = False
+        _configured = True
+
+
+def get_logger(name: str) -> logging.Logger:
+    _configure()
+    return logging.getLogger(f"local_llama.{name}")
+
+
+def log_event(logger: logging.Logger, level: int, msg: str, **fields):
+    """
+    Logs msg with structured key/value fields.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, msg, extra={"fields": fields})
+
+
+def log_payload(logger: logging.Logger, label: str, payload: str, **fields):
+    """
+    Logs a large payload at DEBUG level for a sampled fraction of calls, truncated.
+    """
+    if not logger.isEnabledFor(logging.DEBUG) or random.random() >= LOG_PAYLOAD_SAMPLE_RATE:
+        return
+    payload = payload or ""
+    logger.debug(label, extra={"fields": dict(
+        fields,
+        payload=payload[:LOG_PAYLOAD_MAX_CHARS],
+        payload_chars=len(payload),
+        truncated=len(payload) > LOG_PAYLOAD_MAX_CHARS
+    )})
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    Thread-safe registry of stage latency histograms, upstream error, upstream event and admission counters.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency = {}  # stage -> Histogram
+        self._errors = {}  # upstream -> count
+        self._admission = {}  # outcome -> count
+        self._upstream_events = {}  # (upstream, event) -> count
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            self._latency.setdefault(stage, Histogram()).observe(seconds)
+
+    def observe_stages(self, timings: dict):
+        """
+        Records the timings of a pipeline run; stages without a metric label are skipped.
+        Per-country stages ("search.no") are recorded under their base stage.
+        """
+        for name, seconds in timings.items():
+            base = name.split(".", 1)[0]
+            if base in STAGE_LABELS:
+                self.observe(STAGE_LABELS[base], seconds)
+
+    def count_error(self, upstream: str):
+        with self._lock:
+            self._errors[upstream] = self._errors.get(upstream, 0) + 1
+
+    def count_admission(self, outcome: str):
+        with self._lock:
+            self._admission[outcome] = self._admission.get(outcome, 0) + 1
+
+    def count_upstream_event(self, upstream: str, event: str):
+        """
+        Counts deadline, circuit breaker and hedging events ("deadline_exceeded", "circuit_open",
+        "hedged", "hedge_won") per upstream.
+        """
+        with self._lock:
+            key = (upstream, event)
+            self._upstream_events[key] = self._upstream_events.get(key, 0) + 1
+
+    def render(self) -> str:
+        """
+        Returns all metrics in the Prometheus text exposition format.
+        """
+        lines = [
+            "# HELP local_llama_stage_seconds Latency of each search pipeline stage.",
+            "# TYPE local_llama_stage_seconds histogram",
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self._latency.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'local_llama_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'local_llama_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'local_llama_stage_seconds_sum{{stage="{stage}"}} {histogram.total}')
+                lines.append(f'local_llama_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+            lines.append("# HELP local_llama_upstream_errors_total Failed calls per upstream.")
+            lines.append("# TYPE local_llama_upstream_errors_total counter")
+            for upstream, count in sorted(self._errors.items()):
+                lines.append(f'local_llama_upstream_errors_total{{upstream="{upstream}"}} {count}')
+            lines.append("# HELP local_llama_upstream_events_total Deadline, circuit breaker and hedging events.")
+            lines.append("# TYPE local_llama_upstream_events_total counter")
+            for (upstream, event), count in sorted(self._upstream_events.items()):
+                lines.append(f'local_llama_upstream_events_total{{upstream="{upstream}",event="{event}"}} {count}')
+            lines.append("# HELP local_llama_admission_total Search requests by admission outcome.")
+            lines.append("# TYPE local_llama_admission_total counter")
+            for outcome, count in sorted(self._admission.items()):
+                lines.append(f'local_llama_admission_total{{outcome="{outcome}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+def server_timing_header(timings: dict) -> str:
+    """
+    Formats {name: seconds} as a Server-Timing header value (durations in milliseconds). As in
+    observe_stages, internal stages without a label (build, apply_translation) are left out.
+    """
+    entries = []
+    for name, seconds in timings.items():
+        base, dot, suffix = name.partition(".")
+        if base in STAGE_LABELS:
+            entries.append(f"{STAGE_LABELS[base]}{dot}{suffix};dur={seconds * 1000:.1f}")
+    return ", ".join(entries)
+
+
+metrics = Metrics()
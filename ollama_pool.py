@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Load-balanced pool of Ollama /api/generate endpoints.
+
+Requests go to the healthy backend with the fewest outstanding requests, optionally
+restricted to the backends a model is pinned to. A background thread, started with
+the first lease so only processes that call Ollama run it, probes every backend's
+/api/tags; backends that fail probes or LLAMA_BACKEND_MAX_FAILURES consecutive
+requests are drained until a probe succeeds again. Probes bypass the circuit
+breakers, which would otherwise hold a recovered backend out until they half-open.
+With probes disabled, a drained backend gets a trial request every
+LLAMA_BACKEND_RETRY seconds and rejoins the pool when one succeeds.
+
+Configuration:
+    LLAMA_API_URLS        comma-separated generate URLs (falls back to LLAMA_API_URL)
+    LLAMA_MODEL_AFFINITY  optional "model=url|url;model=url" pinning models to backends
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from dotenv import load_dotenv
+
+import deadline
+from observability import get_logger, log_event
+
+load_dotenv()
+
+logger = get_logger("ollama_pool")
+
+LLAMA_API_URLS = [
+    url.strip()
+    for url in os.getenv("LLAMA_API_URLS", os.getenv("LLAMA_API_URL", "http://localhost:11434/api/generate")).split(",")
+    if url.strip()
+]
+LLAMA_MODEL_AFFINITY = os.getenv("LLAMA_MODEL_AFFINITY", "")
+LLAMA_HEALTH_INTERVAL = float(os.getenv("LLAMA_HEALTH_INTERVAL", "10"))  # seconds; 0 disables probes
+LLAMA_HEALTH_TIMEOUT = float(os.getenv("LLAMA_HEALTH_TIMEOUT", "2"))
+LLAMA_BACKEND_MAX_FAILURES = int(os.getenv("LLAMA_BACKEND_MAX_FAILURES", "3"))
+LLAMA_BACKEND_RETRY = float(os.getenv("LLAMA_BACKEND_RETRY", "30"))  # seconds between trials without probes
+
+
+def parse_affinity(spec: str) -> dict:
+    """
+    Parses "model=url|url;model=url" into {model: [url, ...]}.
+    """
+    affinity = {}
+    for entry in spec.split(";"):
+        if "=" not in entry:
+            continue
+        model, urls = entry.split("=", 1)
+        affinity[model.strip()] = [url.strip() for url in urls.split("|") if url.strip()]
+    return affinity
+
+
+def health_url(generate_url: str) -> str:
+    parts = urlsplit(generate_url)
+    return urlunsplit((parts.scheme, parts.netloc, "/api/tags", "", ""))
+
+
+def embed_url(generate_url: str) -> str:
+    parts = urlsplit(generate_url)
+    return urlunsplit((parts.scheme, parts.netloc, "/api/embed", "", ""))
+
+
+class NoBackendAvailable(Exception):
+    """Raised by lease(exclude=...) when no healthy backend outside exclude can serve the model."""
+
+
+class Backend:
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.drained_at = 0.0  # time.monotonic() of the drain or of the last trial request since
+        self.requests = 0
+        self.failures = 0
+        self.last_error = None
+
+
+class OllamaPool:
+    """
+    Least-outstanding-requests routing with health-based draining.
+    """
+
+    def __init__(self, urls=None, affinity=None, health_interval=LLAMA_HEALTH_INTERVAL,
+                 max_failures=LLAMA_BACKEND_MAX_FAILURES, retry_after=LLAMA_BACKEND_RETRY):
+        urls = list(urls or LLAMA_API_URLS)
+        affinity = parse_affinity(LLAMA_MODEL_AFFINITY) if affinity is None else affinity
+        # Pinned URLs are part of the pool even if LLAMA_API_URLS omits them
+        for pinned in affinity.values():
+            urls.extend(url for url in pinned if url not in urls)
+        self.backends = {url: Backend(url) for url in urls}
+        self.affinity = affinity
+        self.health_interval = health_interval
+        self.max_failures = max_failures
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._health_thread = None
+        self._probe_session = None
+
+    def _candidates(self, model, exclude=()):
+        if exclude:
+            # A second backend for the same call; it is extra work, so only ever a healthy one
+            return [backend for backend in self._candidates(model) if backend.healthy and backend.url not in exclude]
+        pinned = [self.backends[url] for url in self.affinity.get(model, ())]
+        healthy_pinned = [backend for backend in pinned if self._usable(backend)]
+        if healthy_pinned:
+            return healthy_pinned
+        healthy = [backend for backend in self.backends.values() if self._usable(backend)]
+        # With everything drained, keep trying rather than failing every request outright
+        return healthy or pinned or list(self.backends.values())
+
+    def _usable(self, backend: Backend) -> bool:
+        # Called with the lock held; without probes, a drained backend is due a trial request now and then
+        if backend.healthy:
+            return True
+        return self.health_interval <= 0 and time.monotonic() - backend.drained_at >= self.retry_after
+
+    def acquire(self, model=None, exclude=()) -> Backend:
+        if self._health_thread is None and self.health_interval > 0:
+            self.start_health_checks()
+        with self._lock:
+            candidates = self._candidates(model, exclude)
+            if not candidates:
+                raise NoBackendAvailable(f"no backend for {model} besides {', '.join(exclude)}")
+            backend = min(candidates, key=lambda b: b.outstanding)
+            if not backend.healthy:
+                # One trial per retry period
+                backend.drained_at = time.monotonic()
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+
+    def release(self, backend: Backend, error=None):
+        with self._lock:
+            backend.outstanding -= 1
+            if error is None:
+                backend.consecutive_failures = 0
+                if not backend.healthy:
+                    log_event(logger, logging.INFO, "llama backend healthy again", backend=backend.url)
+                    backend.healthy = True
+                return
+            backend.failures += 1
+            backend.consecutive_failures += 1
+            backend.last_error = str(error)
+            if backend.consecutive_failures >= self.max_failures and backend.healthy:
+                log_event(
+                    logger, logging.WARNING, "draining llama backend",
+                    backend=backend.url, consecutive_failures=backend.consecutive_failures
+                )
+                backend.healthy = False
+                backend.drained_at = time.monotonic()
+
+    def urls_for(self, model=None) -> list:
+        """
+        Every backend URL model may be routed to: its pinned backends, or the whole pool.
+        """
+        return list(self.affinity.get(model) or self.backends)
+
+    def routable(self, model=None) -> int:
+        """
+        Healthy backends a request for model can currently be sent to.
+        """
+        with self._lock:
+            return sum(1 for backend in self._candidates(model) if backend.healthy)
+
+    @contextmanager
+    def lease(self, model=None, errors=(requests.RequestException,), exclude=()):
+        """
+        Yields the generate URL to use; exceptions of the errors types raised inside count against that backend,
+        unless they are down to the request's deadline running out. exclude lists URLs not to use, raising
+        NoBackendAvailable if that leaves none.
+        """
+        backend = self.acquire(model, exclude)
+        try:
+            yield backend.url
+        except errors as e:
+            self.release(backend, None if deadline.expired() else e)
+            raise
+        except BaseException:
+            self.release(backend)
+            raise
+        else:
+            self.release(backend)
+
+    def check_health(self):
+        if self._probe_session is None:
+            # Not http_client's session: an open circuit breaker must not fail the probe that re-admits a backend
+            self._probe_session = requests.Session()
+        for backend in list(self.backends.values()):
+            try:
+                response = self._probe_session.get(health_url(backend.url), timeout=LLAMA_HEALTH_TIMEOUT)
+                healthy = response.ok
+                error = None if healthy else f"HTTP {response.status_code}"
+            except requests.RequestException as e:
+                healthy, error = False, str(e)
+            with self._lock:
+                if healthy and not backend.healthy:
+                    log_event(logger, logging.INFO, "llama backend healthy again", backend=backend.url)
+                    backend.consecutive_failures = 0
+                elif not healthy and backend.healthy:
+                    log_event(logger, logging.WARNING, "draining llama backend", backend=backend.url, error=error)
+                    backend.drained_at = time.monotonic()
+                backend.healthy = healthy
+                if error:
+                    backend.last_error = error
+
+    def _health_loop(self):
+        while True:
+            time.sleep(self.health_interval)
+            self.check_health()
+
+    def start_health_checks(self):
+        """
+        Starts the background probe thread once; a no-op when LLAMA_HEALTH_INTERVAL is 0.
+        """
+        with self._lock:
+            if self.health_interval <= 0 or self._health_thread is not None:
+                return
+            self._health_thread = threading.Thread(target=self._health_loop, name="ollama-health", daemon=True)
+            self._health_thread.start()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                backend.url: {
+                    "healthy": backend.healthy,
+                    "outstanding": backend.outstanding,
+                    "requests": backend.requests,
+                    "failures": backend.failures,
+                    "last_error": backend.last_error
+                }
+                for backend in self.backends.values()
+            }
+
+
+ollama_pool = OllamaPool()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Bounded-parallel page fetching for search results.
+
+Pages are downloaded concurrently with a per-host concurrency limit (waiting for a
+host's slot ends at the request's deadline). Bodies are fed
+to the streaming text extractor as they arrive and reading stops once enough text
+has been collected or PAGE_MAX_BYTES have been read. The extracted text is cached
+on disk together with the ETag/Last-Modified validators so repeat fetches become
+cheap conditional GETs.
+"""
+import codecs
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from dotenv import load_dotenv
+
+import deadline
+import http_client
+from html_extract import TextExtractor
+from observability import get_logger, log_event, metrics
+
+load_dotenv()
+
+logger = get_logger("page_fetcher")
+
+PAGE_MAX_BYTES = int(os.getenv("PAGE_MAX_BYTES", "262144"))  # stop reading a body after this many bytes
+PAGE_FETCH_WORKERS = int(os.getenv("PAGE_FETCH_WORKERS", "16"))
+PAGE_FETCH_PER_HOST = int(os.getenv("PAGE_FETCH_PER_HOST", "2"))
+PAGE_HOSTS_TRACKED = int(os.getenv("PAGE_HOSTS_TRACKED", "1024"))  # idle hosts' slots kept, least recent dropped
+PAGE_CACHE_DIR = os.getenv("PAGE_CACHE_DIR", "")  # empty disables the on-disk cache
+PAGE_CACHE_MAX_AGE = float(os.getenv("PAGE_CACHE_MAX_AGE", "300"))  # seconds served without revalidation
+
+_executor = ThreadPoolExecutor(max_workers=PAGE_FETCH_WORKERS, thread_name_prefix="page-fetch")
+_host_slots = OrderedDict()  # host -> [semaphore, fetches holding or waiting for it], least recent first
+_host_slots_lock = threading.Lock()
+
+
+@contextmanager
+def _host_slot(url: str):
+    """
+    Holds one of the host's PAGE_FETCH_PER_HOST slots for the block. Raises http_client.DeadlineExceeded
+    if the request's deadline passes while waiting.
+    """
+    host = urlsplit(url).netloc.lower()
+    with _host_slots_lock:
+        entry = _host_slots.get(host)
+        if entry is None:
+            entry = _host_slots[host] = [threading.BoundedSemaphore(PAGE_FETCH_PER_HOST), 0]
+        _host_slots.move_to_end(host)
+        entry[1] += 1
+        if len(_host_slots) > PAGE_HOSTS_TRACKED:
+            # Only idle hosts are forgotten; a second semaphore for a busy one would double its limit
+            idle = [name for name, (_, users) in _host_slots.items() if not users]
+            for name in idle[:len(_host_slots) - PAGE_HOSTS_TRACKED]:
+                del _host_slots[name]
+    try:
+        left = deadline.remaining()
+        if not entry[0].acquire(timeout=None if left is None else max(0.0, left)):
+            raise http_client.DeadlineExceeded(f"Request deadline exceeded waiting for a slot on {host}")
+        try:
+            yield
+        finally:
+            entry[0].release()
+    finally:
+        with _host_slots_lock:
+            entry[1] -= 1
+
+
+def _cache_path(url: str) -> str:
+    return os.path.join(PAGE_CACHE_DIR, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+
+def _load_cached(url: str):
+    if not PAGE_CACHE_DIR:
+        return None
+    try:
+        with open(_cache_path(url), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _store_cached(url: str, entry: dict):
+    if not PAGE_CACHE_DIR:
+        return
+    try:
+        os.makedirs(PAGE_CACHE_DIR, exist_ok=True)
+        path = _cache_path(url)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        # Atomic so concurrent workers never read a half-written entry
+        os.replace(tmp_path, path)
+    except OSError as e:
+        log_event(logger, logging.WARNING, "page cache write failed", error=str(e))
+
+
+def _extract_streaming(resp: requests.Response) -> str:
+    """
+    Feeds the body to a TextExtractor chunk by chunk, stopping at the text budget or PAGE_MAX_BYTES.
+    """
+    try:
+        decoder = codecs.getincrementaldecoder(resp.encoding or "utf-8")(errors="replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    extractor = TextExtractor()
+    remaining = PAGE_MAX_BYTES
+    for chunk in resp.iter_content(chunk_size=16384):
+        chunk = chunk[:remaining]
+        remaining -= len(chunk)
+        extractor.feed(decoder.decode(chunk))
+        if extractor.done or remaining <= 0:
+            break
+    return extractor.get_text()
+
+
+def fetch_page(url: str) -> str:
+    """
+    Returns the extracted text for url, or "" on failure.
+    """
+    cached = _load_cached(url)
+    if cached is not None and time.time() - cached["fetched_at"] < PAGE_CACHE_MAX_AGE:
+        return cached["text"]
+
+    headers = {}
+    if cached is not None:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    log_event(logger, logging.DEBUG, "fetching page", url=url)
+    try:
+        with _host_slot(url):
+            with http_client.get("pages", url, headers=headers, stream=True) as resp:
+                if resp.status_code == 304 and cached is not None:
+                    cached["fetched_at"] = time.time()
+                    _store_cached(url, cached)
+                    return cached["text"]
+                resp.raise_for_status()
+                text = _extract_streaming(resp)
+                etag = resp.headers.get("ETag")
+                last_modified = resp.headers.get("Last-Modified")
+    except requests.RequestException as e:
+        metrics.count_error("pages")
+        log_event(logger, logging.WARNING, "page fetch failed", url=url, error=str(e))
+        return cached["text"] if cached is not None else ""
+
+    _store_cached(url, {"text": text, "etag": etag, "last_modified": last_modified, "fetched_at": time.time()})
+    return text
+
+
+def fetch_pages(urls) -> dict:
+    """
+    Fetches all urls concurrently and returns {url: text}; failed pages map to "".
+    """
+    unique_urls = [url for url in dict.fromkeys(urls) if url]
+    futures = {url: deadline.submit(_executor, fetch_page, url) for url in unique_urls}
+    return {url: future.result() for url, future in futures.items()}
@@ -0,0 +1,573 @@
+#!/usr/bin/env python3
+"""
+Dependency-graph execution for the search pipeline.
+
+Each stage declares the stages it depends on and receives their results as
+keyword arguments. Stages whose dependencies are satisfied run concurrently on a
+shared thread pool, so end-to-end latency tracks the longest chain of LLM calls
+rather than their sum. Stages run under the deadline of the request that started
+the graph. AsyncStageGraph, run_search_pipeline_async and
+run_multi_country_pipeline_async do the same with asyncio tasks for the ASGI
+entry point.
+"""
+import asyncio
+import json
+import logging
+import os
+import queue
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from dotenv import load_dotenv
+
+import deadline
+import structured_output
+import token_budget
+from llm_scheduler import PRIORITY_QUERY_TRANSLATION, PRIORITY_SNIPPET_TRANSLATION
+from observability import get_logger, log_event, log_payload
+
+load_dotenv()
+
+logger = get_logger("pipeline")
+
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "32"))
+
+_executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="pipeline")
+
+TRANSLATED_LINE_PATTERN = re.compile(r'\d+\.\s(.*?):\s(.*)')
+
+
+class StageGraph:
+    """
+    A small DAG of named stages. Call add() for each stage, then run().
+    """
+
+    def __init__(self, executor=None):
+        self.executor = executor or _executor
+        self.stages = {}  # name -> (func, deps)
+        self.timings = {}  # name -> seconds
+
+    def add(self, name: str, func, deps=()):
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"Stage {name!r} depends on unknown stage {dep!r}")
+        self.stages[name] = (func, tuple(deps))
+        return self
+
+    def _timed(self, name, func, kwargs):
+        start = time.perf_counter()
+        try:
+            return func(**kwargs)
+        finally:
+            self.timings[name] = time.perf_counter() - start
+
+    def run(self) -> dict:
+        """
+        Runs every stage as soon as its dependencies finish and returns {name: result}.
+        The first stage exception is re-raised once in-flight stages have settled.
+        """
+        results = {}
+        pending = dict(self.stages)
+        running = {}
+        while pending or running:
+            for name, (func, deps) in list(pending.items()):
+                if all(dep in results for dep in deps):
+                    kwargs = {dep: results[dep] for dep in deps}
+                    running[deadline.submit(self.executor, self._timed, name, func, kwargs)] = name
+                    del pending[name]
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                error = future.exception()
+                if error is not None:
+                    wait(running)
+                    raise error
+                results[name] = future.result()
+        return results
+
+
+class AsyncStageGraph(StageGraph):
+    """
+    StageGraph whose stages are coroutine functions, run as tasks on the current event loop.
+    """
+
+    async def _timed_async(self, name, func, kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(**kwargs)
+        finally:
+            self.timings[name] = time.perf_counter() - start
+
+    async def run(self) -> dict:
+        results = {}
+        pending = dict(self.stages)
+        running = {}
+        try:
+            while pending or running:
+                for name, (func, deps) in list(pending.items()):
+                    if all(dep in results for dep in deps):
+                        kwargs = {dep: results[dep] for dep in deps}
+                        running[asyncio.ensure_future(self._timed_async(name, func, kwargs))] = name
+                        del pending[name]
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = running.pop(task)
+                    error = task.exception()
+                    if error is not None:
+                        if running:
+                            await asyncio.wait(running)
+                        raise error
+                    results[name] = task.result()
+        except asyncio.CancelledError:
+            # The client went away; stop the stages still in flight
+            for task in running:
+                task.cancel()
+            raise
+        return results
+
+
+def extract_results(search_results):
+    """
+    Turns raw Custom Search items into result cards and the numbered text used for translation.
+    """
+    results = []
+    articles = {}
+    for result in search_results:
+        title = result.get("title")
+        snippet = result.get("snippet")
+        link = result.get("link")
+        # Try to get an image from the result (if available)
+        image_url = None
+        pagemap = result.get("pagemap", {})
+        if "cse_image" in pagemap:
+            images = pagemap.get("cse_image")
+            if images and isinstance(images, list):
+                image_url = images[0].get("src")
+        results.append({
+            "title": title,
+            "snippet": snippet,
+            "link": link,
+            "image_url": image_url
+        })
+        if title and snippet:
+            articles[title] = snippet
+    return results, articles
+
+
+def aggregate_articles(articles: dict, separator: str) -> str:
+    return separator.join(
+        [f"{i}. {title}: {snippet}" for i, (title, snippet) in enumerate(articles.items(), start=1)]
+    )
+
+
+def apply_translation(results, translated_text: str):
+    """
+    Maps "N. title: snippet" lines of the translation back onto the result cards by position.
+    """
+    parsed_data = []
+    for match in TRANSLATED_LINE_PATTERN.finditer(translated_text):
+        parsed_data.append((match.group(1).strip(), match.group(2).strip()))
+
+    translated = [dict(result) for result in results]
+    for i, (title, snippet) in enumerate(parsed_data):
+        if i < len(translated):
+            translated[i]["title"] = title
+            translated[i]["snippet"] = snippet
+    return translated
+
+
+def append_page_excerpts(aggregated_text: str, results, pages: dict, separator: str) -> str:
+    """
+    Adds the fetched page text of each result below the snippets so the summary can draw on it.
+    """
+    excerpts = [
+        f"{i}. {pages[result['link']]}"
+        for i, result in enumerate(results, start=1)
+        if pages.get(result["link"])
+    ]
+    if not excerpts:
+        return aggregated_text
+    return separator.join([aggregated_text, "", "Page excerpts:"] + excerpts)
+
+
+def run_search_pipeline(query, country, comm_lang, summary_lang, *, translate, search, generate,
+                        summary_template, separator="\n", fetch_pages=None, structured_generate=None):
+    """
+    Runs translate-query -> search -> (translate-results || summarize) and returns (results, summary, timings).
+
+    The summary is generated in summary_lang straight from the original snippets,
+    so it no longer waits for the snippet translation to finish. When fetch_pages is
+    given, the result pages are downloaded alongside the snippet translation and
+    their text is added to the summary input. When structured_generate is given,
+    a single JSON-mode generation is tried first and the two-call path only runs if
+    its output fails validation.
+    """
+    def build(search):
+        results, articles = extract_results(search)
+        articles = token_budget.fit_articles(articles, snippet_budget)
+        aggregated_text = aggregate_articles(articles, separator)
+        log_payload(logger, "aggregated text", aggregated_text, query=query)
+        return results, aggregated_text
+
+    def page_context(results, pages):
+        if not pages:
+            return ""
+        context = append_page_excerpts("", results, pages, separator).strip()
+        return token_budget.truncate_to_tokens(context, token_budget.input_budget("structured") // 2)
+
+    def structured(build, fetch_pages=None):
+        results, _ = build
+        return structured_output.translate_and_summarize(
+            results, summary_lang, structured_generate, page_context(results, fetch_pages)
+        )
+
+    def translate_results(build, structured=None):
+        if structured is not None:
+            return None
+        return translate(build[1], summary_lang, priority=PRIORITY_SNIPPET_TRANSLATION)
+
+    def summarize(build, fetch_pages=None, structured=None):
+        if structured is not None:
+            return structured[1]
+        results, aggregated_text = build
+        if fetch_pages:
+            aggregated_text = append_page_excerpts(aggregated_text, results, fetch_pages, separator)
+            aggregated_text = token_budget.truncate_to_tokens(
+                aggregated_text, token_budget.input_budget("summary", summary_template)
+            )
+        summary_prompt = summary_template.format(summary_lang=summary_lang, text=aggregated_text)
+        return generate(summary_prompt)
+
+    def translated_results(build, translate_results, structured=None):
+        if structured is not None:
+            return structured[0]
+        return apply_translation(build[0], translate_results)
+
+    # The same snippet text feeds both the translation and the summary prompt
+    snippet_budget = min(
+        token_budget.input_budget("snippet_translation"),
+        token_budget.input_budget("summary", summary_template)
+    )
+
+    graph = StageGraph()
+    graph.add("translate_query", lambda: translate(query, comm_lang, priority=PRIORITY_QUERY_TRANSLATION))
+    graph.add("search", lambda translate_query: search(translate_query, gl=country, hl=comm_lang),
+              deps=("translate_query",))
+    graph.add("build", build, deps=("search",))
+    page_deps = ()
+    if fetch_pages is not None:
+        graph.add("fetch_pages", lambda build: fetch_pages([result["link"] for result in build[0]]),
+                  deps=("build",))
+        page_deps = ("fetch_pages",)
+    fallback_deps = ()
+    if structured_generate is not None:
+        graph.add("structured", structured, deps=("build",) + page_deps)
+        fallback_deps = ("structured",)
+    graph.add("translate_results", translate_results, deps=("build",) + fallback_deps)
+    graph.add("summarize", summarize, deps=("build",) + page_deps + fallback_deps)
+    graph.add("apply_translation", translated_results, deps=("build", "translate_results") + fallback_deps)
+    outputs = graph.run()
+
+    log_event(
+        logger, logging.INFO, "pipeline finished",
+        query=query, timings={name: round(seconds, 3) for name, seconds in graph.timings.items()}
+    )
+    return outputs["apply_translation"], outputs["summarize"], graph.timings
+
+
+def run_multi_country_pipeline(query, countries, summary_lang, *, language_for, translate, search, generate,
+                               summary_template, separator="\n", country_names=None):
+    """
+    Fans one query out over several countries and returns (results_by_country, summary, timings).
+
+    The query is translated once per distinct search language, every country is searched as soon
+    as its translation is ready, each country's snippets are translated on their own, and a single
+    summary with one section per country is generated from all of them. Stages for different
+    countries run concurrently, so latency follows the slowest country rather than the count.
+    Stage names carry the language or country after a dot ("search.no").
+    """
+    country_names = country_names or {}
+    languages = {country: language_for(country) for country in countries}
+    # Every country gets an equal share of the summary prompt
+    snippet_budget = min(
+        token_budget.input_budget("snippet_translation"),
+        token_budget.input_budget("summary", summary_template) // len(countries)
+    )
+
+    def translate_query(lang):
+        return lambda: translate(query, lang, priority=PRIORITY_QUERY_TRANSLATION)
+
+    def search_country(country, lang):
+        def stage(**deps):
+            results, articles = extract_results(search(deps[f"translate_query.{lang}"], gl=country, hl=lang))
+            articles = token_budget.fit_articles(articles, snippet_budget)
+            return results, aggregate_articles(articles, separator)
+        return stage
+
+    def translate_country(country):
+        def stage(**deps):
+            results, aggregated_text = deps[f"search.{country}"]
+            if not aggregated_text:
+                return results
+            translated_text = translate(aggregated_text, summary_lang, priority=PRIORITY_SNIPPET_TRANSLATION)
+            return apply_translation(results, translated_text)
+        return stage
+
+    def summarize(**deps):
+        sections = []
+        for country in countries:
+            _, aggregated_text = deps[f"search.{country}"]
+            if aggregated_text:
+                name = country_names.get(country, country)
+                sections.append(separator.join([f"## {name} ({country})", aggregated_text]))
+        if not sections:
+            return ""
+        text = (separator * 2).join(sections)
+        return generate(summary_template.format(summary_lang=summary_lang, text=text))
+
+    graph = StageGraph()
+    for lang in sorted(set(languages.values())):
+        graph.add(f"translate_query.{lang}", translate_query(lang))
+    for country, lang in languages.items():
+        graph.add(f"search.{country}", search_country(country, lang), deps=(f"translate_query.{lang}",))
+        graph.add(f"translate_results.{country}", translate_country(country), deps=(f"search.{country}",))
+    graph.add("summarize", summarize, deps=tuple(f"search.{country}" for country in countries))
+    outputs = graph.run()
+
+    log_event(
+        logger, logging.INFO, "multi-country pipeline finished",
+        query=query, countries=list(countries),
+        timings={name: round(seconds, 3) for name, seconds in graph.timings.items()}
+    )
+    results_by_country = {country: outputs[f"translate_results.{country}"] for country in countries}
+    return results_by_country, outputs["summarize"], graph.timings
+
+
+async def run_search_pipeline_async(query, country, comm_lang, summary_lang, *, translate, search, generate,
+                                    summary_template, separator="\n", fetch_pages=None, structured_generate=None):
+    """
+    run_search_pipeline for the ASGI entry point: translate, search, generate, fetch_pages and
+    structured_generate are coroutine functions and the stages run as tasks on the event loop.
+    """
+    async def translate_query():
+        return await translate(query, comm_lang, priority=PRIORITY_QUERY_TRANSLATION)
+
+    async def search_stage(translate_query):
+        return await search(translate_query, gl=country, hl=comm_lang)
+
+    async def build(search):
+        results, articles = extract_results(search)
+        articles = token_budget.fit_articles(articles, snippet_budget)
+        aggregated_text = aggregate_articles(articles, separator)
+        log_payload(logger, "aggregated text", aggregated_text, query=query)
+        return results, aggregated_text
+
+    async def fetch_pages_stage(build):
+        return await fetch_pages([result["link"] for result in build[0]])
+
+    async def structured(build, fetch_pages=None):
+        results, _ = build
+        context = ""
+        if fetch_pages:
+            context = token_budget.truncate_to_tokens(
+                append_page_excerpts("", results, fetch_pages, separator).strip(),
+                token_budget.input_budget("structured") // 2
+            )
+        return await structured_output.translate_and_summarize_async(
+            results, summary_lang, structured_generate, context
+        )
+
+    async def translate_results(build, structured=None):
+        if structured is not None:
+            return None
+        return await translate(build[1], summary_lang, priority=PRIORITY_SNIPPET_TRANSLATION)
+
+    async def summarize(build, fetch_pages=None, structured=None):
+        if structured is not None:
+            return structured[1]
+        results, aggregated_text = build
+        if fetch_pages:
+            aggregated_text = append_page_excerpts(aggregated_text, results, fetch_pages, separator)
+            aggregated_text = token_budget.truncate_to_tokens(
+                aggregated_text, token_budget.input_budget("summary", summary_template)
+            )
+        return await generate(summary_template.format(summary_lang=summary_lang, text=aggregated_text))
+
+    async def translated_results(build, translate_results, structured=None):
+        if structured is not None:
+            return structured[0]
+        return apply_translation(build[0], translate_results)
+
+    snippet_budget = min(
+        token_budget.input_budget("snippet_translation"),
+        token_budget.input_budget("summary", summary_template)
+    )
+
+    graph = AsyncStageGraph()
+    graph.add("translate_query", translate_query)
+    graph.add("search", search_stage, deps=("translate_query",))
+    graph.add("build", build, deps=("search",))
+    page_deps = ()
+    if fetch_pages is not None:
+        graph.add("fetch_pages", fetch_pages_stage, deps=("build",))
+        page_deps = ("fetch_pages",)
+    fallback_deps = ()
+    if structured_generate is not None:
+        graph.add("structured", structured, deps=("build",) + page_deps)
+        fallback_deps = ("structured",)
+    graph.add("translate_results", translate_results, deps=("build",) + fallback_deps)
+    graph.add("summarize", summarize, deps=("build",) + page_deps + fallback_deps)
+    graph.add("apply_translation", translated_results, deps=("build", "translate_results") + fallback_deps)
+    outputs = await graph.run()
+
+    log_event(
+        logger, logging.INFO, "pipeline finished",
+        query=query, timings={name: round(seconds, 3) for name, seconds in graph.timings.items()}
+    )
+    return outputs["apply_translation"], outputs["summarize"], graph.timings
+
+
+async def run_multi_country_pipeline_async(query, countries, summary_lang, *, language_for, translate, search,
+                                          generate, summary_template, separator="\n", country_names=None):
+    """
+    run_multi_country_pipeline for the ASGI entry point: translate, search and generate are coroutine
+    functions and the stages run as tasks on the event loop.
+    """
+    country_names = country_names or {}
+    languages = {country: language_for(country) for country in countries}
+    snippet_budget = min(
+        token_budget.input_budget("snippet_translation"),
+        token_budget.input_budget("summary", summary_template) // len(countries)
+    )
+
+    def translate_query(lang):
+        async def stage():
+            return await translate(query, lang, priority=PRIORITY_QUERY_TRANSLATION)
+        return stage
+
+    def search_country(country, lang):
+        async def stage(**deps):
+            results, articles = extract_results(await search(deps[f"translate_query.{lang}"], gl=country, hl=lang))
+            articles = token_budget.fit_articles(articles, snippet_budget)
+            return results, aggregate_articles(articles, separator)
+        return stage
+
+    def translate_country(country):
+        async def stage(**deps):
+            results, aggregated_text = deps[f"search.{country}"]
+            if not aggregated_text:
+                return results
+            translated_text = await translate(aggregated_text, summary_lang, priority=PRIORITY_SNIPPET_TRANSLATION)
+            return apply_translation(results, translated_text)
+        return stage
+
+    async def summarize(**deps):
+        sections = []
+        for country in countries:
+            _, aggregated_text = deps[f"search.{country}"]
+            if aggregated_text:
+                name = country_names.get(country, country)
+                sections.append(separator.join([f"## {name} ({country})", aggregated_text]))
+        if not sections:
+            return ""
+        text = (separator * 2).join(sections)
+        return await generate(summary_template.format(summary_lang=summary_lang, text=text))
+
+    graph = AsyncStageGraph()
+    for lang in sorted(set(languages.values())):
+        graph.add(f"translate_query.{lang}", translate_query(lang))
+    for country, lang in languages.items():
+        graph.add(f"search.{country}", search_country(country, lang), deps=(f"translate_query.{lang}",))
+        graph.add(f"translate_results.{country}", translate_country(country), deps=(f"search.{country}",))
+    graph.add("summarize", summarize, deps=tuple(f"search.{country}" for country in countries))
+    outputs = await graph.run()
+
+    log_event(
+        logger, logging.INFO, "multi-country pipeline finished",
+        query=query, countries=list(countries),
+        timings={name: round(seconds, 3) for name, seconds in graph.timings.items()}
+    )
+    results_by_country = {country: outputs[f"translate_results.{country}"] for country in countries}
+    return results_by_country, outputs["summarize"], graph.timings
+
+
+def format_sse(event: str, data) -> str:
+    """
+    Formats one Server-Sent Events message with a JSON payload.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def stream_search_pipeline(query, country, comm_lang, summary_lang, *, translate, search, generate_stream,
+                           summary_template, separator="\n", fetch_pages=None):
+    """
+    Generator version of run_search_pipeline yielding (event, data) pairs as soon as each piece is ready:
+    translated_query, results (untranslated), then translated_results and summary_token/summary
+    interleaved as the two concurrent LLM calls progress, and finally done (carrying the stage timings).
+    """
+    timings = {}
+    start = time.perf_counter()
+    translated_query = translate(query, comm_lang, priority=PRIORITY_QUERY_TRANSLATION)
+    timings["translate_query"] = time.perf_counter() - start
+    yield "translated_query", {"translated_query": translated_query}
+
+    start = time.perf_counter()
+    search_results = search(translated_query, gl=country, hl=comm_lang)
+    timings["search"] = time.perf_counter() - start
+    results, articles = extract_results(search_results)
+    yield "results", {"results": results}
+
+    articles = token_budget.fit_articles(articles, min(
+        token_budget.input_budget("snippet_translation"),
+        token_budget.input_budget("summary", summary_template)
+    ))
+    aggregated_text = aggregate_articles(articles, separator)
+    events = queue.Queue()
+    finished = object()
+
+    def translate_results():
+        start = time.perf_counter()
+        try:
+            translated_text = translate(aggregated_text, summary_lang, priority=PRIORITY_SNIPPET_TRANSLATION)
+            translated = apply_translation(results, translated_text)
+            events.put(("translated_results", {"results": translated}))
+        except Exception as e:
+            events.put(("error", {"stage": "translate_results", "error": str(e)}))
+        finally:
+            timings["translate_results"] = time.perf_counter() - start
+            events.put(finished)
+
+    def summarize():
+        start = time.perf_counter()
+        try:
+            summary_text = aggregated_text
+            if fetch_pages is not None:
+                pages = fetch_pages([result["link"] for result in results])
+                timings["fetch_pages"] = time.perf_counter() - start
+                summary_text = token_budget.truncate_to_tokens(
+                    append_page_excerpts(aggregated_text, results, pages, separator),
+                    token_budget.input_budget("summary", summary_template)
+                )
+            summary_prompt = summary_template.format(summary_lang=summary_lang, text=summary_text)
+            tokens = []
+            for token in generate_stream(summary_prompt):
+                tokens.append(token)
+                events.put(("summary_token", {"token": token}))
+            events.put(("summary", {"summary": "".join(tokens)}))
+        except Exception as e:
+            events.put(("error", {"stage": "summarize", "error": str(e)}))
+        finally:
+            timings["summarize"] = time.perf_counter() - start
+            events.put(finished)
+
+    deadline.submit(_executor, translate_results)
+    deadline.submit(_executor, summarize)
+    remaining = 2
+    while remaining:
+        item = events.get()
+        if item is finished:
+            remaining -= 1
+            continue
+        yield item
+    yield "done", {"timings": {name: round(seconds, 3) for name, seconds in timings.items()}}
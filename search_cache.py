@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+TTL cache with stale-while-revalidate for Google Custom Search results.
+
+Fresh entries are served directly. Stale entries are served immediately while a
+single background thread (an asyncio task for get_or_fetch_async) refreshes them.
+Failed lookups are cached for a short error TTL so an upstream outage does not
+turn every request into an API call.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from observability import get_logger, log_event
+
+load_dotenv()
+
+logger = get_logger("search_cache")
+
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "512"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "600"))  # seconds an entry is fresh
+SEARCH_CACHE_STALE_TTL = float(os.getenv("SEARCH_CACHE_STALE_TTL", "3600"))  # extra seconds it may be served stale
+SEARCH_CACHE_ERROR_TTL = float(os.getenv("SEARCH_CACHE_ERROR_TTL", "30"))  # seconds a failure is remembered
+
+
+class SearchCache:
+    """
+    Caches fetch results per key with fresh, stale and error lifetimes.
+    """
+
+    def __init__(self, max_entries=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL,
+                 stale_ttl=SEARCH_CACHE_STALE_TTL, error_ttl=SEARCH_CACHE_ERROR_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.error_ttl = error_ttl
+        self._entries = OrderedDict()  # key -> (fresh_until, stale_until, value)
+        self._refreshing = set()
+        self._tasks = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.error_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.errors = 0
+
+    def _store(self, key, value, fresh_for, stale_for):
+        now = time.time()
+        with self._lock:
+            self._entries[key] = (now + fresh_for, now + fresh_for + stale_for, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _fetch(self, key, fetch, fallback):
+        try:
+            value = fetch()
+        except Exception as e:
+            log_event(logger, logging.WARNING, "search cache fetch failed", error=str(e))
+            with self._lock:
+                self.errors += 1
+            self._store(key, ("error", fallback), self.error_ttl, 0)
+            return fallback
+        self._store(key, ("ok", value), self.ttl, self.stale_ttl)
+        return value
+
+    def _refresh(self, key, fetch):
+        try:
+            value = fetch()
+        except Exception as e:
+            # Keep serving the stale copy until it expires for good
+            log_event(logger, logging.WARNING, "background search refresh failed", error=str(e))
+            with self._lock:
+                self.errors += 1
+        else:
+            self._store(key, ("ok", value), self.ttl, self.stale_ttl)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _lookup(self, key):
+        """
+        Returns (found, value, refresh); refresh is True when the caller should revalidate a stale hit.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                fresh_until, stale_until, (status, value) = entry
+                if now < fresh_until:
+                    self._entries.move_to_end(key)
+                    if status == "error":
+                        self.error_hits += 1
+                    else:
+                        self.hits += 1
+                    return True, value, False
+                if now < stale_until and status == "ok":
+                    self.stale_hits += 1
+                    refresh = key not in self._refreshing
+                    if refresh:
+                        self._refreshing.add(key)
+                        self.refreshes += 1
+                    return True, value, refresh
+                del self._entries[key]
+            self.misses += 1
+        return False, None, False
+
+    def get_or_fetch(self, key, fetch, fallback=None):
+        """
+        Returns the cached value for key, calling fetch() on a miss.
+        fetch must raise on failure; the fallback is then returned and cached briefly.
+        """
+        found, value, refresh = self._lookup(key)
+        if refresh:
+            threading.Thread(target=self._refresh, args=(key, fetch), daemon=True).start()
+        if found:
+            return value
+        return self._fetch(key, fetch, fallback)
+
+    def refresh(self, key, fetch, fallback=None):
+        """
+        Calls fetch() whatever is cached and stores the result, for callers that must not be served a
+        stale copy. On failure the cached entry is left alone and the fallback is returned.
+        """
+        try:
+            value = fetch()
+        except Exception as e:
+            log_event(logger, logging.WARNING, "search cache forced refresh failed", error=str(e))
+            with self._lock:
+                self.errors += 1
+            return fallback
+        self._store(key, ("ok", value), self.ttl, self.stale_ttl)
+        return value
+
+    async def _fetch_async(self, key, fetch, fallback):
+        try:
+            value = await fetch()
+        except Exception as e:
+            log_event(logger, logging.WARNING, "search cache fetch failed", error=str(e))
+            with self._lock:
+                self.errors += 1
+            self._store(key, ("error", fallback), self.error_ttl, 0)
+            return fallback
+        self._store(key, ("ok", value), self.ttl, self.stale_ttl)
+        return value
+
+    async def _refresh_async(self, key, fetch):
+        try:
+            value = await fetch()
+        except Exception as e:
+            log_event(logger, logging.WARNING, "background search refresh failed", error=str(e))
+            with self._lock:
+                self.errors += 1
+        else:
+            self._store(key, ("ok", value), self.ttl, self.stale_ttl)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+                self._tasks.discard(asyncio.current_task())
+
+    async def get_or_fetch_async(self, key, fetch, fallback=None):
+        """
+        get_or_fetch for coroutine fetch functions; stale entries are revalidated in a background task.
+        """
+        found, value, refresh = self._lookup(key)
+        if refresh:
+            task = asyncio.get_running_loop().create_task(self._refresh_async(key, fetch))
+            # The loop only keeps weak references to tasks
+            with self._lock:
+                self._tasks.add(task)
+        if found:
+            return value
+        return await self._fetch_async(key, fetch, fallback)
+
+    async def refresh_async(self, key, fetch, fallback=None):
+        """
+        refresh for coroutine fetch functions.
+        """
+        try:
+            value = await fetch()
+        except Exception as e:
+            log_event(logger, logging.WARNING, "search cache forced refresh failed", error=str(e))
+            with self._lock:
+                self.errors += 1
+            return fallback
+        self._store(key, ("ok", value), self.ttl, self.stale_ttl)
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.error_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "error_hits": self.error_hits,
+                "misses": self.misses,
+                "background_refreshes": self.refreshes,
+                "fetch_errors": self.errors,
+                "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0
+            }
+
+
+search_cache = SearchCache()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Deep Custom Search result sets fetched page by page in parallel.
+
+Custom Search returns at most 10 items per call, so SEARCH_RESULT_DEPTH results
+need one call per page (start=1, 11, 21, ...). The pages are requested
+concurrently, so wall time stays close to a single call. They are then merged in
+rank order, and links that normalize to the same URL are kept once.
+"""
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from dotenv import load_dotenv
+
+import deadline
+from observability import get_logger, log_event
+
+load_dotenv()
+
+logger = get_logger("search_pages")
+
+PAGE_SIZE = 10  # the API maximum for num
+MAX_START = 91  # the API rejects start + num > 100
+SEARCH_RESULT_DEPTH = int(os.getenv("SEARCH_RESULT_DEPTH", "10"))
+SEARCH_PAGE_WORKERS = int(os.getenv("SEARCH_PAGE_WORKERS", "16"))
+
+# Query parameters that only identify the referrer or campaign
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid")
+
+_executor = ThreadPoolExecutor(max_workers=SEARCH_PAGE_WORKERS, thread_name_prefix="search-page")
+
+
+def page_starts(depth: int = SEARCH_RESULT_DEPTH):
+    """
+    Returns the start index of every page needed for depth results: 25 -> [1, 11, 21].
+    """
+    depth = max(1, depth)
+    return list(range(1, min(depth, MAX_START + PAGE_SIZE - 1) + 1, PAGE_SIZE))
+
+
+def normalize_link(link: str) -> str:
+    """
+    Maps URLs that point to the same article onto one key: scheme, "www." and a trailing slash
+    are ignored, as are fragments and tracking parameters.
+    """
+    parts = urlsplit((link or "").strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith(TRACKING_PARAMS)
+    ]
+    return urlunsplit(("", host, parts.path.rstrip("/") or "/", urlencode(sorted(query)), ""))
+
+
+def merge_pages(pages, depth: int = SEARCH_RESULT_DEPTH):
+    """
+    Concatenates pages of items in order, keeping the first item for each normalized link.
+    """
+    seen = set()
+    merged = []
+    for items in pages:
+        for item in items:
+            key = normalize_link(item.get("link"))
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(item)
+    return merged[:depth]
+
+
+def _merge_fetched(outcomes, starts, depth):
+    # The first page carries the top results; without it the search counts as failed
+    if isinstance(outcomes[0], Exception):
+        raise outcomes[0]
+    pages = []
+    for start, outcome in zip(starts, outcomes):
+        if isinstance(outcome, Exception):
+            log_event(logger, logging.WARNING, "search page failed", start=start, error=str(outcome))
+            continue
+        pages.append(outcome)
+    return merge_pages(pages, depth)
+
+
+def fetch_all(fetch_page, depth: int = SEARCH_RESULT_DEPTH):
+    """
+    Calls fetch_page(start) for every page concurrently and returns the merged items.
+    Later pages that fail are skipped; a failure of the first page is raised.
+    """
+    starts = page_starts(depth)
+    if len(starts) == 1:
+        return merge_pages([fetch_page(1)], depth)
+    futures = [deadline.submit(_executor, fetch_page, start) for start in starts]
+    outcomes = []
+    for future in futures:
+        try:
+            outcomes.append(future.result())
+        except Exception as e:
+            outcomes.append(e)
+    return _merge_fetched(outcomes, starts, depth)
+
+
+async def fetch_all_async(fetch_page, depth: int = SEARCH_RESULT_DEPTH):
+    """
+    fetch_all for a coroutine fetch_page(start).
+    """
+    starts = page_starts(depth)
+    outcomes = await asyncio.gather(*(fetch_page(start) for start in starts), return_exceptions=True)
+    return _merge_fetched(outcomes, starts, depth)
@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+The search and Llama calls shared by the Flask apps (main.py, new-ui/app.py and
+vercel/backend/app.py): Ollama generation behind the scheduler, backend pool,
+coalescing and hedging; cached query and snippet translation; cached Custom
+Search; and their wiring into the pipelines in pipeline.py. The apps keep only
+their routes and request handling.
+
+Configuration, prompt templates and the country mapping live here as well; the
+ASGI entry point imports them for its async versions of these calls.
+"""
+import functools
+import json
+import logging
+import os
+import time
+
+import requests
+from dotenv import load_dotenv
+
+import deadline
+import http_client
+import page_fetcher
+import search_pages
+from hedging import hedger
+from lang_id import is_language
+from llm_scheduler import (
+    PRIORITY_NAMES, PRIORITY_SNIPPET_TRANSLATION, PRIORITY_SUMMARY, SchedulerQueueFull, llm_scheduler
+)
+from observability import get_logger, log_event, log_payload, metrics
+from ollama_pool import ollama_pool
+from pipeline import (
+    extract_results, run_multi_country_pipeline, run_search_pipeline, stream_search_pipeline
+)
+from search_cache import search_cache
+from single_flight import llama_flight, search_flight
+from token_budget import (
+    STAGE_BUDGETS, estimate_tokens, input_budget, options_for, token_stats, truncate_to_tokens
+)
+from translation_cache import translation_cache
+from warmup import LLAMA_KEEP_ALIVE
+
+load_dotenv()
+
+logger = get_logger("search")
+
+# Core configuration (overridable via environment variables)
+API_KEY = os.getenv("API_KEY")
+SEARCH_ENGINE_ID = os.getenv("SEARCH_ENGINE_ID")
+LLAMA_MODEL = os.getenv("LLAMA_MODEL", "llama3.3:70b")
+DEFAULT_LANG = os.getenv("DEFAULT_LANG", "en")  # fallback language if country not found
+DEFAULT_COUNTRY = os.getenv("DEFAULT_COUNTRY", "no")
+DEFAULT_SUMMARY_LANG = os.getenv("DEFAULT_SUMMARY_LANG", DEFAULT_LANG)
+GOOGLE_SEARCH_API_URL = os.getenv("GOOGLE_SEARCH_API_URL", "https://www.googleapis.com/customsearch/v1")
+TEXT_SEPARATOR = os.getenv("TEXT_SEPARATOR", "\n")
+# Translate results and summarize in one JSON-mode generation, falling back to two calls
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "False").lower() in ("true", "1", "t")
+# Download result pages and feed their text into the summary
+FETCH_PAGE_TEXT = os.getenv("FETCH_PAGE_TEXT", "False").lower() in ("true", "1", "t")
+
+# Prompt templates (customizable)
+TRANSLATION_PROMPT_TEMPLATE = os.getenv(
+    "TRANSLATION_PROMPT_TEMPLATE",
+    "Translate the following text into {target_lang}. ONLY output the translated text:\n\n{text}\n\nTranslation:"
+)
+SUMMARY_PROMPT_TEMPLATE = os.getenv(
+    "SUMMARY_PROMPT_TEMPLATE",
+    "Summarize the following in {summary_lang}:\n\n{text}\n\nSummary:"
+)
+MULTI_COUNTRY_SUMMARY_PROMPT_TEMPLATE = os.getenv(
+    "MULTI_COUNTRY_SUMMARY_PROMPT_TEMPLATE",
+    "The following search results come from several countries, grouped under a heading per country. "
+    "Summarize them in {summary_lang} with one section per country, using the same headings, and note "
+    "where the coverage differs:\n\n{text}\n\nSummary:"
+)
+
+# Supported countries for the dropdown menu
+supported_countries = [
+    {"code": "us", "name": "United States"},
+    {"code": "no", "name": "Norway"},
+    {"code": "jp", "name": "Japan"},
+    {"code": "fr", "name": "France"},
+    {"code": "de", "name": "Germany"}
+]
+
+# Mapping from country code to language code
+country_to_language = {
+    "us": "en",
+    "no": "no",  # Norwegian
+    "jp": "ja",  # Japanese (ISO 639-1; also what Google's hl expects)
+    "fr": "fr",
+    "de": "de"
+}
+
+# Pre-defined results served instead of Custom Search with USE_STATIC_RESULTS
+STATIC_RESULTS = [
+    {
+        "title": "Trikk krasjet i Oslo: Føreren er siktet",
+        "snippet": "Resultat fra VG: Trikk krasjet i Oslo med siktet fører. Fire skadde.",
+        "link": "https://www.vg.no/nyheter/i/vgxjaX/trikk-krasjet-i-butikk-i-oslo-trikkefoereren-er-siktet",
+        "image_url": "https://www.vg.no/images/2024/10/29/Trikk-krasjet-i-butikk-i-Oslo.jpg"
+    },
+    {
+        "title": "Trikk, Ulykke | Trikk krasjet inn i Eplehuset i Storgata",
+        "snippet": "Resultat fra ao.no: Trikk krasjet inn i Eplehuset i Storgata.",
+        "link": "https://www.ao.no/trikki-butikk-i-storgata/s/5-128-914143",
+        "image_url": "https://www.vg.no/images/2024/10/29/Trikk-krasjet-i-butikk-i-Oslo.jpg"
+    },
+    {
+        "title": "Trikkeulykken i Oslo henlegges – Stor-Oslo",
+        "snippet": "Resultat fra NRK: Trikkeulykken i Oslo henlegges.",
+        "link": "https://www.nrk.no/stor-oslo/trikkeulykken-i-oslo-henlegges-1.17178415",
+        "image_url": "https://www.vg.no/images/2024/10/29/Trikk-krasjet-i-butikk-i-Oslo.jpg"
+    },
+    {
+        "title": "Oslo trikkulykke. Mannen ble hardt skadet",
+        "snippet": "Resultat fra Wataha: Oslo trikkulykke med hardt skadet mann.",
+        "link": "https://wataha.no/no/2021/10/05/oslo-wypadek-tramwajowy-mezczyzna-ciezko-ranny/",
+        "image_url": "https://www.vg.no/images/2024/10/29/Trikk-krasjet-i-butikk-i-Oslo.jpg"
+    },
+    {
+        "title": "Trikkeulykken i Storgata – Stor-Oslo",
+        "snippet": "Resultat fra NRK: Trikkeulykken i Storgata.",
+        "link": "https://www.nrk.no/stor-oslo/trikkeulykken-i-storgata-1.17104779",
+        "image_url": "https://www.vg.no/images/2024/10/29/Trikk-krasjet-i-butikk-i-Oslo.jpg"
+    },
+    {
+        "title": "Trikk, Ulykke | Person påkjørt av trikk i Oslo",
+        "snippet": "Resultat fra Nettavisen: Person påkjørt av trikk i Oslo.",
+        "link": "https://www.nettavisen.no/nyheter/person-pakjort-av-trikk-i-oslo/s/12-95-3423942827",
+        "image_url": "https://www.vg.no/images/2024/10/29/Trikk-krasjet-i-butikk-i-Oslo.jpg"
+    },
+    {
+        "title": "Trikk sporet av og krasjet inn i butikk i Oslo sentrum: Fire personer ...",
+        "snippet": "Resultat fra Inyheter: Trikk sporet av og krasjet inn i butikk i Oslo sentrum.",
+        "link": "https://inyheter.no/29/10/2024/trikk-sporet-av-og-krasjet-inn-i-butikk-i-oslo-sentrum-fire-personer-skadet/",
+        "image_url": "https://www.vg.no/images/2024/10/29/Trikk-krasjet-i-butikk-i-Oslo.jpg"
+    },
+    {
+        "title": "Trikkeulykken i Storgata – Wikipedia",
+        "snippet": "Resultat fra Wikipedia: Informasjon om trikkeulykken i Storgata.",
+        "link": "https://no.wikipedia.org/wiki/Trikkeulykken_i_Storgata",
+        "image_url": "https://www.vg.no/images/2024/10/29/Trikk-krasjet-i-butikk-i-Oslo.jpg"
+    },
+    {
+        "title": "Avisa Oslo | Den lille taco-trucken i Schweigaards gate blir omfavnet ...",
+        "snippet": "Resultat fra Instagram: Den lille taco-trucken i Schweigaards gate.",
+        "link": "https://www.instagram.com/avisaoslo/reel/C-MtkbRo80h/",
+        "image_url": "https://www.vg.no/images/2024/10/29/Trikk-krasjet-i-butikk-i-Oslo.jpg"
+    },
+    {
+        "title": "Trikkeulykken i Oslo: Politiet henlegger saken: - Glad det ikke gikk ...",
+        "snippet": "Resultat fra TV2: Politiet henlegger saken etter trikkulykke.",
+        "link": "https://www.tv2.no/nyheter/politiet-henlegger-saken-glad-det-ikke-gikk-verre/17300477/",
+        "image_url": "https://www.vg.no/images/2024/10/29/Trikk-krasjet-i-butikk-i-Oslo.jpg"
+    },
+]
+
+
+def language_for(country):
+    return country_to_language.get(country, DEFAULT_LANG)
+
+
+class SearchService:
+    """
+    The Llama and Custom Search calls behind a search. With static_results set, searches
+    return that list instead of calling the Custom Search API.
+    """
+
+    def __init__(self, static_results=None):
+        self.static_results = static_results
+
+    def call_llama(self, prompt: str, priority: int = PRIORITY_SUMMARY, response_format=None) -> str:
+        """
+        Calls the Llama model via a local API.
+        Identical prompts already in flight share a single generation.
+        """
+        return llama_flight.do(
+            (LLAMA_MODEL, prompt, response_format),
+            lambda: self.generate_llama(prompt, priority, response_format)
+        )
+
+    def call_llama_json(self, prompt: str) -> str:
+        """
+        Calls the Llama model in JSON output mode (used by the structured translate-and-summarize path).
+        """
+        return self.call_llama(prompt, PRIORITY_SNIPPET_TRANSLATION, response_format="json")
+
+    def generate_llama(self, prompt: str, priority: int = PRIORITY_SUMMARY, response_format=None) -> str:
+        """
+        Sends one non-streaming generation request to the Llama API once the scheduler grants a slot.
+        """
+        stage = "structured" if response_format else PRIORITY_NAMES[priority]
+        log_payload(logger, "llama prompt", prompt, stage=stage)
+        prompt_tokens = estimate_tokens(prompt)
+        if prompt_tokens > STAGE_BUDGETS[stage]["max_input_tokens"]:
+            log_event(
+                logger, logging.WARNING, "prompt exceeds input budget", stage=stage, estimated_tokens=prompt_tokens
+            )
+        payload = {
+            "model": LLAMA_MODEL,
+            "prompt": prompt,
+            "stream": False,
+            "options": options_for(stage),
+            "keep_alive": LLAMA_KEEP_ALIVE
+        }
+        if response_format:
+            payload["format"] = response_format
+        # Translations are safe to repeat, so a slow one may be hedged, but only on another backend
+        hedge = None
+        if not response_format and priority != PRIORITY_SUMMARY and ollama_pool.routable(LLAMA_MODEL) > 1:
+            hedge = f"llama.{stage}"
+        leased = []
+
+        def send(llama_url):
+            response = http_client.post("llama", llama_url, json=payload)
+            response.raise_for_status()
+            return response.json()
+
+        def attempt():
+            with llm_scheduler.slot(priority) as queue_wait, ollama_pool.lease(LLAMA_MODEL) as llama_url:
+                log_event(logger, logging.DEBUG, "llama slot granted", stage=stage, queue_wait=round(queue_wait, 3))
+                leased.append(llama_url)
+                return send(llama_url)
+
+        def hedge_attempt(started):
+            # A slot and a backend of its own, so the hedge never exceeds LLM_MAX_CONCURRENCY and is
+            # only sent when there is idle capacity; the slower attempt keeps both until it finishes
+            with llm_scheduler.spare_slot(priority), ollama_pool.lease(LLAMA_MODEL, exclude=leased) as llama_url:
+                started()
+                return send(llama_url)
+
+        try:
+            result_json = attempt() if hedge is None else hedger.call(hedge, attempt, hedge_attempt=hedge_attempt)
+            token_stats.record(stage, prompt, result_json)
+            llama_response = result_json.get("response", "Error: No response from Llama")
+            log_payload(logger, "llama response", llama_response, stage=stage)
+            return llama_response
+        except (requests.RequestException, SchedulerQueueFull) as e:
+            metrics.count_error("llama")
+            error_msg = f"Error calling Llama: {e}"
+            log_event(logger, logging.ERROR, "llama call failed", stage=stage, error=str(e))
+            return error_msg
+
+    def call_llama_stream(self, prompt: str):
+        """
+        Calls the Llama model with streaming enabled and yields response tokens as they arrive.
+        """
+        log_payload(logger, "llama prompt", prompt, stage="summary", stream=True)
+        payload = {
+            "model": LLAMA_MODEL,
+            "prompt": prompt,
+            "stream": True,
+            "options": options_for("summary"),
+            "keep_alive": LLAMA_KEEP_ALIVE
+        }
+        try:
+            with llm_scheduler.slot(PRIORITY_SUMMARY) as queue_wait, ollama_pool.lease(LLAMA_MODEL) as llama_url:
+                log_event(
+                    logger, logging.DEBUG, "llama slot granted", stage="summary", queue_wait=round(queue_wait, 3)
+                )
+                with http_client.post("llama", llama_url, json=payload, stream=True) as response:
+                    response.raise_for_status()
+                    # Ollama streams one JSON object per line
+                    for line in response.iter_lines():
+                        if deadline.expired():
+                            raise http_client.DeadlineExceeded("Request deadline exceeded during the summary")
+                        if not line:
+                            continue
+                        chunk = json.loads(line)
+                        if chunk.get("response"):
+                            yield chunk["response"]
+                        if chunk.get("done"):
+                            # The final chunk carries the token counts and durations
+                            token_stats.record("summary", prompt, chunk)
+                            break
+        except (requests.RequestException, ValueError, SchedulerQueueFull) as e:
+            metrics.count_error("llama")
+            error_msg = f"Error calling Llama: {e}"
+            log_event(logger, logging.ERROR, "llama stream failed", stage="summary", error=str(e))
+            yield error_msg
+
+    def llama_translate(self, text: str, target_lang: str, priority: int = PRIORITY_SNIPPET_TRANSLATION) -> str:
+        """
+        Uses Llama to translate text into the target language.
+        """
+        if is_language(text, target_lang):
+            log_event(
+                logger, logging.DEBUG, "translation skipped, already in target language", target_lang=target_lang
+            )
+            return text
+        cache_key = translation_cache.make_key(text, target_lang, LLAMA_MODEL, TRANSLATION_PROMPT_TEMPLATE)
+        cached = translation_cache.get(cache_key)
+        if cached is not None:
+            log_event(logger, logging.DEBUG, "translation cache hit", target_lang=target_lang)
+            return cached
+        text = truncate_to_tokens(text, input_budget(PRIORITY_NAMES[priority], TRANSLATION_PROMPT_TEMPLATE))
+        prompt = TRANSLATION_PROMPT_TEMPLATE.format(target_lang=target_lang, text=text)
+        translation = self.call_llama(prompt, priority)
+        # call_llama reports failures in-band; never cache those
+        if not translation.startswith("Error"):
+            translation_cache.set(cache_key, translation)
+        return translation
+
+    def google_search(self, query, gl=DEFAULT_COUNTRY, hl=DEFAULT_LANG, fresh=False):
+        """
+        Calls Google Custom Search API with location and language-based filtering.
+        Returns the static results instead when the service was given some.
+        fresh skips the cached results and replaces them with the new ones.
+        """
+        if self.static_results is not None:
+            log_event(logger, logging.DEBUG, "returning static search results", query=query)
+            return self.static_results
+
+        # Failures come back as [] and are cached only for SEARCH_CACHE_ERROR_TTL
+        # Concurrent misses for the same parameters share one API call
+        cached = search_cache.refresh if fresh else search_cache.get_or_fetch
+        return cached(
+            (query, gl, hl),
+            lambda: search_flight.do((query, gl, hl), lambda: self.fetch_google_results(query, gl, hl)),
+            fallback=[]
+        )
+
+    def fetch_google_results(self, query, gl, hl):
+        """
+        Performs the actual Custom Search requests, one per page of SEARCH_RESULT_DEPTH, in parallel.
+        Raises on network or API errors.
+        """
+        log_event(logger, logging.INFO, "google search", query=query, gl=gl, hl=hl)
+        items = search_pages.fetch_all(lambda start: self.fetch_google_page(query, gl, hl, start))
+        log_event(logger, logging.DEBUG, "google search results", links=[item.get("link") for item in items])
+        return items
+
+    def fetch_google_page(self, query, gl, hl, start):
+        """
+        Fetches one page of up to 10 results starting at the 1-based index start.
+        """
+        params = {
+            "key": API_KEY,
+            "cx": SEARCH_ENGINE_ID,
+            "q": query,
+            "gl": gl,
+            "hl": hl,
+            "start": start,
+            "num": search_pages.PAGE_SIZE
+        }
+        try:
+            response = http_client.get("google", GOOGLE_SEARCH_API_URL, params=params, hedge="google")
+            response.raise_for_status()
+            results = response.json()
+            if "error" in results:
+                raise RuntimeError(f"Google API Error: {results['error']}")
+        except (requests.RequestException, ValueError, RuntimeError):
+            metrics.count_error("google")
+            raise
+        return results.get("items", [])
+
+    def search_pipeline(self, query, selected_country, summary_lang, fresh=False):
+        """
+        Runs the full single-country pipeline; used for requests and, with fresh, for trending refreshes.
+        """
+        # translate-query -> search -> (translate-results || summarize), see pipeline.py
+        return run_search_pipeline(
+            query, selected_country, language_for(selected_country), summary_lang,
+            translate=self.llama_translate,
+            search=functools.partial(self.google_search, fresh=fresh),
+            generate=self.call_llama,
+            summary_template=SUMMARY_PROMPT_TEMPLATE,
+            separator=TEXT_SEPARATOR,
+            fetch_pages=page_fetcher.fetch_pages if FETCH_PAGE_TEXT else None,
+            structured_generate=self.call_llama_json if STRUCTURED_OUTPUT else None
+        )
+
+    def stream_search_pipeline(self, query, selected_country, summary_lang):
+        """
+        The single-country pipeline as (event, data) pairs, with the summary streamed token by token.
+        """
+        return stream_search_pipeline(
+            query, selected_country, language_for(selected_country), summary_lang,
+            translate=self.llama_translate,
+            search=self.google_search,
+            generate_stream=self.call_llama_stream,
+            summary_template=SUMMARY_PROMPT_TEMPLATE,
+            separator=TEXT_SEPARATOR,
+            fetch_pages=page_fetcher.fetch_pages if FETCH_PAGE_TEXT else None
+        )
+
+    def multi_country_pipeline(self, query, countries, summary_lang):
+        """
+        One translation per language, all countries searched in parallel, one sectioned summary.
+        """
+        return run_multi_country_pipeline(
+            query, countries, summary_lang,
+            language_for=language_for,
+            translate=self.llama_translate,
+            search=self.google_search,
+            generate=self.call_llama,
+            summary_template=MULTI_COUNTRY_SUMMARY_PROMPT_TEMPLATE,
+            separator=TEXT_SEPARATOR,
+            country_names={country["code"]: country["name"] for country in supported_countries}
+        )
+
+    def degraded_search(self, query, selected_country):
+        """
+        Search results without any LLM call, for overload: the query is only translated if that
+        translation is already cached, and the results stay in their original language.
+        """
+        comm_lang = language_for(selected_country)
+        cached = translation_cache.get(
+            translation_cache.make_key(query, comm_lang, LLAMA_MODEL, TRANSLATION_PROMPT_TEMPLATE)
+        )
+        start = time.perf_counter()
+        results, _ = extract_results(self.google_search(cached or query, gl=selected_country, hl=comm_lang))
+        return results, {"search": time.perf_counter() - start}
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Embedding-based cache of finished searches for near-duplicate queries.
+
+Each answered query is embedded with Ollama's /api/embed endpoint and stored with
+its results and summary under its (country, summary_lang) scope. A new query is
+embedded once and compared against every live entry of its scope with a single
+matrix-vector product over a preallocated NumPy array of unit vectors; the best
+match at or above SEMANTIC_CACHE_THRESHOLD is returned.
+
+Memory is bounded: the index holds at most SEMANTIC_CACHE_SIZE vectors
+(SEMANTIC_CACHE_SIZE x dimension float32s). When it is full, an expired slot is
+reused if there is one, otherwise the least recently used entry is evicted.
+Embedding failures are treated as misses, so the cache never fails a search.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import requests
+from dotenv import load_dotenv
+
+import http_client
+from observability import get_logger, log_event
+from ollama_pool import embed_url, ollama_pool
+
+load_dotenv()
+
+logger = get_logger("semantic_cache")
+
+SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "False").lower() in ("true", "1", "t")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))  # minimum cosine similarity
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "4096"))  # stored queries across all scopes
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "900"))  # seconds; news goes stale quickly
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "nomic-embed-text")
+
+
+def ollama_embed(text: str):
+    """
+    Returns the embedding of text from the least loaded Ollama backend.
+    """
+    with ollama_pool.lease(EMBEDDING_MODEL) as llama_url:
+        response = http_client.post("llama", embed_url(llama_url), json={"model": EMBEDDING_MODEL, "input": text})
+        if response.status_code >= 500:
+            response.raise_for_status()
+    # A 4xx (typically the embedding model not being pulled) says nothing about the backend's health,
+    # so it is raised outside the lease and does not drain a backend that serves generations fine
+    response.raise_for_status()
+    return response.json()["embeddings"][0]
+
+
+class SemanticCache:
+    """
+    Bounded cosine-similarity index of query embeddings with per-scope lookups.
+    """
+
+    def __init__(self, embed=ollama_embed, max_entries=SEMANTIC_CACHE_SIZE, threshold=SEMANTIC_CACHE_THRESHOLD,
+                 ttl=SEMANTIC_CACHE_TTL, enabled=SEMANTIC_CACHE):
+        self.embed = embed
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._vectors = None  # (max_entries, dim) float32 unit vectors, allocated on first add
+        self._scopes = np.full(max_entries, -1, dtype=np.int64)  # scope id per slot; -1 marks a free slot
+        self._expires = np.zeros(max_entries, dtype=np.float64)
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._values = [None] * max_entries
+        self._scope_ids = {}  # (country, summary_lang) -> scope id
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.embed_errors = 0
+
+    def embed_query(self, query: str):
+        """
+        Returns the unit-length embedding of query, or None if the embedding call failed.
+        """
+        try:
+            vector = np.asarray(self.embed(query.strip().lower()), dtype=np.float32)
+        except (requests.RequestException, KeyError, IndexError, ValueError) as e:
+            log_event(logger, logging.WARNING, "query embedding failed", error=str(e))
+            with self._lock:
+                self.embed_errors += 1
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def lookup(self, vector, scope):
+        """
+        Returns (value, similarity) of the closest live entry in scope at or above the threshold,
+        otherwise (None, best similarity or None).
+        """
+        now = time.time()
+        with self._lock:
+            scope_id = self._scope_ids.get(scope)
+            usable = vector is not None and self._vectors is not None and vector.shape[0] == self._vectors.shape[1]
+            if not usable or scope_id is None:
+                self.misses += 1
+                return None, None
+            candidates = np.flatnonzero((self._scopes == scope_id) & (self._expires > now))
+            if candidates.size == 0:
+                self.misses += 1
+                return None, None
+            similarities = self._vectors[candidates] @ vector
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None, similarity
+            slot = candidates[best]
+            self._last_used[slot] = now
+            self.hits += 1
+            return self._values[slot], similarity
+
+    def _free_slot(self, now: float) -> int:
+        free = np.flatnonzero((self._scopes == -1) | (self._expires <= now))
+        if free.size:
+            return int(free[0])
+        self.evictions += 1
+        return int(np.argmin(self._last_used))
+
+    def add(self, vector, scope, value):
+        if vector is None:
+            return
+        now = time.time()
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            elif vector.shape[0] != self._vectors.shape[1]:
+                # EMBEDDING_MODEL changed under a running process; keep the index consistent
+                return
+            scope_id = self._scope_ids.setdefault(scope, len(self._scope_ids))
+            slot = self._free_slot(now)
+            self._vectors[slot] = vector
+            self._scopes[slot] = scope_id
+            self._expires[slot] = now + self.ttl
+            self._last_used[slot] = now
+            self._values[slot] = value
+
+    def _hit(self, query, value, similarity, lookup_seconds):
+        log_event(logger, logging.INFO, "semantic cache hit", query=query, similarity=round(similarity, 4))
+        results, summary = value
+        return results, summary, {"semantic_cache": lookup_seconds}
+
+    def _remember(self, vector, scope, results, summary):
+        # Failed searches come back as no results or an in-band error summary; never cache those
+        if results and not summary.startswith("Error"):
+            self.add(vector, scope, (results, summary))
+
+    def search(self, query: str, scope, run):
+        """
+        Returns run()'s (results, summary, timings), answered from the cache instead when a query
+        close enough to this one was already answered in scope. Results of run() are stored.
+        """
+        if not self.enabled:
+            return run()
+        start = time.perf_counter()
+        vector = self.embed_query(query)
+        value, similarity = self.lookup(vector, scope)
+        lookup_seconds = time.perf_counter() - start
+        if value is not None:
+            return self._hit(query, value, similarity, lookup_seconds)
+        results, summary, timings = run()
+        self._remember(vector, scope, results, summary)
+        return results, summary, {"semantic_cache": lookup_seconds, **timings}
+
+    async def search_async(self, query: str, scope, run):
+        """
+        search() for a coroutine run(); the embedding call runs in a worker thread.
+        """
+        if not self.enabled:
+            return await run()
+        start = time.perf_counter()
+        vector = await asyncio.to_thread(self.embed_query, query)
+        value, similarity = self.lookup(vector, scope)
+        lookup_seconds = time.perf_counter() - start
+        if value is not None:
+            return self._hit(query, value, similarity, lookup_seconds)
+        results, summary, timings = await run()
+        self._remember(vector, scope, results, summary)
+        return results, summary, {"semantic_cache": lookup_seconds, **timings}
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": int(np.count_nonzero((self._scopes != -1) & (self._expires > now))),
+                "max_entries": self.max_entries,
+                "dimensions": None if self._vectors is None else self._vectors.shape[1],
+                "index_bytes": 0 if self._vectors is None else self._vectors.nbytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "embed_errors": self.embed_errors,
+                "threshold": self.threshold,
+                "enabled": self.enabled
+            }
+
+
+semantic_cache = SemanticCache()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Single-flight coalescing of identical in-flight work.
+
+When several requests need the same result at the same time (same translation
+prompt, same search parameters, same summary prompt), only the first caller
+runs the work; the others block until it finishes and receive the same result
+or exception. AsyncSingleFlight does the same for coroutines on one event loop.
+"""
+import asyncio
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs at most one fn per key at a time and shares its outcome with concurrent callers.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.shared += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "executed": self.executed,
+                "shared": self.shared
+            }
+
+
+class AsyncSingleFlight(SingleFlight):
+    """
+    SingleFlight for coroutine functions; followers await the leader's future.
+    """
+
+    async def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.shared += 1
+                leader = False
+            else:
+                future = asyncio.get_running_loop().create_future()
+                self._calls[key] = future
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            # shield: a cancelled follower must not cancel the shared outcome
+            return await asyncio.shield(future)
+
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Marks the exception as retrieved when no follower was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+# Generations are keyed on (model, prompt), searches on (query, gl, hl)
+llama_flight = SingleFlight()
+search_flight = SingleFlight()
+async_llama_flight = AsyncSingleFlight()
+async_search_flight = AsyncSingleFlight()
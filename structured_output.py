@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Single-call translate-and-summarize using Ollama's JSON output mode.
+
+One generation returns the translated title and snippet of every result plus the
+summary, keyed by result index. The response is validated against the expected
+shape; anything that does not validate returns None so the caller can fall back
+to the two-call translate + summarize path.
+
+Every item is sent in the prompt and comes back translated, so the items are
+trimmed to fit both the structured input budget and its num_predict (less room
+for the summary); results beyond the budget keep their original text.
+"""
+import json
+import logging
+import os
+
+from dotenv import load_dotenv
+
+import token_budget
+from observability import get_logger, log_event
+
+load_dotenv()
+
+logger = get_logger("structured_output")
+
+STRUCTURED_PROMPT_TEMPLATE = os.getenv(
+    "STRUCTURED_PROMPT_TEMPLATE",
+    "You are given {count} search results as a JSON array. Translate each title and snippet into "
+    "{summary_lang} and write a short summary of all results in {summary_lang}.\n"
+    "Respond ONLY with JSON of the form "
+    '{{"results": [{{"index": <index>, "title": "<title>", "snippet": "<snippet>"}}, ...], "summary": "<summary>"}} '
+    "containing every index exactly once.\n\n{items}"
+)
+
+
+def item_budget(extra_context: str = "") -> int:
+    """
+    Tokens the result items may use: what is left of the input budget after the template and
+    extra_context, capped by the output room left once the summary is accounted for.
+    """
+    input_left = (
+        token_budget.input_budget("structured", STRUCTURED_PROMPT_TEMPLATE)
+        - token_budget.estimate_tokens(extra_context)
+    )
+    output_left = (
+        token_budget.STAGE_BUDGETS["structured"]["num_predict"]
+        - token_budget.STAGE_BUDGETS["summary"]["num_predict"]
+    )
+    return max(0, min(input_left, output_left))
+
+
+def fit_items(results, max_tokens: int) -> list:
+    """
+    Prompt items for results in rank order until max_tokens is used; the snippet of the last one
+    that does not fit is truncated and the rest are left out.
+    """
+    items = []
+    used = 0
+    for i, result in enumerate(results, start=1):
+        item = {"index": i, "title": result.get("title") or "", "snippet": result.get("snippet") or ""}
+        item_tokens = token_budget.estimate_tokens(json.dumps(item, ensure_ascii=False)) + 1
+        if used + item_tokens <= max_tokens:
+            items.append(item)
+            used += item_tokens
+            continue
+        remaining = max_tokens - used - token_budget.estimate_tokens(
+            json.dumps(dict(item, snippet=""), ensure_ascii=False)
+        ) - 1
+        if remaining > 16:
+            items.append(dict(item, snippet=token_budget.truncate_to_tokens(item["snippet"], remaining)))
+        log_event(logger, logging.INFO, "structured prompt dropped snippets", dropped=len(results) - len(items))
+        break
+    return items
+
+
+def build_prompt(items, summary_lang: str, extra_context: str = "") -> str:
+    prompt = STRUCTURED_PROMPT_TEMPLATE.format(
+        count=len(items),
+        summary_lang=summary_lang,
+        items=json.dumps(items, ensure_ascii=False)
+    )
+    if extra_context:
+        prompt += f"\n\nAdditional context for the summary:\n{extra_context}"
+    return prompt
+
+
+def parse_response(text: str, count: int):
+    """
+    Returns ({index: (title, snippet)}, summary) if text matches the schema, otherwise None.
+    """
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    summary = data.get("summary")
+    items = data.get("results")
+    if not isinstance(summary, str) or not summary.strip() or not isinstance(items, list):
+        return None
+
+    translations = {}
+    for item in items:
+        if not isinstance(item, dict):
+            return None
+        index, title, snippet = item.get("index"), item.get("title"), item.get("snippet")
+        if not isinstance(index, int) or not 1 <= index <= count or index in translations:
+            return None
+        if not isinstance(title, str) or not isinstance(snippet, str):
+            return None
+        translations[index] = (title.strip(), snippet.strip())
+    if len(translations) != count:
+        return None
+    return translations, summary.strip()
+
+
+def _apply(results, parsed):
+    # Only the first len(translations) results were in the prompt; the rest keep their text
+    if parsed is None:
+        log_event(logger, logging.INFO, "structured response failed validation, falling back to translate + summarize")
+        return None
+    translations, summary = parsed
+    translated = [dict(result) for result in results]
+    for index, (title, snippet) in translations.items():
+        translated[index - 1]["title"] = title
+        translated[index - 1]["snippet"] = snippet
+    return translated, summary
+
+
+def translate_and_summarize(results, summary_lang: str, generate, extra_context: str = ""):
+    """
+    Runs the single structured generation. Returns (translated_results, summary), or None to fall back.
+    generate(prompt) must request JSON output from the model.
+    """
+    items = fit_items(results, item_budget(extra_context))
+    if not items:
+        return None
+    response = generate(build_prompt(items, summary_lang, extra_context))
+    return _apply(results, parse_response(response, len(items)))
+
+
+async def translate_and_summarize_async(results, summary_lang: str, generate, extra_context: str = ""):
+    """
+    translate_and_summarize with a coroutine generate(prompt).
+    """
+    items = fit_items(results, item_budget(extra_context))
+    if not items:
+        return None
+    response = await generate(build_prompt(items, summary_lang, extra_context))
+    return _apply(results, parse_response(response, len(items)))
@@ -0,0 +1,86 @@
+import time
+
+from admission import MODE_DEGRADED, AdmissionController
+
+
+def controller(**kwargs):
+    options = dict(rate_per_minute=0, enabled=True)
+    options.update(kwargs)
+    return AdmissionController(**options)
+
+
+def test_rate_limit_answers_429_with_retry_after():
+    admission = controller(rate_per_minute=60, burst=2)
+    assert admission.admit("a").admitted
+    assert admission.admit("a").admitted
+    decision = admission.admit("a")
+    assert decision.status == 429
+    assert decision.headers() == {"Retry-After": "1"}
+    # Buckets are per client
+    assert admission.admit("b").admitted
+
+
+def test_burst_cannot_overshoot_max_in_flight():
+    admission = controller(max_in_flight=2)
+    decisions = [admission.admit("a") for _ in range(3)]
+    # The slot is reserved by admit() itself, before any search reaches running()
+    assert [decision.status for decision in decisions] == [None, None, 503]
+    assert decisions[2].reason == "in_flight"
+    assert admission.stats()["in_flight"] == 2
+
+
+def test_running_uses_the_reserved_slot_and_frees_it():
+    admission = controller(max_in_flight=1)
+    decision = admission.admit("a")
+    with admission.running(decision):
+        assert admission.stats()["in_flight"] == 1
+    assert admission.stats()["in_flight"] == 0
+    assert admission.admit("a").admitted
+
+
+def test_release_and_refuse_free_the_slot_once():
+    admission = controller(max_in_flight=1)
+    decision = admission.admit("a")
+    admission.release(decision)
+    admission.release(decision)
+    admission.release(None)
+    assert admission.stats()["in_flight"] == 0
+
+    refused = admission.refuse(admission.admit("a"))
+    assert refused.status == 503
+    assert admission.stats()["in_flight"] == 0
+
+
+def test_unshed_admissions_reserve_nothing():
+    admission = controller(max_in_flight=1)
+    decision = admission.admit("a", shed=False)
+    assert decision.admitted and not decision.holds_slot
+    with admission.running(decision):
+        assert admission.stats()["in_flight"] == 1
+    assert admission.stats()["in_flight"] == 0
+
+
+def test_queue_depth_degrades_then_rejects():
+    depth = [0]
+    admission = controller(queue_depth=lambda: depth[0], degrade_queue=2, reject_queue=4)
+    assert admission.admit("a").mode != MODE_DEGRADED
+    depth[0] = 2
+    decision = admission.admit("a")
+    assert decision.admitted and decision.degraded and decision.reason == "queue_depth"
+    depth[0] = 4
+    assert admission.admit("a").reason == "queue_full"
+
+
+def test_slow_recent_runs_degrade_until_they_age_out():
+    admission = controller(degrade_latency=0.05, latency_window=0.2)
+    decision = admission.admit("a")
+    with admission.running(decision):
+        time.sleep(0.06)
+    assert admission.admit("a").reason == "latency"
+    time.sleep(0.25)
+    assert not admission.admit("a").degraded
+
+
+def test_disabled_controller_admits_everything():
+    admission = controller(enabled=False, max_in_flight=0, rate_per_minute=1, burst=0)
+    assert admission.admit("a").admitted
@@ -0,0 +1,79 @@
+import time
+
+from circuit_breaker import (
+    STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, CircuitBreaker, CircuitBreakers, is_failure_status
+)
+
+
+def test_opens_after_consecutive_failures_only():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=60)
+    breaker.failure()
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    breaker.failure()
+    assert breaker.state == STATE_CLOSED
+    breaker.failure()
+    assert breaker.state == STATE_OPEN
+    assert breaker.allow() is False
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+    breaker.failure()
+    assert breaker.allow() is False
+    time.sleep(0.06)
+    assert breaker.allow() is True
+    assert breaker.state == STATE_HALF_OPEN
+    # Only one trial at a time
+    assert breaker.allow() is False
+    breaker.success()
+    assert breaker.state == STATE_CLOSED
+    assert breaker.allow() is True
+
+
+def test_failed_trial_reopens_for_another_timeout():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+    breaker.failure()
+    time.sleep(0.06)
+    assert breaker.allow() is True
+    breaker.failure()
+    assert breaker.state == STATE_OPEN
+    assert breaker.allow() is False
+    assert breaker.stats()["opened"] == 2
+
+
+def test_ignored_trial_frees_the_trial_without_deciding():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+    breaker.failure()
+    time.sleep(0.06)
+    assert breaker.allow() is True
+    breaker.record(None)
+    assert breaker.state == STATE_HALF_OPEN
+    assert breaker.allow() is True
+
+
+def test_failure_statuses():
+    assert is_failure_status(503) and is_failure_status(429)
+    assert not is_failure_status(404)
+
+
+def test_breakers_are_per_backend_and_host():
+    breakers = CircuitBreakers(enabled=True)
+    first = breakers.get("llama", "http://a:11434/api/generate")
+    assert breakers.get("llama", "http://A:11434/api/tags") is first
+    assert breakers.get("llama", "http://b:11434/api/generate") is not first
+    assert breakers.get("pages", "http://a:11434/") is not first
+    assert CircuitBreakers(enabled=False).get("llama", "http://a/") is None
+
+
+def test_pruning_keeps_open_breakers():
+    breakers = CircuitBreakers(max_tracked=2, enabled=True)
+    unhealthy = breakers.get("pages", "http://down/")
+    unhealthy.failure_threshold = 1
+    unhealthy.failure()
+    breakers.get("pages", "http://up/")
+    breakers.get("pages", "http://new/")
+    assert breakers.get("pages", "http://down/") is unhealthy
+    assert list(breakers.stats()["unhealthy"]) == ["pages:down"]
@@ -0,0 +1,88 @@
+import os
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import image_proxy
+from image_proxy import ImageUnavailable, ThumbnailCache, check_public
+
+
+def test_eviction_drops_least_recently_used_first(tmp_path):
+    cache = ThumbnailCache(str(tmp_path), max_bytes=25)
+    cache.put("a", b"x" * 10)
+    cache.put("b", b"x" * 10)
+    assert cache.get("a") == b"x" * 10
+    cache.put("c", b"x" * 10)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert sorted(os.listdir(tmp_path)) == ["a.jpg", "c.jpg"]
+    stats = cache.stats()
+    assert stats["bytes"] == 20 and stats["evictions"] == 1
+
+
+def test_replacing_an_entry_counts_its_size_once(tmp_path):
+    cache = ThumbnailCache(str(tmp_path), max_bytes=100)
+    cache.put("a", b"x" * 10)
+    cache.put("a", b"x" * 30)
+    assert cache.stats()["bytes"] == 30
+
+
+def test_the_newest_entry_is_kept_even_if_over_the_limit(tmp_path):
+    cache = ThumbnailCache(str(tmp_path), max_bytes=5)
+    cache.put("a", b"x" * 3)
+    cache.put("big", b"x" * 10)
+    assert cache.get("big") is not None
+    assert cache.get("a") is None
+
+
+def test_recency_survives_a_restart(tmp_path):
+    cache = ThumbnailCache(str(tmp_path), max_bytes=25)
+    cache.put("old", b"x" * 10)
+    cache.put("new", b"x" * 10)
+    past = time.time() - 60
+    os.utime(tmp_path / "new.jpg", (past, past))
+    os.utime(tmp_path / "old.jpg", (past - 60, past - 60))
+
+    reopened = ThumbnailCache(str(tmp_path), max_bytes=25)
+    reopened.put("third", b"x" * 10)
+    assert reopened.get("old") is None
+    assert reopened.get("new") is not None
+
+
+def test_files_removed_by_another_process_are_misses(tmp_path):
+    cache = ThumbnailCache(str(tmp_path), max_bytes=100)
+    cache.put("a", b"x" * 10)
+    os.remove(tmp_path / "a.jpg")
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 0
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1/a.jpg",
+    "http://10.0.0.5/a.jpg",
+    "http://169.254.169.254/latest/meta-data",
+    "http://[::1]/a.jpg",
+    "http://[::ffff:192.168.1.1]/a.jpg",
+    "http://93.184.216.34:8080/a.jpg",
+    "ftp://93.184.216.34/a.jpg",
+])
+def test_non_public_image_urls_are_refused(url):
+    with pytest.raises(ImageUnavailable):
+        check_public(url)
+
+
+def test_public_image_urls_pass():
+    check_public("https://93.184.216.34/a.jpg")
+
+
+def test_proxy_links_are_relative_and_signed(monkeypatch):
+    monkeypatch.setattr(image_proxy, "IMAGE_PROXY", True)
+    monkeypatch.setattr(image_proxy, "IMAGE_PROXY_BASE_URL", "")
+    link = image_proxy.proxy_url("https://example.com/a.jpg")
+    parts = urlsplit(link)
+    assert not parts.netloc and parts.path == image_proxy.IMAGE_PROXY_ROUTE
+    query = parse_qs(parts.query)
+    assert image_proxy.verify(query["url"][0], query["sig"][0])
+    assert not image_proxy.verify("https://example.com/b.jpg", query["sig"][0])
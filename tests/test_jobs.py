@@ -0,0 +1,113 @@
+import hashlib
+import os
+import time
+
+import pytest
+
+import jobs
+from jobs import STATUS_DONE, STATUS_FAILED, STATUS_QUEUED, STATUS_RUNNING, JobQueueFull, JobStore, JobWorkers
+
+
+def wait_for_status(store, job_id, status):
+    for _ in range(500):
+        job = store.get(job_id)
+        if job["status"] == status:
+            return job
+        time.sleep(0.01)
+    return job
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.db"), queue_limit=3, result_ttl=60, timeout=60)
+
+
+def test_store_creates_its_file_on_first_use(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    store = JobStore(path)
+    assert not os.path.exists(path)
+    assert store.stats()[STATUS_QUEUED] == 0
+    assert os.path.exists(path)
+
+
+def test_default_path_is_per_checkout():
+    assert hashlib.sha1(jobs.APP_DIR.encode()).hexdigest()[:12] in os.path.basename(jobs.DEFAULT_JOB_DB)
+
+
+def test_jobs_are_claimed_oldest_first_and_only_once(store):
+    first = store.submit({"query": "one"})
+    second = store.submit({"query": "two"})
+    assert store.get(second)["position"] == 1
+    assert store.claim() == (first, {"query": "one"})
+    assert store.claim() == (second, {"query": "two"})
+    assert store.claim() is None
+    assert store.get(first)["status"] == STATUS_RUNNING
+
+
+def test_full_queue_refuses_submissions(store):
+    for i in range(3):
+        store.submit({"query": str(i)})
+    with pytest.raises(JobQueueFull):
+        store.submit({"query": "late"})
+    store.claim()
+    store.submit({"query": "late"})
+
+
+def test_progress_and_result_are_readable(store):
+    job_id = store.submit({"query": "q"})
+    store.claim()
+    store.update(job_id, {"results": [1]})
+    assert store.get(job_id)["results"] == [1]
+    store.finish(job_id, {"results": [1], "summary": "s"})
+    job = store.get(job_id)
+    assert job["status"] == STATUS_DONE and job["summary"] == "s" and job["query"] == "q"
+    store.finish(job_id, {}, error="boom")
+    assert store.get(job_id)["status"] == STATUS_FAILED
+
+
+def test_expire_drops_old_results_and_fails_stalled_jobs(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"), result_ttl=0, timeout=0)
+    finished = store.submit({"query": "done"})
+    store.claim()
+    store.finish(finished, {})
+    stalled = store.submit({"query": "stalled"})
+    store.claim()
+    store.expire()
+    assert store.get(finished) is None
+    job = store.get(stalled)
+    assert job["status"] == STATUS_FAILED and job["error"] == "Job timed out"
+
+
+def test_workers_fold_events_into_the_job(store):
+    def handler(params):
+        yield "results", {"results": [params["query"]]}
+        yield "summary_token", {"token": "a"}
+        yield "summary_token", {"token": "b"}
+        yield "summary", {"summary": "ab"}
+        yield "done", {"timings": {"search": 0.1}}
+
+    workers = JobWorkers(store, workers=1)
+    workers.start(handler)
+    job_id = store.submit({"query": "q"})
+    workers.notify()
+    job = wait_for_status(store, job_id, STATUS_DONE)
+    assert job["status"] == STATUS_DONE
+    assert job["results"] == ["q"] and job["summary"] == "ab" and job["summary_complete"]
+    assert job["timings"] == {"search": 0.1}
+
+
+def test_a_failing_handler_fails_its_job_not_the_worker(store):
+    def handler(params):
+        if params["query"] == "bad":
+            raise RuntimeError("search failed")
+        yield "done", {}
+
+    workers = JobWorkers(store, workers=1)
+    workers.start(handler)
+    bad = store.submit({"query": "bad"})
+    good = store.submit({"query": "good"})
+    workers.notify()
+    # The single worker survives the first job to run the second
+    assert wait_for_status(store, good, STATUS_DONE)["status"] == STATUS_DONE
+    assert store.get(bad)["error"] == "search failed"
+    assert workers.stats()["failed"] == 1
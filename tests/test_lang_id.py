@@ -0,0 +1,32 @@
+import pytest
+
+from lang_id import detect_language, is_language, normalize_lang
+
+
+@pytest.mark.parametrize("text, lang", [
+    ("Latest news about the election and the economy in the city", "en"),
+    ("Siste nytt om valget og økonomien i Norge etter ulykken", "no"),
+    ("Les dernières nouvelles sur les élections dans la ville", "fr"),
+    ("Die neuesten Nachrichten über die Wahl und die Wirtschaft", "de"),
+    ("東京の最新ニュース", "ja"),
+])
+def test_detects_the_supported_languages(text, lang):
+    assert detect_language(text) == lang
+
+
+@pytest.mark.parametrize("text", ["", "1234 5678", "tram", "OK"])
+def test_short_or_letterless_text_is_not_identified(text):
+    assert detect_language(text) is None
+
+
+@pytest.mark.parametrize("code, normalized", [
+    ("jp", "ja"), ("nb", "no"), ("en-US", "en"), ("fr_CA", "fr"), (" DE ", "de"), (None, ""),
+])
+def test_normalizes_codes_and_locales(code, normalized):
+    assert normalize_lang(code) == normalized
+
+
+def test_is_language_accepts_aliases_and_refuses_unsupported_targets():
+    assert is_language("Siste nytt om valget og økonomien i Norge etter ulykken", "nb")
+    assert not is_language("Siste nytt om valget og økonomien i Norge etter ulykken", "en")
+    assert not is_language("Las últimas noticias sobre las elecciones en la ciudad", "es")
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import deadline
+from llm_scheduler import (
+    PRIORITY_QUERY_TRANSLATION, PRIORITY_SNIPPET_TRANSLATION, PRIORITY_SUMMARY, AsyncLLMScheduler, LLMScheduler,
+    SchedulerQueueFull, SchedulerTimeout
+)
+
+
+def wait_for_depth(scheduler, depth):
+    while scheduler.queue_depth < depth:
+        time.sleep(0.005)
+
+
+def test_waiting_calls_are_served_by_priority_then_fifo():
+    scheduler = LLMScheduler(max_concurrency=1, queue_limit=10)
+    scheduler.acquire(PRIORITY_SUMMARY)
+    order = []
+
+    def call(name, priority):
+        with scheduler.slot(priority):
+            order.append(name)
+
+    threads = []
+    for name, priority in [
+        ("summary", PRIORITY_SUMMARY),
+        ("snippet-1", PRIORITY_SNIPPET_TRANSLATION),
+        ("query", PRIORITY_QUERY_TRANSLATION),
+        ("snippet-2", PRIORITY_SNIPPET_TRANSLATION),
+    ]:
+        threads.append(threading.Thread(target=call, args=(name, priority)))
+        threads[-1].start()
+        wait_for_depth(scheduler, len(threads))
+    assert scheduler.busy
+    scheduler.release()
+    for thread in threads:
+        thread.join(5)
+
+    assert order == ["query", "snippet-1", "snippet-2", "summary"]
+    assert scheduler.stats()["active"] == 0
+
+
+def test_full_queue_rejects_at_once():
+    scheduler = LLMScheduler(max_concurrency=1, queue_limit=1)
+    scheduler.acquire(PRIORITY_SUMMARY)
+    for priority in (PRIORITY_SUMMARY, PRIORITY_QUERY_TRANSLATION):
+        threading.Thread(target=scheduler.acquire, args=(priority,), daemon=True).start()
+    # The limit is per priority, so both waiters are queued
+    wait_for_depth(scheduler, 2)
+
+    with pytest.raises(SchedulerQueueFull):
+        scheduler.acquire(PRIORITY_SUMMARY)
+    assert scheduler.stats()["rejected"] == 1
+    assert scheduler.queue_depth == 2
+
+
+def test_queued_call_gives_up_at_the_deadline():
+    scheduler = LLMScheduler(max_concurrency=1)
+    scheduler.acquire(PRIORITY_SUMMARY)
+    start = time.monotonic()
+    with deadline.scope(0.1), pytest.raises(SchedulerTimeout):
+        scheduler.acquire(PRIORITY_QUERY_TRANSLATION)
+
+    assert time.monotonic() - start < 2
+    assert scheduler.queue_depth == 0
+    assert scheduler.stats()["timed_out"] == 1
+    scheduler.release()
+    assert scheduler.try_acquire() is True
+
+
+def test_try_acquire_never_jumps_the_queue():
+    scheduler = LLMScheduler(max_concurrency=2)
+    assert scheduler.try_acquire() is True
+    assert scheduler.try_acquire() is True
+    assert scheduler.try_acquire() is False
+    scheduler.release()
+    assert scheduler.try_acquire() is True
+
+
+def test_async_waiting_calls_are_served_by_priority():
+    async def main():
+        scheduler = AsyncLLMScheduler(max_concurrency=1)
+        order = []
+
+        async def call(name, priority):
+            async with scheduler.slot(priority):
+                order.append(name)
+
+        await scheduler.acquire(PRIORITY_SUMMARY)
+        tasks = []
+        for name, priority in [("summary", PRIORITY_SUMMARY), ("query", PRIORITY_QUERY_TRANSLATION)]:
+            tasks.append(asyncio.ensure_future(call(name, priority)))
+            await asyncio.sleep(0)
+        assert scheduler.queue_depth == 2
+        scheduler.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(main()) == ["query", "summary"]
+
+
+def test_async_queued_call_gives_up_at_the_deadline():
+    async def main():
+        scheduler = AsyncLLMScheduler(max_concurrency=1)
+        await scheduler.acquire(PRIORITY_SUMMARY)
+        with deadline.scope(0.05), pytest.raises(SchedulerTimeout):
+            await scheduler.acquire(PRIORITY_QUERY_TRANSLATION)
+        assert scheduler.queue_depth == 0
+        scheduler.release()
+        # The withdrawn ticket must not hold on to the freed slot
+        assert scheduler.try_acquire() is True
+
+    asyncio.run(main())
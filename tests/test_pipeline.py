@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import deadline
+from pipeline import AsyncStageGraph, StageGraph
+
+
+def test_stages_receive_their_dependencies_and_run_in_parallel():
+    both_started = threading.Barrier(2, timeout=5)
+
+    def branch(value):
+        # Deadlocks (and times out) unless the two independent stages run at the same time
+        both_started.wait()
+        return value
+
+    graph = StageGraph()
+    graph.add("query", lambda: 2)
+    graph.add("left", lambda query: branch(query * 10), deps=["query"])
+    graph.add("right", lambda query: branch(query + 1), deps=["query"])
+    graph.add("join", lambda left, right: left + right, deps=["left", "right"])
+
+    results = graph.run()
+    assert results == {"query": 2, "left": 20, "right": 3, "join": 23}
+    assert set(graph.timings) == {"query", "left", "right", "join"}
+
+
+def test_unknown_dependencies_are_refused():
+    with pytest.raises(ValueError):
+        StageGraph().add("summary", lambda search: search, deps=["search"])
+
+
+def test_a_failing_stage_raises_after_in_flight_stages_settle():
+    finished = []
+
+    def slow():
+        time.sleep(0.1)
+        finished.append("slow")
+
+    def fail():
+        raise RuntimeError("search failed")
+
+    graph = StageGraph()
+    graph.add("slow", slow)
+    graph.add("fail", fail)
+    graph.add("after", lambda fail: finished.append("after"), deps=["fail"])
+
+    with pytest.raises(RuntimeError, match="search failed"):
+        graph.run()
+    assert finished == ["slow"]
+    assert "fail" in graph.timings
+
+
+def test_stages_run_under_the_callers_deadline():
+    graph = StageGraph()
+    graph.add("left", deadline.remaining)
+    with deadline.scope(30):
+        left = graph.run()["left"]
+    assert 0 < left <= 30
+
+
+def test_async_stages_propagate_the_first_error():
+    finished = []
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        finished.append("slow")
+
+    async def fail():
+        raise RuntimeError("translation failed")
+
+    async def after(fail):
+        finished.append("after")
+
+    graph = AsyncStageGraph()
+    graph.add("slow", slow)
+    graph.add("fail", fail)
+    graph.add("after", after, deps=["fail"])
+
+    with pytest.raises(RuntimeError, match="translation failed"):
+        asyncio.run(graph.run())
+    assert finished == ["slow"]
+
+
+def test_cancelling_an_async_graph_cancels_its_stages():
+    cancelled = []
+
+    async def hang():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append("hang")
+            raise
+
+    async def main():
+        graph = AsyncStageGraph()
+        graph.add("hang", hang)
+        task = asyncio.ensure_future(graph.run())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert cancelled == ["hang"]
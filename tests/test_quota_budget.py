@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+from trending import QuotaBudget, TrendingQueries
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "budget.db")
+
+
+def test_nothing_is_written_before_open(db_path):
+    budget = QuotaBudget("test", 10, db_path=db_path)
+    assert not os.path.exists(db_path)
+    budget.open()
+    assert os.path.exists(db_path)
+
+
+def test_take_only_spends_what_is_available(db_path):
+    budget = QuotaBudget("test", 10, db_path=db_path)
+    budget.open()
+    assert budget.take(4) is True
+    assert budget.available() == pytest.approx(6, abs=0.01)
+    assert budget.take(7) is False
+    assert budget.available() == pytest.approx(6, abs=0.01)
+
+
+def test_spend_may_overdraw(db_path):
+    budget = QuotaBudget("test", 10, db_path=db_path)
+    budget.open()
+    budget.spend(12)
+    assert budget.available() == pytest.approx(-2, abs=0.01)
+    assert budget.take(1) is False
+
+
+def test_refills_continuously_up_to_one_hour(db_path):
+    budget = QuotaBudget("test", 3600, db_path=db_path)
+    budget.open()
+    budget.spend(3600)
+    conn = budget._db()
+    conn.execute("UPDATE budgets SET updated_at = updated_at - 10 WHERE name = 'test'")
+    assert budget.available() == pytest.approx(10, abs=0.5)
+    conn.execute("UPDATE budgets SET updated_at = updated_at - 7200 WHERE name = 'test'")
+    assert budget.available() == 3600
+
+
+def test_available_does_not_write(db_path):
+    budget = QuotaBudget("test", 10, db_path=db_path)
+    budget.open()
+    before = budget._db().execute("SELECT available, updated_at FROM budgets").fetchone()
+    budget.available()
+    assert budget._db().execute("SELECT available, updated_at FROM budgets").fetchone() == before
+
+
+def test_budgets_with_one_name_share_the_bucket(db_path):
+    first = QuotaBudget("shared", 10, db_path=db_path)
+    second = QuotaBudget("shared", 10, db_path=db_path)
+    other = QuotaBudget("other", 10, db_path=db_path)
+    for budget in (first, second, other):
+        budget.open()
+    first.spend(8)
+    assert second.take(3) is False
+    assert other.take(3) is True
+
+
+def test_stats_of_a_refresher_that_never_started_skip_the_budgets():
+    trending = TrendingQueries(enabled=False)
+    stats = trending.stats()
+    assert stats["llm_budget_available"] is None
+    assert stats["google_budget_available"] is None
+    assert not trending.llm_budget.opened
@@ -0,0 +1,79 @@
+import pytest
+
+import token_budget
+from token_budget import (
+    STAGE_BUDGETS, TokenStats, estimate_tokens, fit_articles, input_budget, options_for, truncate_to_tokens
+)
+
+
+def test_estimates_latin_text_per_chars_and_cjk_per_character(monkeypatch):
+    monkeypatch.setattr(token_budget, "CHARS_PER_TOKEN", 4.0)
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
+    assert estimate_tokens("東京のニュース") == 7
+
+
+def test_truncation_fits_the_budget_and_prefers_word_boundaries():
+    text = " ".join(["word"] * 100)
+    cut = truncate_to_tokens(text, 20)
+    assert estimate_tokens(cut) <= 20
+    assert text.startswith(cut) and not cut.endswith(" ") and cut.endswith("word")
+    assert truncate_to_tokens("short", 20) == "short"
+
+
+def test_input_budget_holds_back_the_template():
+    max_input = STAGE_BUDGETS["summary"]["max_input_tokens"]
+    assert input_budget("summary") == max_input - token_budget.TEMPLATE_RESERVE_TOKENS
+    template = "x" * 400
+    assert input_budget("summary", template) == max_input - estimate_tokens(template)
+    assert input_budget("summary", "x" * 10 ** 6) == 0
+
+
+def test_fit_articles_keeps_rank_order_and_truncates_the_last_that_fits_partly():
+    articles = {f"title {i}": "snippet text " * 20 for i in range(10)}
+    per_line = estimate_tokens(f"1. title 0: {articles['title 0']}") + 1
+    fitted = fit_articles(articles, per_line * 2 + 40)
+
+    assert list(fitted) == ["title 0", "title 1", "title 2"]
+    assert fitted["title 1"] == articles["title 1"]
+    assert len(fitted["title 2"]) < len(articles["title 2"])
+    assert fit_articles(articles, 10 ** 6) == articles
+
+
+def test_fit_articles_drops_a_remainder_too_small_to_be_useful():
+    articles = {"a": "snippet text " * 20, "b": "snippet text " * 20}
+    per_line = estimate_tokens(f"1. a: {articles['a']}") + 1
+    assert list(fit_articles(articles, per_line + 5)) == ["a"]
+
+
+def test_options_carry_the_stage_budget():
+    assert options_for("query_translation") == {
+        "num_ctx": STAGE_BUDGETS["query_translation"]["num_ctx"],
+        "num_predict": STAGE_BUDGETS["query_translation"]["num_predict"],
+    }
+
+
+def test_stats_report_rates_and_the_predicted_worst_case():
+    stats = TokenStats()
+    result = {"prompt_eval_count": 100, "eval_count": 50, "prompt_eval_duration": 1e9, "eval_duration": 5e8}
+    stats.record("summary", "x" * 40, result)
+    stats.record("summary", "x" * 40, result)
+    report = stats.stats()["summary"]
+
+    assert report["calls"] == 2
+    assert report["avg_prompt_tokens"] == 100
+    assert report["prompt_tokens_per_second"] == pytest.approx(100)
+    assert report["output_tokens_per_second"] == pytest.approx(100)
+    budget = STAGE_BUDGETS["summary"]
+    assert report["predicted_max_seconds"] == pytest.approx(
+        budget["max_input_tokens"] / 100 + budget["num_predict"] / 100
+    )
+
+
+def test_stats_without_reported_durations_predict_nothing():
+    stats = TokenStats()
+    stats.record("query_translation", "prompt", {})
+    report = stats.stats()["query_translation"]
+    assert report["prompt_tokens_per_second"] is None
+    assert report["predicted_max_seconds"] is None
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Token budgets for prompts sent to the Llama API.
+
+Every pipeline stage (query translation, snippet translation, summary and the
+structured single-call mode) has an input budget and a num_predict cap. Prompts
+are estimated before sending, snippet sets are trimmed to fit, and the
+prompt/output token counts Ollama reports are recorded per stage so latency can
+be predicted from the observed token rates.
+
+num_ctx defaults to the same LLM_NUM_CTX for every stage: Ollama reloads the
+model whenever num_ctx changes, so differing per-stage values only pay off on
+backends dedicated to one stage.
+"""
+import logging
+import os
+import re
+import threading
+
+from dotenv import load_dotenv
+
+from observability import get_logger, log_event
+
+load_dotenv()
+
+logger = get_logger("token_budget")
+
+LLM_NUM_CTX = int(os.getenv("LLM_NUM_CTX", "8192"))
+CHARS_PER_TOKEN = float(os.getenv("CHARS_PER_TOKEN", "4"))  # Latin-script estimate
+TEMPLATE_RESERVE_TOKENS = int(os.getenv("TEMPLATE_RESERVE_TOKENS", "64"))  # room for prompt template text
+
+# stage -> (max input tokens, num_predict)
+_DEFAULT_BUDGETS = {
+    "query_translation": (256, 128),
+    "snippet_translation": (3072, 3072),
+    "summary": (4096, 512),
+    "structured": (3072, 3584),
+}
+STAGE_BUDGETS = {
+    stage: {
+        "max_input_tokens": int(os.getenv(f"{stage.upper()}_MAX_INPUT_TOKENS", str(max_input))),
+        "num_predict": int(os.getenv(f"{stage.upper()}_NUM_PREDICT", str(num_predict))),
+        "num_ctx": int(os.getenv(f"{stage.upper()}_NUM_CTX", str(LLM_NUM_CTX))),
+    }
+    for stage, (max_input, num_predict) in _DEFAULT_BUDGETS.items()
+}
+
+# CJK scripts run close to one token per character
+_WIDE_CHARS = re.compile(r"[぀-ヿ一-鿿가-힯]")
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    wide = len(_WIDE_CHARS.findall(text))
+    return wide + int((len(text) - wide) / CHARS_PER_TOKEN + 0.999)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Cuts text to roughly max_tokens, preferring a word boundary.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    cut = text[:low]
+    space = cut.rfind(" ")
+    return cut[:space] if space > low * 0.8 else cut
+
+
+def input_budget(stage: str, overhead=None) -> int:
+    """
+    Tokens left for variable text once the template wrapped around it is accounted for.
+    Without an explicit overhead string, TEMPLATE_RESERVE_TOKENS is held back instead.
+    """
+    reserved = TEMPLATE_RESERVE_TOKENS if overhead is None else estimate_tokens(overhead)
+    return max(0, STAGE_BUDGETS[stage]["max_input_tokens"] - reserved)
+
+
+def fit_articles(articles: dict, max_tokens: int) -> dict:
+    """
+    Keeps {title: snippet} pairs in rank order until max_tokens is used; the last one that
+    does not fit is truncated and the rest are dropped.
+    """
+    fitted = {}
+    used = 0
+    for i, (title, snippet) in enumerate(articles.items(), start=1):
+        line_tokens = estimate_tokens(f"{i}. {title}: {snippet}") + 1
+        if used + line_tokens <= max_tokens:
+            fitted[title] = snippet
+            used += line_tokens
+            continue
+        remaining = max_tokens - used - estimate_tokens(f"{i}. {title}: ") - 1
+        if remaining > 16:
+            fitted[title] = truncate_to_tokens(snippet, remaining)
+        dropped = len(articles) - len(fitted)
+        if dropped:
+            log_event(logger, logging.INFO, "token budget dropped snippets", dropped=dropped)
+        break
+    return fitted
+
+
+def options_for(stage: str) -> dict:
+    budget = STAGE_BUDGETS[stage]
+    return {"num_ctx": budget["num_ctx"], "num_predict": budget["num_predict"]}
+
+
+class TokenStats:
+    """
+    Per-stage accounting of estimated and reported token counts and throughput.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def record(self, stage: str, prompt: str, result_json: dict):
+        """
+        Records one call; result_json is Ollama's final response object (with eval counts and durations).
+        """
+        prompt_tokens = result_json.get("prompt_eval_count")
+        with self._lock:
+            entry = self._stages.setdefault(stage, {
+                "calls": 0, "estimated_prompt_tokens": 0, "prompt_tokens": 0, "output_tokens": 0,
+                "prompt_seconds": 0.0, "output_seconds": 0.0, "max_prompt_tokens": 0
+            })
+            entry["calls"] += 1
+            entry["estimated_prompt_tokens"] += estimate_tokens(prompt)
+            entry["prompt_tokens"] += prompt_tokens or 0
+            entry["output_tokens"] += result_json.get("eval_count") or 0
+            entry["prompt_seconds"] += (result_json.get("prompt_eval_duration") or 0) / 1e9
+            entry["output_seconds"] += (result_json.get("eval_duration") or 0) / 1e9
+            entry["max_prompt_tokens"] = max(entry["max_prompt_tokens"], prompt_tokens or 0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            report = {}
+            for stage, entry in self._stages.items():
+                calls = entry["calls"]
+                prompt_rate = entry["prompt_tokens"] / entry["prompt_seconds"] if entry["prompt_seconds"] else None
+                output_rate = entry["output_tokens"] / entry["output_seconds"] if entry["output_seconds"] else None
+                budget = STAGE_BUDGETS.get(stage)
+                predicted = None
+                if budget and prompt_rate and output_rate:
+                    # Worst case: a full input budget and num_predict output tokens
+                    predicted = budget["max_input_tokens"] / prompt_rate + budget["num_predict"] / output_rate
+                report[stage] = {
+                    "calls": calls,
+                    "avg_estimated_prompt_tokens": entry["estimated_prompt_tokens"] / calls,
+                    "avg_prompt_tokens": entry["prompt_tokens"] / calls,
+                    "avg_output_tokens": entry["output_tokens"] / calls,
+                    "max_prompt_tokens": entry["max_prompt_tokens"],
+                    "prompt_tokens_per_second": prompt_rate,
+                    "output_tokens_per_second": output_rate,
+                    "predicted_max_seconds": predicted,
+                    "budget": budget
+                }
+            return report
+
+
+token_stats = TokenStats()
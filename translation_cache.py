@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Two-tier cache for Llama translations.
+
+Tier one is an in-process LRU with size and TTL eviction. Tier two is an
+optional SQLite file that every worker process can share, so a translation
+produced by one gunicorn worker is a hit for all the others.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from observability import get_logger, log_event
+
+load_dotenv()
+
+logger = get_logger("translation_cache")
+
+TRANSLATION_CACHE_SIZE = int(os.getenv("TRANSLATION_CACHE_SIZE", "1024"))
+TRANSLATION_CACHE_TTL = float(os.getenv("TRANSLATION_CACHE_TTL", "86400"))  # seconds
+TRANSLATION_CACHE_DB = os.getenv("TRANSLATION_CACHE_DB", "")  # empty disables the SQLite tier
+TRANSLATION_CACHE_PURGE_INTERVAL = float(os.getenv("TRANSLATION_CACHE_PURGE_INTERVAL", "300"))  # seconds between purges
+
+
+class TranslationCache:
+    """
+    Caches translations keyed on (text, target_lang, model, prompt template).
+    """
+
+    def __init__(self, max_entries=TRANSLATION_CACHE_SIZE, ttl=TRANSLATION_CACHE_TTL, db_path=TRANSLATION_CACHE_DB,
+                 purge_interval=TRANSLATION_CACHE_PURGE_INTERVAL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self.purge_interval = purge_interval
+        self._purged_at = time.monotonic()
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if self.db_path:
+            self._db().execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db().execute("CREATE INDEX IF NOT EXISTS translations_expires_at ON translations (expires_at)")
+            self._db().execute("DELETE FROM translations WHERE expires_at <= ?", (time.time(),))
+            self._db().commit()
+
+    @staticmethod
+    def make_key(text: str, target_lang: str, model: str, template: str) -> str:
+        """
+        Builds a stable cache key; the template is included so prompt changes invalidate old entries.
+        """
+        raw = "\x1f".join([text, target_lang, model, template])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _db(self):
+        # sqlite3 connections cannot be shared between threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _remember(self, key: str, value: str, expires_at: float):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _purge_due(self) -> bool:
+        # Expired rows are unreachable anyway (get checks expires_at), so deleting them can wait;
+        # one writer per process purges every purge_interval instead of every write
+        now = time.monotonic()
+        with self._lock:
+            if now - self._purged_at < self.purge_interval:
+                return False
+            self._purged_at = now
+            return True
+
+    def get(self, key: str):
+        """
+        Returns the cached translation, or None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._entries[key]
+
+        if self.db_path:
+            try:
+                row = self._db().execute(
+                    "SELECT value, expires_at FROM translations WHERE key = ?", (key,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                log_event(logger, logging.WARNING, "translation cache read failed", error=str(e))
+                row = None
+            if row is not None and row[1] > now:
+                self._remember(key, row[0], row[1])
+                with self._lock:
+                    self.disk_hits += 1
+                return row[0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: str):
+        expires_at = time.time() + self.ttl
+        self._remember(key, value, expires_at)
+        if self.db_path:
+            try:
+                conn = self._db()
+                conn.execute(
+                    "INSERT OR REPLACE INTO translations (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at)
+                )
+                if self._purge_due():
+                    conn.execute("DELETE FROM translations WHERE expires_at <= ?", (time.time(),))
+                conn.commit()
+            except sqlite3.Error as e:
+                log_event(logger, logging.WARNING, "translation cache write failed", error=str(e))
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+            }
+
+
+translation_cache = TranslationCache()
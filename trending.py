@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Query popularity tracking and background pre-computation of trending searches.
+
+Every search answered by index or /api/search is counted per (query, country,
+summary_lang) with exponential decay, so the counts follow what is popular now
+rather than since start-up. When TRENDING_REFRESH is on, a background thread
+re-runs the full pipeline for the TRENDING_TOP_N hottest combinations shortly
+before their precomputed answer expires, and requests for them are served from
+that answer without touching Ollama or Google.
+
+Refreshes are paid for from hourly LLM and Custom Search call budgets, charged at
+the worst-case cost of one search, and are postponed while user requests are
+waiting for an LLM slot. Counts and precomputed answers are per process; the
+budgets live in SQLite (TRENDING_BUDGET_DB), so every worker process on the host
+draws on the same hourly quota.
+"""
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from dotenv import load_dotenv
+
+import deadline
+import search_pages
+from observability import get_logger, log_event
+
+load_dotenv()
+
+logger = get_logger("trending")
+
+TRENDING_REFRESH = os.getenv("TRENDING_REFRESH", "False").lower() in ("true", "1", "t")
+TRENDING_TOP_N = int(os.getenv("TRENDING_TOP_N", "20"))
+TRENDING_MIN_HITS = float(os.getenv("TRENDING_MIN_HITS", "3"))  # decayed request count before precomputing
+TRENDING_HALF_LIFE = float(os.getenv("TRENDING_HALF_LIFE", "3600"))  # seconds for a count to halve
+TRENDING_MAX_TRACKED = int(os.getenv("TRENDING_MAX_TRACKED", "10000"))
+TRENDING_REFRESH_INTERVAL = float(os.getenv("TRENDING_REFRESH_INTERVAL", "60"))  # seconds between rounds
+TRENDING_RESULT_TTL = float(os.getenv("TRENDING_RESULT_TTL", "900"))  # seconds a precomputed answer is served
+TRENDING_LLM_CALLS_PER_HOUR = float(os.getenv("TRENDING_LLM_CALLS_PER_HOUR", "600"))
+TRENDING_GOOGLE_CALLS_PER_HOUR = float(os.getenv("TRENDING_GOOGLE_CALLS_PER_HOUR", "100"))
+TRENDING_BUDGET_DB = os.getenv("TRENDING_BUDGET_DB", "") or os.path.join(
+    tempfile.gettempdir(), "local-llama-trending.db"
+)
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "False").lower() in ("true", "1", "t")
+
+# Query translation, snippet translation and summary; structured mode adds its JSON call, since a
+# response that fails validation still falls back to the other two
+LLM_CALLS_PER_SEARCH = 4 if STRUCTURED_OUTPUT else 3
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class QuotaBudget:
+    """
+    Token bucket holding at most one hour of calls, refilled continuously. It is stored in
+    SQLite under name, so processes sharing db_path share the bucket. Nothing touches the
+    database until open(), which the refresher calls when it starts.
+    """
+
+    def __init__(self, name: str, per_hour: float, db_path=TRENDING_BUDGET_DB):
+        self.name = name
+        self.per_hour = per_hour
+        self.db_path = db_path
+        self._local = threading.local()
+        self.opened = False
+
+    def open(self):
+        """
+        Creates the bucket, full, unless another process already has.
+        """
+        conn = self._db()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS budgets ("
+            "name TEXT PRIMARY KEY, available REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute("INSERT OR IGNORE INTO budgets VALUES (?, ?, ?)", (self.name, self.per_hour, time.time()))
+        self.opened = True
+
+    def _db(self):
+        # sqlite3 connections cannot be shared between threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _refilled(self, available: float, updated_at: float, now: float) -> float:
+        return min(self.per_hour, available + max(0.0, now - updated_at) * self.per_hour / 3600)
+
+    def _update(self, calls: float, force: bool) -> bool:
+        # Refills, then spends calls if force or enough are available; returns whether they were spent
+        conn = self._db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            available, updated_at = conn.execute(
+                "SELECT available, updated_at FROM budgets WHERE name = ?", (self.name,)
+            ).fetchone()
+            now = time.time()
+            available = self._refilled(available, updated_at, now)
+            spent = force or available >= calls
+            if spent:
+                available -= calls
+            conn.execute("UPDATE budgets SET available = ?, updated_at = ? WHERE name = ?", (available, now, self.name))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return spent
+
+    def available(self) -> float:
+        """
+        Calls available now, computed from the stored bucket without writing to it.
+        """
+        available, updated_at = self._db().execute(
+            "SELECT available, updated_at FROM budgets WHERE name = ?", (self.name,)
+        ).fetchone()
+        return self._refilled(available, updated_at, time.time())
+
+    def spend(self, calls: float):
+        self._update(calls, True)
+
+    def take(self, calls: float) -> bool:
+        """
+        Spends calls only if that many are available, in one step across processes.
+        """
+        return self._update(calls, False)
+
+
+class TrendingQueries:
+    """
+    Decayed per-key request counts plus the precomputed answers of the hottest keys.
+    """
+
+    def __init__(self, top_n=TRENDING_TOP_N, min_hits=TRENDING_MIN_HITS, half_life=TRENDING_HALF_LIFE,
+                 max_tracked=TRENDING_MAX_TRACKED, interval=TRENDING_REFRESH_INTERVAL, ttl=TRENDING_RESULT_TTL,
+                 llm_calls_per_hour=TRENDING_LLM_CALLS_PER_HOUR,
+                 google_calls_per_hour=TRENDING_GOOGLE_CALLS_PER_HOUR, enabled=TRENDING_REFRESH):
+        self.top_n = top_n
+        self.min_hits = min_hits
+        self.half_life = half_life
+        self.max_tracked = max_tracked
+        self.interval = interval
+        self.ttl = ttl
+        self.enabled = enabled
+        self.llm_budget = QuotaBudget("trending.llm", llm_calls_per_hour)
+        self.google_budget = QuotaBudget("trending.google", google_calls_per_hour)
+        self.llm_calls_per_refresh = LLM_CALLS_PER_SEARCH
+        self.google_calls_per_refresh = len(search_pages.page_starts())
+        self._lock = threading.Lock()
+        self._counts = {}  # (normalized query, country, summary_lang) -> [count, updated_at, latest query text]
+        self._precomputed = {}  # key -> (results, summary, expires_at)
+        self._thread = None
+        self._run = None
+        self._busy = None
+        self.hits = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.skipped_busy = 0
+        self.skipped_budget = 0
+
+    def _decayed(self, count: float, updated_at: float, now: float) -> float:
+        return count * 0.5 ** ((now - updated_at) / self.half_life)
+
+    def record(self, query: str, country: str, summary_lang: str):
+        key = (normalize_query(query), country, summary_lang)
+        now = time.time()
+        with self._lock:
+            entry = self._counts.get(key)
+            count = self._decayed(entry[0], entry[1], now) if entry else 0.0
+            self._counts[key] = [count + 1, now, query]
+            if len(self._counts) > self.max_tracked * 1.1:
+                self._prune(now)
+
+    def _prune(self, now: float):
+        # Called with the lock held; keeps the max_tracked currently hottest keys
+        ranked = sorted(
+            self._counts.items(), key=lambda item: self._decayed(item[1][0], item[1][1], now), reverse=True
+        )
+        self._counts = dict(ranked[:self.max_tracked])
+
+    def top(self, n=None):
+        """
+        Returns up to n (key, query, decayed count) of keys with at least min_hits, hottest first.
+        """
+        now = time.time()
+        with self._lock:
+            scored = [
+                (key, query, self._decayed(count, updated_at, now))
+                for key, (count, updated_at, query) in self._counts.items()
+            ]
+        scored = [entry for entry in scored if entry[2] >= self.min_hits]
+        scored.sort(key=lambda entry: entry[2], reverse=True)
+        return scored[:n or self.top_n]
+
+    def lookup(self, query: str, country: str, summary_lang: str):
+        """
+        Returns the precomputed (results, summary) for this search, or None.
+        """
+        key = (normalize_query(query), country, summary_lang)
+        with self._lock:
+            entry = self._precomputed.get(key)
+            if entry is None or entry[2] <= time.time():
+                return None
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def search(self, query: str, country: str, summary_lang: str, run):
+        """
+        Counts the request and returns the precomputed (results, summary, timings) when there is one,
+        otherwise run()'s.
+        """
+        start = time.perf_counter()
+        self.record(query, country, summary_lang)
+        value = self.lookup(query, country, summary_lang)
+        if value is not None:
+            log_event(logger, logging.INFO, "precomputed answer served", query=query, country=country)
+            return value[0], value[1], {"precomputed": time.perf_counter() - start}
+        return run()
+
+    async def search_async(self, query: str, country: str, summary_lang: str, run):
+        """
+        search() for a coroutine run().
+        """
+        start = time.perf_counter()
+        self.record(query, country, summary_lang)
+        value = self.lookup(query, country, summary_lang)
+        if value is not None:
+            log_event(logger, logging.INFO, "precomputed answer served", query=query, country=country)
+            return value[0], value[1], {"precomputed": time.perf_counter() - start}
+        return await run()
+
+    def _due(self, key, now: float) -> bool:
+        # Refresh anything that would expire before the round after next
+        entry = self._precomputed.get(key)
+        return entry is None or entry[2] - now <= 2 * self.interval
+
+    def _take_budget(self) -> bool:
+        if not self.llm_budget.take(self.llm_calls_per_refresh):
+            return False
+        if not self.google_budget.take(self.google_calls_per_refresh):
+            # Give the LLM calls back; this search is not going to run
+            self.llm_budget.spend(-self.llm_calls_per_refresh)
+            return False
+        return True
+
+    def refresh_once(self) -> int:
+        """
+        Runs one refresh round and returns the number of searches recomputed.
+        """
+        now = time.time()
+        trending = self.top()
+        with self._lock:
+            keep = {key for key, _, _ in trending}
+            # Answers for keys that dropped out of the top are served until they expire, then dropped
+            self._precomputed = {
+                key: entry for key, entry in self._precomputed.items() if key in keep or entry[2] > now
+            }
+            due = [(key, query) for key, query, _ in trending if self._due(key, now)]
+
+        refreshed = 0
+        for key, query in due:
+            if self._busy is not None and self._busy():
+                self.skipped_busy += 1
+                log_event(logger, logging.DEBUG, "trending refresh postponed, LLM busy", pending=len(due) - refreshed)
+                break
+            if not self._take_budget():
+                self.skipped_budget += 1
+                log_event(logger, logging.INFO, "trending refresh budget exhausted", pending=len(due) - refreshed)
+                break
+            _, country, summary_lang = key
+            try:
+                with deadline.scope():
+                    results, summary, timings = self._run(query, country, summary_lang)
+            except Exception as e:
+                # One failing search must not stop the refresher thread
+                self.refresh_errors += 1
+                log_event(logger, logging.WARNING, "trending refresh failed", query=query, error=str(e))
+                continue
+            # Failed searches come back as no results or an in-band error summary; keep the old answer
+            if not results or summary.startswith("Error"):
+                self.refresh_errors += 1
+                continue
+            with self._lock:
+                self._precomputed[key] = (results, summary, time.time() + self.ttl)
+            self.refreshes += 1
+            refreshed += 1
+            log_event(
+                logger, logging.INFO, "trending search precomputed",
+                query=query, country=country, summary_lang=summary_lang,
+                seconds=round(sum(timings.values()), 3)
+            )
+        return refreshed
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            self.refresh_once()
+
+    def start(self, run, busy=None):
+        """
+        Starts the background refresher with run(query, country, summary_lang) -> (results, summary, timings),
+        which should bypass the search result cache so a precomputed answer is as fresh as its TTL says.
+        busy() returning True postpones the rest of a round. A no-op when disabled; once started, another
+        call only swaps run and busy.
+        """
+        with self._lock:
+            if not self.enabled:
+                return
+            self._run = run
+            self._busy = busy
+            if self._thread is not None:
+                return
+            self.llm_budget.open()
+            self.google_budget.open()
+            self._thread = threading.Thread(target=self._loop, name="trending-refresh", daemon=True)
+            self._thread.start()
+        log_event(logger, logging.INFO, "trending refresher started", top_n=self.top_n, interval=self.interval)
+
+    def stats(self) -> dict:
+        now = time.time()
+        trending = self.top()
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "tracked": len(self._counts),
+                "precomputed": sum(1 for entry in self._precomputed.values() if entry[2] > now),
+                "hits": self.hits,
+                "refreshes": self.refreshes,
+                "refresh_errors": self.refresh_errors,
+                "skipped_busy": self.skipped_busy,
+                "skipped_budget": self.skipped_budget,
+                "llm_budget_available": round(self.llm_budget.available(), 1) if self.llm_budget.opened else None,
+                "google_budget_available": (
+                    round(self.google_budget.available(), 1) if self.google_budget.opened else None
+                ),
+                "top": [
+                    {"query": query, "country": key[1], "summary_lang": key[2], "score": round(score, 2)}
+                    for key, query, score in trending
+                ]
+            }
+
+
+trending_queries = TrendingQueries()
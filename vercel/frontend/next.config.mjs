@@ -1,4 +1,9 @@
 /** @type {import('next').NextConfig} */
-const nextConfig = {};
+const nextConfig = {
+  // Search results link their images to /api/image on this origin (the backend's IMAGE_PROXY_ROUTE)
+  async rewrites() {
+    return [{ source: "/api/image", destination: "http://localhost:5000/api/image" }];
+  },
+};
 
 export default nextConfig;
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Start-up model warm-up and readiness tracking.
+
+A background thread asks every Ollama backend a configured model is routed to
+(its LLAMA_MODEL_AFFINITY backends, or the whole pool) to load it (an empty-prompt
+/api/generate request with keep_alive), retrying until it succeeds. The instance reports ready once every model is resident on at least one
+backend, so load balancers only route traffic to warm instances.
+"""
+import logging
+import os
+import threading
+import time
+
+import requests
+from dotenv import load_dotenv
+
+import http_client
+from observability import get_logger, log_event
+from ollama_pool import ollama_pool
+
+load_dotenv()
+
+logger = get_logger("warmup")
+
+LLAMA_KEEP_ALIVE = os.getenv("LLAMA_KEEP_ALIVE", "30m")  # how long Ollama keeps a model loaded after a call
+LLAMA_WARMUP_MODELS = [
+    model.strip()
+    for model in os.getenv("LLAMA_WARMUP_MODELS", os.getenv("LLAMA_MODEL", "llama3.3:70b")).split(",")
+    if model.strip()
+]
+LLAMA_WARMUP_RETRY = float(os.getenv("LLAMA_WARMUP_RETRY", "10"))  # seconds between warm-up rounds
+
+
+class ModelWarmup:
+    """
+    Preloads models on the backends they are routed to and exposes readiness.
+    """
+
+    def __init__(self, models=None, pool=ollama_pool, keep_alive=LLAMA_KEEP_ALIVE):
+        self.models = list(models or LLAMA_WARMUP_MODELS)
+        self.pool = pool
+        self.keep_alive = keep_alive
+        self._lock = threading.Lock()
+        self._thread = None
+        self._warm = {}  # (model, url) -> seconds the load took
+        self._errors = {}  # (model, url) -> last error
+        self.started_at = None
+
+    def _load(self, model: str, url: str) -> bool:
+        start = time.perf_counter()
+        try:
+            # An empty prompt makes Ollama load the model without generating anything
+            response = http_client.post("llama", url, json={"model": model, "prompt": "", "keep_alive": self.keep_alive})
+            response.raise_for_status()
+        except requests.RequestException as e:
+            with self._lock:
+                self._errors[(model, url)] = str(e)
+            log_event(logger, logging.WARNING, "model warm-up failed", model=model, backend=url, error=str(e))
+            return False
+        with self._lock:
+            self._warm[(model, url)] = time.perf_counter() - start
+            self._errors.pop((model, url), None)
+        log_event(
+            logger, logging.INFO, "model warmed",
+            model=model, backend=url, load_seconds=round(self._warm[(model, url)], 3)
+        )
+        return True
+
+    def _run(self):
+        pending = {(model, url) for model in self.models for url in self.pool.urls_for(model)}
+        while pending:
+            for model, url in sorted(pending):
+                if self._load(model, url):
+                    pending.discard((model, url))
+            if pending:
+                time.sleep(LLAMA_WARMUP_RETRY)
+
+    def start(self):
+        """
+        Starts warm-up in the background; calling it again is a no-op.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.started_at = time.time()
+            self._thread = threading.Thread(target=self._run, name="model-warmup", daemon=True)
+            self._thread.start()
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            warm_models = {model for model, _ in self._warm}
+        return all(model in warm_models for model in self.models)
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "ready": all(model in {m for m, _ in self._warm} for model in self.models),
+                "models": {
+                    model: {
+                        url: {
+                            "warm": (model, url) in self._warm,
+                            "load_seconds": self._warm.get((model, url)),
+                            "error": self._errors.get((model, url))
+                        }
+                        for url in self.pool.urls_for(model)
+                    }
+                    for model in self.models
+                }
+            }
+
+
+model_warmup = ModelWarmup()